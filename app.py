@@ -0,0 +1,59 @@
+"""
+The gamepad main loop, split out of code.py so that it can also be run
+iteration by iteration off-device by the host-side simulator (see sim/).
+"""
+
+import supervisor
+
+# Client configuration/APIs are in the config.py module
+import gestures
+import inputs
+import latency
+import looprate
+import recorder
+import scheduler
+import serial
+import stream
+from report import report
+from config import LOOP_RATE_HZ
+
+def setup():
+    """
+    Do initial setup. Call once before loop()
+    """
+    inputs.init()
+    serial.init()
+    gestures.init()
+    # Disable auto reload
+    supervisor.runtime.autoreload = False
+    looprate.set_rate(LOOP_RATE_HZ)
+
+def loop():
+    """
+    Run a single main loop iteration
+    """
+    looprate.begin()
+    # Apply any new set of input mappings (e.g. a profile switch) before reading & reporting the inputs
+    inputs.apply_pending_mappings()
+    # Read any simulated input commands from serial. These are scheduled, not applied immediately
+    serial.read_cmd_from_serial()
+    # Apply any scheduled simulated input changes which are now due
+    scheduler.service()
+    # Apply this iteration's stream frames, or centre the streamed inputs if the stream has stopped
+    stream.service()
+    if recorder.playing:
+        # Replay recorded inputs in place of our physical inputs
+        recorder.play()
+    else:
+        # Read our physical inputs
+        inputs.update_all()
+        # Detect button gestures (e.g. hold START for shutdown) on the physical inputs
+        gestures.update()
+        recorder.record()
+    # Report our inputs combined with any simulated inputs
+    report()
+    # Answer any latency probes, now their reports have been sent
+    if latency.pending:
+        latency.reply()
+    # Wait until it's time for the next iteration
+    looprate.end()
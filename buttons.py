@@ -0,0 +1,66 @@
+from config import BUTTON_VOL_UP, BUTTON_VOL_DOWN, BUTTON_VOL_MUTE, BUTTON_POWER, PLAYER_COUNT, PLAYER_BUTTON_BASE
+
+# Consumer control codes which can be used as button IDs.
+# The position in this tuple is the bit used for the code in ButtonState.cc
+CC_BUTTONS = (BUTTON_VOL_UP, BUTTON_VOL_DOWN, BUTTON_VOL_MUTE, BUTTON_POWER)
+CC_BUTTON_BITS = { code: 1 << i for i, code in enumerate(CC_BUTTONS) }
+
+# Every button ID has a slot number, for use as an index into per-button arrays:
+# gamepad buttons 0-15 use slots 0-15, consumer control buttons follow in CC_BUTTONS order.
+# The slots of players 2, 3 ... (see players.py) follow those of player 1
+NUM_BUTTON_SLOTS = 16 + len(CC_BUTTONS)
+NUM_PLAYER_BUTTON_SLOTS = NUM_BUTTON_SLOTS * PLAYER_COUNT
+CC_BUTTON_SLOTS = { code: 16 + i for i, code in enumerate(CC_BUTTONS) }
+
+def button_slot(btn: int) -> int:
+    """
+    Return the slot number for a button ID, or -1 for unknown button IDs
+    """
+    if 0 <= btn <= 15:
+        return btn
+    if PLAYER_BUTTON_BASE <= btn < PLAYER_BUTTON_BASE * PLAYER_COUNT:
+        slot = button_slot(btn % PLAYER_BUTTON_BASE)
+        return -1 if slot < 0 else btn // PLAYER_BUTTON_BASE * NUM_BUTTON_SLOTS + slot
+    return CC_BUTTON_SLOTS.get(btn, -1)
+
+class ButtonState:
+    """
+    Pressed state of buttons held as integer bitmasks.
+    Gamepad buttons 0-15 are bits 0-15 of ``gamepad``.
+    Consumer control buttons (e.g. BUTTON_VOL_UP) are bits of ``cc``, ordered as in CC_BUTTONS.
+    Unknown button IDs are ignored.
+    """
+
+    def __init__(self):
+        self.gamepad = 0
+        self.cc = 0
+
+    def press(self, btn: int):
+        if 0 <= btn <= 15:
+            self.gamepad |= 1 << btn
+        else:
+            self.cc |= CC_BUTTON_BITS.get(btn, 0)
+
+    def release(self, btn: int):
+        if 0 <= btn <= 15:
+            self.gamepad &= ~(1 << btn)
+        else:
+            self.cc &= ~CC_BUTTON_BITS.get(btn, 0)
+
+    def set(self, btn: int, pressed: bool):
+        if pressed:
+            self.press(btn)
+        else:
+            self.release(btn)
+
+    def is_pressed(self, btn: int) -> bool:
+        if 0 <= btn <= 15:
+            return self.gamepad & (1 << btn) != 0
+        return self.cc & CC_BUTTON_BITS.get(btn, 0) != 0
+
+    def clear(self):
+        self.gamepad = 0
+        self.cc = 0
+
+    def __repr__(self):
+        return f'ButtonState(gamepad=0x{self.gamepad:04x}, cc=0x{self.cc:02x})'
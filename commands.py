@@ -1,38 +1,41 @@
-from time import sleep
-
 from globals import *
 from config import *
 import inputs
-from report import report
+import latency
+import looprate
+import macros
+import profiles
+import recorder
+import scheduler
+from buttons import ButtonState
+from utils import clamp
 
-def handle_button_input_command(btn:str, value:str):
-    global pressed_buttons
+def handle_button_input_command(btn:str, value:str, buttons:ButtonState):
     try:
         butIdx = int(btn)
         value = int(value)
         if value >= 0:
-            pressed_buttons.add(butIdx)
+            buttons.press(butIdx)
     except Exception as e:
         print(f'Error reading button command ({btn}={value}): {e}')
 
-def handle_joystick_axis_input_command(axis:str, value:str):
-    global gamepad_axes_values
+def handle_joystick_axis_input_command(axis:str, value:str, axes:dict[str, int]):
     try:
         value = int(value)
-        gamepad_axes_values[axis] = value
+        axes[axis] = clamp(value, -32767, 32767)
     except Exception as e:
         print(f'Error reading joystick axes command ({axis}={value}): {e}')
 
-def handle_volume_input_command(value: str):
+def handle_volume_input_command(value: str, buttons:ButtonState):
     if 'mute' == value:
-        pressed_buttons.add(BUTTON_VOL_MUTE)
+        buttons.press(BUTTON_VOL_MUTE)
     else:
         try:
             vol = int(value)
             if vol < 0:
-                pressed_buttons.add(BUTTON_VOL_DOWN)
+                buttons.press(BUTTON_VOL_DOWN)
             elif vol > 0:
-                pressed_buttons.add(BUTTON_VOL_UP)
+                buttons.press(BUTTON_VOL_UP)
         except ValueError as e:
             print(f'Error reading volume command (vol={value}): {e}')
         
@@ -43,7 +46,110 @@ def handle_button_mapping_command(digital_in:str, btn_str:str) -> None:
         print(f'Error mapping button command ({digital_in}={btn_str}): {ve}')
     
 def handle_joystick_mapping_command(analog_in:str, axis:str) -> None:
-    inputs.set_joystick_mappings({axis: analog_in})
+    try:
+        inputs.set_joystick_mappings({axis: analog_in})
+    except ValueError as ve:
+        print(f'Error mapping joystick command ({analog_in}={axis}): {ve}')
+
+def handle_rotary_encoder_mapping_command(rot_enc_id:str, value:str) -> None:
+    try:
+        if value in ('', 'none'):
+            inputs.release_rotary_encoder_mapping(rot_enc_id)
+            return
+        dio_clk, dio_dt, btn_dec, btn_inc = value.split(',')
+        inputs.set_rotary_encoder_mappings({rot_enc_id: (dio_clk, dio_dt, int(btn_dec), int(btn_inc))})
+    except ValueError as ve:
+        print(f'Error mapping rotary encoder command ({rot_enc_id}={value}): {ve}')
+
+def handle_axis_filter_command(axis:str, value:str) -> None:
+    try:
+        oversample, ema_shift, deadzone, hysteresis = (int(v) for v in value.split(','))
+        inputs.set_axis_filters({axis: (oversample, ema_shift, deadzone, hysteresis)})
+    except ValueError as ve:
+        print(f'Error reading axis filter command (filter_{axis}={value}): {ve}')
+
+def handle_axis_calibration_command(axis:str, value:str) -> None:
+    try:
+        cal_min, cal_centre, cal_max, invert = (int(v) for v in value.split(','))
+        inputs.set_axis_calibrations({axis: (cal_min, cal_centre, cal_max, invert != 0)})
+    except ValueError as ve:
+        print(f'Error reading axis calibration command (cal_{axis}={value}): {ve}')
+
+def handle_axis_calibration_capture_command(value:str) -> None:
+    if value == 'end':
+        inputs.finish_axis_calibration()
+    else:
+        inputs.start_axis_calibration(value)
+
+def handle_axis_curve_command(axis:str, value:str) -> None:
+    try:
+        curve = value.split(',')
+        if len(curve) == 1:
+            inputs.set_axis_curves({axis: curve[0]})
+        elif curve[0] == 'expo':
+            inputs.set_axis_curves({axis: ('expo', int(curve[1]))})
+        else:
+            raise ValueError(f'Unknown curve {curve[0]}')
+    except ValueError as ve:
+        print(f'Error reading axis curve command (curve_{axis}={value}): {ve}')
+
+def handle_recorder_command(value:str) -> None:
+    if value == 'start':
+        recorder.start_recording()
+    elif value == 'stop':
+        recorder.stop_recording()
+        recorder.stop_playback()
+    elif value == 'play':
+        recorder.start_playback()
+    elif value == 'loop':
+        recorder.start_playback(True)
+    elif value == 'dump':
+        recorder.dump()
+    elif value == 'clear':
+        recorder.clear()
+    elif value == 'save':
+        recorder.save()
+    elif value == 'load':
+        recorder.load()
+    else:
+        print(f'Unknown recorder command: rec={value}')
+
+def handle_profile_command(cmd:str, value:str) -> None:
+    try:
+        if cmd == 'profile' and value == 'default':
+            # Switch to the defaults in config.py
+            inputs.apply_mappings(inputs.default_profile())
+            profiles.set_boot_slot(profiles.NO_SLOT)
+            return
+        slot = int(value)
+        if cmd == 'profile_save':
+            profiles.save(slot, inputs.current_profile())
+        elif cmd == 'profile_erase':
+            profiles.erase(slot)
+        else:
+            # 'profile_load' applies a profile, 'profile' also makes it the boot profile
+            profile = profiles.load(slot)
+            if None == profile:
+                return
+            inputs.apply_mappings(profile)
+            if cmd == 'profile':
+                profiles.set_boot_slot(slot)
+    except ValueError as ve:
+        print(f'Error in profile command ({cmd}={value}): {ve}')
+
+def handle_rate_command(value:str) -> bool:
+    """
+    Set the main loop rate. Returns False, keeping the current rate, if the value is not a valid rate.
+    """
+    try:
+        hz = int(value)
+        if hz < 0:
+            raise ValueError('rate must not be negative')
+    except ValueError as ve:
+        print(f'Error reading rate command (rate={value}): {ve}')
+        return False
+    looprate.set_rate(hz)
+    return True
 
 def parse_int_value(value:str) -> int:
     try:
@@ -61,124 +167,128 @@ def parse_float_value(value:str) -> float:
         return 0.0
     return value
 
-def reset_gamepad_axes_values():
-    global gamepad_axes_values
-    gamepad_axes_values.update({ 'x':0, 'y':0, 'z':0, 'r_z':0 })
+def secs_to_ns(secs: float) -> int:
+    return int(secs * 1_000_000_000)
 
 def process_commands(**cmds):
-    global pressed_buttons, gamepad_axes_values
+    """
+    Synthesize inputs from a set of 'name=value' commands.
+    The inputs are scheduled (see scheduler.py) rather than applied immediately,
+    so this returns without waiting for the pre, hold or post periods.
+    Input remaps take effect immediately.
+    Returns False if the inputs (or a macro) could not be scheduled because the scheduler is full,
+    or a rate was invalid.
+    """
     global digital_ins, analog_ins
-    pressed_buttons.clear()
-    reset_gamepad_axes_values()
+    buttons = ButtonState()
+    axes = {}
     pre_wait = 0.0
     post_wait = 0.5
     hold_time = 0.5
+    overlap = False
+    timed = False
+    rejected = False
     for input, value in cmds.items():
         if len(input) > 3 and input[0:3] == 'btn':
             # This is a digital button input value, i.e. btn1/btn2/ ... /btn15/btn16
-            handle_button_input_command(input[3:], value)
+            handle_button_input_command(input[3:], value, buttons)
         elif input in ['x', 'y', 'z', 'r_z']:
             # This is an analog input axis value, i.e. x/y/z/r_x
-            handle_joystick_axis_input_command(input, value)
-        elif input in analog_ins.keys():
+            handle_joystick_axis_input_command(input, value, axes)
+        elif input in analog_ins.keys() or input in mux_analog_ins.keys():
             # This is an analog input->joystick axis remap
             handle_joystick_mapping_command(input, value)
-        elif input in digital_ins.keys():
+        elif input in digital_ins.keys() or input in shift_register_ins.keys():
             # This is a digital input->button remap
             handle_button_mapping_command(input, value)
+        elif len(input) > 3 and input[0:3] == 'rot':
+            # This is a rotary encoder mapping, i.e. rot{id}={clk},{dt},{btn_dec},{btn_inc}
+            handle_rotary_encoder_mapping_command(input, value)
         elif input == 'vol':
             # This is a volume value, +ve, -ve or 'mute'
-            handle_volume_input_command(value)
+            handle_volume_input_command(value, buttons)
         elif input == 'hold':
             # Hold control(s) for a period of time
             hold_time = parse_float_value(value)
+            timed = True
         elif input == 'pre':
             # Wait for a period of time BEFORE changing any values
             pre_wait = parse_float_value(value)
+            timed = True
         elif input == 'post':
             # Wait for a period of time AFTER changing (and resetting) any values
             post_wait = parse_float_value(value)
+            timed = True
+        elif input == 'overlap':
+            # Start straight away instead of after previous commands have finished
+            overlap = parse_int_value(value) != 0
+        elif len(input) > 7 and input[0:7] == 'filter_':
+            # This is a joystick axis filter setting, i.e. filter_x/filter_y/filter_z/filter_r_z
+            handle_axis_filter_command(input[7:], value)
+        elif len(input) > 4 and input[0:4] == 'cal_':
+            # This is a joystick axis calibration setting, i.e. cal_x/cal_y/cal_z/cal_r_z
+            handle_axis_calibration_command(input[4:], value)
+        elif input == 'cal':
+            # Start ({axis}) or finish ('end') capturing a joystick axis calibration
+            handle_axis_calibration_capture_command(value)
+        elif len(input) > 6 and input[0:6] == 'curve_':
+            # This is a joystick axis response curve setting, i.e. curve_x/curve_y/curve_z/curve_r_z
+            handle_axis_curve_command(input[6:], value)
+        elif input == 'macro':
+            # Play a named macro
+            if value not in macros.macros:
+                print(f'Unknown macro: {value}')
+            elif not macros.play_macro(value):
+                rejected = True
+        elif input == 'rec':
+            # Record or replay the physical inputs
+            handle_recorder_command(value)
+        elif input == 'rec_data':
+            # Upload hex encoded recording data
+            recorder.upload(value)
+        elif input in ('profile', 'profile_save', 'profile_load', 'profile_erase'):
+            # Save, load or switch mapping & calibration profiles
+            handle_profile_command(input, value)
+        elif input == 'rate':
+            # Change the main loop rate (Hz)
+            if not handle_rate_command(value):
+                rejected = True
+        elif input == 'ping':
+            # Latency probe, answered once this iteration's reports have been sent
+            latency.ping(parse_int_value(value))
 
-    # pre-wait period
-    sleep(pre_wait)
-    # debug
-    print(f'pressed_buttons={pressed_buttons}')
-    print(f'gamepad_axes_values={gamepad_axes_values}')
-    report()
-    # hold before releasing all buttons and centring axes
-    sleep(hold_time)
-    pressed_buttons.clear()
-    reset_gamepad_axes_values()
-    report()
-    # post-wait period
-    sleep(post_wait)
+    if buttons.gamepad == 0 and buttons.cc == 0 and len(axes) == 0 and not timed:
+        # Nothing to synthesize, e.g. only remaps or settings
+        return not rejected
+    return scheduler.schedule_command(scheduler.TimedCommand(buttons, axes),
+                                      secs_to_ns(pre_wait), secs_to_ns(hold_time), secs_to_ns(post_wait),
+                                      overlap) and not rejected
+
+def process_input_frame(buttons:int, x:int, y:int, z:int, r_z:int, hold_ms:int, pre_ms:int, post_ms:int) -> bool:
+    """
+    Synthesize inputs decoded from a binary OP_INPUT frame.
+    Values are already integers so no parsing is needed before scheduling them.
+    Returns False if the scheduler is full.
+    """
+    pressed = ButtonState()
+    pressed.gamepad = buttons
+    axes = {
+        'x'     : clamp(x, -32767, 32767),
+        'y'     : clamp(y, -32767, 32767),
+        'z'     : clamp(z, -32767, 32767),
+        'r_z'   : clamp(r_z, -32767, 32767),
+    }
+    return scheduler.schedule_command(scheduler.TimedCommand(pressed, axes),
+                                      pre_ms * 1_000_000, hold_ms * 1_000_000, post_ms * 1_000_000)
 
 def configure_emulation_station():
     """
     Send the necessary commands to automate EmulationStation 'Configure Input'
     """
-    cmds = [
-        { f'btn{BUTTON_SELECT}'       : 1, 'hold'  : 3, 'post' : 1 },   # Initial 'hold any button'
-        { f'btn{BUTTON_HAT_UP}'       : 1, 'post' : 1 },
-        { f'btn{BUTTON_HAT_DOWN}'     : 1, 'post' : 1 },
-        { f'btn{BUTTON_HAT_LEFT}'     : 1, 'post' : 1 },
-        { f'btn{BUTTON_HAT_RIGHT}'    : 1, 'post' : 1 },
-        { f'btn{BUTTON_START}'        : 1, 'post' : 1 },
-        { f'btn{BUTTON_SELECT}'       : 1, 'post' : 1 },
-        { f'btn{BUTTON_EAST_A}'       : 1, 'post' : 1 },
-        { f'btn{BUTTON_SOUTH_B}'      : 1, 'post' : 1 },
-        { f'btn{BUTTON_NORTH_X}'      : 1, 'post' : 1 },
-        { f'btn{BUTTON_WEST_Y}'       : 1, 'post' : 1 },
-        { f'btn{BUTTON_SHOULDER_L}'   : 1, 'post' : 1 },
-        { f'btn{BUTTON_SHOULDER_R}'   : 1, 'post' : 1 },
-        { f'btn{BUTTON_TRIGGER_L}'    : 1, 'post' : 1 },
-        { f'btn{BUTTON_TRIGGER_R}'    : 1, 'post' : 1 },
-        { f'btn{BUTTON_THUMB_L}'      : 1, 'post' : 1 },
-        { f'btn{BUTTON_THUMB_R}'      : 1, 'post' : 1 },
-        { 'y'                       : -32767, 'post' : 1 },
-        { 'y'                       :  32767, 'post' : 1 },
-        { 'x'                       : -32767, 'post' : 1 },
-        { 'x'                       :  32767, 'post' : 1 },
-        { 'r_z'                     : -32767, 'post' : 1 },
-        { 'r_z'                     :  32767, 'post' : 1 },
-        { 'z'                       : -32767, 'post' : 1 },
-        { 'z'                       :  32767, 'post' : 1 },
-        { f'btn{BUTTON_SELECT}'       : 1, 'post' : 1 },              # Hotkey
-        { f'btn{BUTTON_EAST_A}'       : 1 },  # 'OK' / Finish
-      ]
-    for cmd in cmds:
-        process_commands(**cmd)
+    macros.play_macro('conf_es')
 
 def configure_retroarch():
     """
     Send the necessary commands to automate RetroArch 'Set All Controls' configuration
     """
-    cmds = [
-        { f'btn{BUTTON_SOUTH_B}'      : 1 },
-        { f'btn{BUTTON_WEST_Y}'       : 1 },
-        { f'btn{BUTTON_SELECT}'       : 1 },
-        { f'btn{BUTTON_START}'        : 1 },
-        { f'btn{BUTTON_HAT_UP}'       : 1 },
-        { f'btn{BUTTON_HAT_DOWN}'     : 1 },
-        { f'btn{BUTTON_HAT_LEFT}'     : 1 },
-        { f'btn{BUTTON_HAT_RIGHT}'    : 1 },
-        { f'btn{BUTTON_EAST_A}'       : 1 },
-        { f'btn{BUTTON_NORTH_X}'      : 1 },
-        { f'btn{BUTTON_SHOULDER_L}'   : 1 },
-        { f'btn{BUTTON_SHOULDER_R}'   : 1 },
-        { f'btn{BUTTON_TRIGGER_L}'    : 1 },
-        { f'btn{BUTTON_TRIGGER_R}'    : 1 },
-        { f'btn{BUTTON_THUMB_L}'      : 1 },
-        { f'btn{BUTTON_THUMB_R}'      : 1 },
-        { 'x'                       :  32767 },
-        { 'x'                       : -32767 },
-        { 'y'                       :  32767 },
-        { 'y'                       : -32767 },
-        { 'z'                       :  32767 },
-        { 'z'                       : -32767 },
-        { 'r_z'                     :  32767 },
-        { 'r_z'                     : -32767 },
-      ]
-    for cmd in cmds:
-        process_commands(**cmd)
-
+    macros.play_macro('conf_ra')
@@ -6,10 +6,76 @@ from adafruit_hid.consumer_control_code import ConsumerControlCode
 CC_POWER_CODE = 0x30
 
 """
-Holding 'Start' button for this period will send a Power Off command
+Holding 'Start' button for this period will send a Power Off command.
+See button_gestures below.
 """
 START_BUTTON_HOLD_FOR_SHUTDOWN_SECS = 3
 
+"""
+Size in bytes of the preallocated buffer for data received on the serial interface.
+This bounds the longest command line accepted. Longer lines are discarded.
+"""
+SERIAL_BUFFER_SIZE = 512
+
+"""
+Maximum number of press & release events (two per command) waiting in the scheduler (see scheduler.py).
+This bounds the memory & time used by commands queued ahead of time. Commands which would exceed it are rejected.
+"""
+MAX_PENDING_EVENTS = 256
+
+"""
+Main loop rate in Hz, i.e. how often the inputs are polled & reported. e.g. 1000, 500 or 250
+Set to 0 to run the main loop as fast as possible.
+Can be changed at runtime via the 'rate' serial command.
+"""
+LOOP_RATE_HZ = 1000
+
+"""
+Input streaming (see stream.py): if no stream frame arrives for this many milliseconds
+the streamed buttons are released & the streamed joystick axes centred.
+"""
+STREAM_TIMEOUT_MS = 250
+
+
+"""
+Mapping & calibration profiles stored in non-volatile memory (see profiles.py)
+PROFILE_SLOTS profiles of up to PROFILE_SLOT_SIZE bytes each are stored from PROFILE_NVM_OFFSET
+in microcontroller.nvm. The boot profile is applied at startup instead of the defaults below.
+"""
+PROFILE_NVM_OFFSET = 0
+PROFILE_SLOTS = 2
+PROFILE_SLOT_SIZE = 1024
+
+"""
+Input recording (see recorder.py)
+RECORDING_BUFFER_SIZE is the size in bytes of the preallocated recording buffer. Each input change uses 15 bytes.
+Recordings can be saved to & loaded from RECORDING_FILE, and are saved automatically
+when recording stops if RECORDING_AUTOSAVE is True.
+Note that CIRCUITPY is only writable by code if boot.py remounts it, in which case it is read-only over USB.
+"""
+RECORDING_BUFFER_SIZE = 16384
+RECORDING_FILE = '/recording.bin'
+RECORDING_AUTOSAVE = False
+
+"""
+Button debounce times in milliseconds.
+A button must read pressed (or released) continuously for this long before the change is reported.
+0 reports the change immediately.
+"""
+BUTTON_DEBOUNCE_PRESS_MS = 2
+BUTTON_DEBOUNCE_RELEASE_MS = 10
+
+"""
+How button inputs are read:
+- 'digitalio' : each button pin is read every main loop iteration and debounced as above
+- 'keypad' : pins are scanned in the background by CircuitPython's keypad module, which
+  debounces them and queues press/release events. Presses shorter than a main loop
+  iteration are not missed. The debounce times above do not apply, only the scan interval.
+  Falls back to 'digitalio' if keypad is not available.
+"""
+BUTTON_INPUT_BACKEND = 'digitalio'
+# Background scan (and debounce) interval for the 'keypad' backend
+KEYPAD_SCAN_INTERVAL_MS = 5
 
 # Configure the board with available analog/digital inputs:
 
@@ -42,6 +108,46 @@ digital_ins: dict[str, Pin] = {
     'd6'    : board.GP6,
     'd7'    : board.GP7,
 }
+
+"""
+Input expansion for more inputs than the board has pins. See expanders.py
+
+74HC165 style shift register chains for extra digital inputs, scanned in the background
+by the keypad module. Inputs must be pulled up, i.e. a pressed button reads low.
+Keys are chain IDs, values are (clock Pin, data Pin, latch Pin, number of inputs on the chain)
+"""
+shift_register_chains: dict[str, (Pin, Pin, Pin, int)] = {
+    # 'sr0'   : (board.GP8, board.GP9, board.GP10, 16),
+}
+
+"""
+Digital inputs on shift register chains. These can be mapped to buttons just like digital_ins
+Keys can be anything you like (but must not clash with digital_ins keys),
+values are (chain ID, input number on the chain)
+"""
+shift_register_ins: dict[str, (str, int)] = {
+    # 's0'    : ('sr0', 0),
+    # 's1'    : ('sr0', 1),
+}
+
+"""
+CD4051 (8 channel) or 74HC4067 (16 channel) analog multiplexers.
+Each main loop iteration reads one channel of each mux and then selects the next channel in use.
+Keys are mux IDs, values are (common analog Pin, (select Pins, S0 first))
+The common pin must not also be used in analog_ins.
+"""
+analog_muxes: dict[str, (Pin, tuple)] = {
+    # 'mux0'  : (board.A3, (board.GP11, board.GP12, board.GP13)),
+}
+
+"""
+Analog inputs on multiplexers. These can be mapped to joystick axes just like analog_ins
+Keys can be anything you like (but must not clash with analog_ins keys),
+values are (mux ID, channel number)
+"""
+mux_analog_ins: dict[str, (str, int)] = {
+    # 'm0'    : ('mux0', 0),
+}
     
 # Enumerate all our digital io inputs as HID button IDs (0-15)
 BUTTON_WEST_Y       = 0
@@ -66,6 +172,36 @@ BUTTON_VOL_DOWN     = ConsumerControlCode.VOLUME_DECREMENT
 BUTTON_VOL_MUTE     = ConsumerControlCode.MUTE
 BUTTON_POWER        = CC_POWER_CODE
 
+"""
+Number of players, i.e. gamepads reported to the host (see players.py). Changes take effect after a hard reset.
+Inputs of players 2, 3 ... are mapped to button IDs offset by PLAYER_BUTTON_BASE per player,
+e.g. PLAYER_BUTTON_BASE + BUTTON_START for player 2, and axis names suffixed with the player number,
+e.g. 'x2', 'y2', 'z2', 'r_z2' for player 2.
+At most GAMEPAD_REPORTS_PER_LOOP gamepad reports are sent per main loop iteration,
+taking turns between the players whose inputs have changed.
+"""
+PLAYER_COUNT = 1
+PLAYER_BUTTON_BASE = 0x100
+GAMEPAD_REPORTS_PER_LOOP = 1
+
+"""
+The layout of the gamepad HID reports, used to generate both the report descriptor in boot.py
+and the reports themselves (see hid_layout.py). Changes take effect after a hard reset.
+- 'buttons': number of buttons (1-16). Button IDs at or above this are not reported
+- 'axes': number of joystick axes (0-4), from x, y, z, r_z in that order
+- 'axis_bits': resolution of the joystick axes, 8 or 16
+- 'hat': report the BUTTON_HAT_* buttons as a hat switch instead of buttons
+Every player uses the same layout, with report IDs 4, 5 ...
+e.g. 8 buttons & two 8 bit axes use a 3 byte report (4 bytes including the report ID)
+"""
+gamepad_layout: dict = {
+    'buttons'       : 16,
+    'axes'          : 4,
+    'axis_bits'     : 16,
+    'hat'           : False,
+    'hat_buttons'   : (BUTTON_HAT_UP, BUTTON_HAT_DOWN, BUTTON_HAT_LEFT, BUTTON_HAT_RIGHT),
+}
+
 # These are the default mappings of buttons to digital inputs
 default_button_pins: dict[int, str] = {
     BUTTON_VOL_UP   : 'd0',
@@ -86,6 +222,106 @@ default_joystick_pins: dict[str, str] = {
     'r_z'   : 'a3',
 }
 
+"""
+Analog joystick axis filtering, applied between the ADC read and the reported axis value.
+Values are tuples of (oversample, ema_shift, deadzone, hysteresis):
+- oversample: number of ADC readings averaged every loop iteration
+- ema_shift: weight each new reading 1/2^ema_shift in an exponential moving average. 0 disables it
+- deadzone: axis values closer than this to centre are reported as centre
+- hysteresis: axis value changes smaller than this are not reported
+Can be changed at runtime via the 'filter_{axis}' serial command
+"""
+default_axis_filters: dict[str, (int, int, int, int)] = {
+    'x'     : (4, 2, 1024, 256),
+    'y'     : (4, 2, 1024, 256),
+    'z'     : (4, 2, 1024, 256),
+    'r_z'   : (4, 2, 1024, 256),
+}
+
+"""
+Joystick axis calibration, as raw 16-bit ADC readings at the stick positions.
+Values are tuples of (min, centre, max, invert). If invert is True the axis direction is reversed.
+Can be changed at runtime via the 'cal_{axis}' serial command, or captured with the 'cal' serial command.
+"""
+default_axis_calibrations: dict[str, (int, int, int, bool)] = {
+    'x'     : (0, 32768, 65535, False),
+    'y'     : (0, 32768, 65535, False),
+    'z'     : (0, 32768, 65535, False),
+    'r_z'   : (0, 32768, 65535, False),
+}
+
+"""
+Joystick axis response curves. Values can be:
+- 'linear'
+- 'expo' or ('expo', k): a blend of linear and cubic response which is k% cubic (default 50).
+  This gives finer control near centre.
+- a sequence of (in, out) points sorted by in, both in the range -32767 to 32767.
+  Values between points are linearly interpolated.
+Can be changed at runtime via the 'curve_{axis}' serial command.
+"""
+default_axis_curves: dict[str, object] = {
+    'x'     : 'linear',
+    'y'     : 'linear',
+    'z'     : 'linear',
+    'r_z'   : 'linear',
+}
+
+"""
+Calibration, deadzone & response curves are combined into a lookup table per axis
+indexed by the top AXIS_LUT_BITS bits of the ADC reading. Each table uses 2^(AXIS_LUT_BITS+1) bytes.
+"""
+AXIS_LUT_BITS = 10
+
+"""
+Rotary encoder steps are delivered as separate button presses, none are lost.
+Each press is held for ROTARY_ENCODER_PRESS_MS followed by a release of at least ROTARY_ENCODER_RELEASE_MS,
+so steps are delivered at up to 1000 / (ROTARY_ENCODER_PRESS_MS + ROTARY_ENCODER_RELEASE_MS) per second.
+At most ROTARY_ENCODER_MAX_PENDING steps are queued, further steps are dropped.
+"""
+ROTARY_ENCODER_PRESS_MS = 20
+ROTARY_ENCODER_RELEASE_MS = 20
+ROTARY_ENCODER_MAX_PENDING = 32
+
+"""
+Optional rotary encoder acceleration: steps arriving within ROTARY_ENCODER_ACCEL_MS of the
+previous step are multiplied by ROTARY_ENCODER_ACCEL_FACTOR. A factor of 1 disables it.
+"""
+ROTARY_ENCODER_ACCEL_MS = 30
+ROTARY_ENCODER_ACCEL_FACTOR = 1
+
+"""
+Button gestures detected on the physical buttons (see gestures.py)
+Each entry is a tuple of (kind, buttons, time_ms, action):
+- kind: 'hold', 'chord' or 'double_tap'
+- buttons: tuple of button IDs, all of which make up the gesture
+- time_ms: 'hold': time all the buttons must be held
+           'chord': max time between the first & last button presses (0 for any)
+           'double_tap': max time between the two presses
+- action: consumer control code (int) to send, or serial command line (str) to process
+"""
+button_gestures: list[tuple] = [
+    ('hold', (BUTTON_START,), START_BUTTON_HOLD_FOR_SHUTDOWN_SECS * 1000, CC_POWER_CODE),
+    # ('chord', (BUTTON_SELECT, BUTTON_START), 100, 'macro=conf_es'),
+    # ('double_tap', (BUTTON_THUMB_L,), 300, BUTTON_VOL_MUTE),
+]
+
+"""
+User macros, which can be played by name via the serial interface (e.g. 'my_macro' or 'macro=my_macro')
+or from a button gesture (see button_gestures above).
+Each macro is a list of steps, each step a dict with these optional keys:
+- 'btns': tuple of button IDs to press
+- 'x', 'y', 'z', 'r_z': joystick axes values
+- 'hold', 'pre', 'post': times in ms, as for the serial commands. Defaults are 500, 0 & 500
+"""
+user_macros: dict[str, list] = {
+    # 'hadouken': [
+    #     { 'y' :  32767, 'hold' : 50, 'post' : 0 },
+    #     { 'x' :  32767, 'y' : 32767, 'hold' : 50, 'post' : 0 },
+    #     { 'x' :  32767, 'hold' : 50, 'post' : 0 },
+    #     { 'btns' : (BUTTON_WEST_Y,), 'hold' : 50 },
+    # ],
+}
+
 # These are the default rotary-encoder mappings:
 default_rotary_encoder_pins: dict[str: (str, str, int, int)] = {
     # 'rot_vol': ('d0', 'd1', BUTTON_VOL_DOWN, BUTTON_VOL_UP),
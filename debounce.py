@@ -0,0 +1,48 @@
+class Debouncer:
+    """
+    Time based debounce for button inputs.
+
+    A change in a button's raw reading is only accepted once the reading has
+    stayed changed for ``press_ns`` (released -> pressed) or ``release_ns``
+    (pressed -> released). Readings which bounce back sooner are ignored.
+    Times come from the caller (time.monotonic_ns()) so the result does not depend on loop speed.
+
+    State for all buttons is held in a preallocated list indexed by button slot
+    (see buttons.button_slot()) and an integer bitmask.
+    """
+
+    def __init__(self, slots: int, press_ms: int, release_ms: int):
+        self.press_ns = press_ms * 1_000_000
+        self.release_ns = release_ms * 1_000_000
+        # Debounced pressed state, one bit per slot
+        self._stable = 0
+        # Time the raw reading started to differ from the debounced state, or 0 if it doesn't
+        self._since = [0] * slots
+
+    def reset(self, slot: int):
+        """
+        Forget the state of a button, e.g. when it is remapped
+        """
+        self._stable &= ~(1 << slot)
+        self._since[slot] = 0
+
+    def update(self, slot: int, raw_pressed: bool, now_ns: int) -> bool:
+        """
+        Feed a raw reading for a button and return its debounced pressed state
+        """
+        bit = 1 << slot
+        stable = self._stable & bit != 0
+        if raw_pressed == stable:
+            self._since[slot] = 0
+            return stable
+        since = self._since[slot]
+        if since == 0:
+            # Raw reading has just changed, start timing it
+            self._since[slot] = now_ns
+            since = now_ns
+        if now_ns - since >= (self.press_ns if raw_pressed else self.release_ns):
+            # Raw reading changed for long enough, accept it
+            self._stable ^= bit
+            self._since[slot] = 0
+            return raw_pressed
+        return stable
@@ -0,0 +1,174 @@
+"""
+Input expansion beyond the board's native pins:
+
+- ShiftRegisterChain: 74HC165 style parallel-in/serial-out shift register chains for digital inputs.
+  The chain is clocked & debounced in the background by keypad.ShiftRegisterKeys,
+  so the main loop only processes press/release events.
+- AnalogMux: CD4051 (8 channel) / 74HC4067 (16 channel) analog multiplexers sharing one ADC input.
+  scan() does a single ADC read and channel switch, so the settling time of the next
+  channel is the time until the next main loop iteration. The cost per loop iteration
+  stays constant however many channels are in use.
+"""
+
+from array import array
+from analogio import AnalogIn
+from digitalio import DigitalInOut
+try:
+    import keypad
+except ImportError:
+    keypad = None
+
+from keyevents import KeyEventReader
+
+class ShiftRegisterChain:
+    """
+    A chain of shift registers, with key numbers mapped to button IDs
+    """
+
+    def __init__(self, clock, data, latch, key_count: int, interval_ms: int):
+        if None == keypad:
+            raise RuntimeError('Shift register inputs need the keypad module')
+        # Inputs are pulled up, so a pressed button reads False
+        self._keys = keypad.ShiftRegisterKeys(clock=clock, data=data, latch=latch,
+                                              key_count=key_count, value_when_pressed=False,
+                                              interval=interval_ms / 1000)
+        self.key_count = key_count
+        # key number -> button ID, or -1 if not mapped
+        self._btns = [-1] * key_count
+        self._reader = KeyEventReader()
+        # Bound once, as binding a method allocates
+        self._apply_event = self._apply
+        # The ButtonState being updated by scan()
+        self._pressed_buttons = None
+
+    def input(self, key: int, btn: int):
+        """
+        Map a key number on the chain to a button ID, returning a handle whose deinit() unmaps it
+        """
+        if not 0 <= key < self.key_count:
+            raise ValueError(f'Shift register input must be in range 0 to {self.key_count - 1}')
+        self._btns[key] = btn
+        return ShiftRegisterInput(self, key)
+
+    def release(self, key: int):
+        self._btns[key] = -1
+
+    def scan(self, pressed_buttons):
+        """
+        Apply queued press/release events for mapped keys to pressed_buttons (a ButtonState).
+        Each key changes at most once per call, so a press & release queued together are both reported.
+        """
+        events = self._keys.events
+        if events.overflowed:
+            events.clear()
+            self._reader.clear()
+            for btn in self._btns:
+                if btn >= 0:
+                    pressed_buttons.release(btn)
+            self._keys.reset()
+        self._pressed_buttons = pressed_buttons
+        self._reader.read(events, self._apply_event)
+
+    def _apply(self, key: int, pressed: bool):
+        btn = self._btns[key]
+        if btn >= 0:
+            self._pressed_buttons.set(btn, pressed)
+
+    def deinit(self):
+        self._keys.deinit()
+
+class ShiftRegisterInput:
+    """
+    Handle for a mapped shift register input. deinit() unmaps it, like DigitalInOut.deinit()
+    """
+
+    def __init__(self, chain: ShiftRegisterChain, key: int):
+        self._chain = chain
+        self._key = key
+
+    def deinit(self):
+        self._chain.release(self._key)
+
+class AnalogMux:
+    """
+    An analog multiplexer with 2^len(select_pins) channels on a single ADC input
+    """
+
+    def __init__(self, common_pin, select_pins):
+        self._analog_in = AnalogIn(common_pin)
+        self._selects = []
+        for pin in select_pins:
+            dio = DigitalInOut(pin)
+            dio.switch_to_output(value=False)
+            self._selects.append(dio)
+        self.channels = 1 << len(select_pins)
+        # Latest reading of each channel
+        self.values = array('H', [32768] * self.channels)
+        # Channels in use, scanned in turn
+        self._scan_list: list[int] = []
+        self._scan_index = 0
+        self._selected = 0
+
+    def input(self, channel: int):
+        """
+        Start scanning a channel, returning an AnalogIn-like MuxChannel for it
+        """
+        if not 0 <= channel < self.channels:
+            raise ValueError(f'Analog mux channel must be in range 0 to {self.channels - 1}')
+        if not channel in self._scan_list:
+            self._scan_list.append(channel)
+            if len(self._scan_list) == 1:
+                self._select(channel)
+        return MuxChannel(self, channel)
+
+    def release(self, channel: int):
+        """
+        Stop scanning a channel
+        """
+        if channel in self._scan_list:
+            self._scan_list.remove(channel)
+            self._scan_index = 0
+            if len(self._scan_list) > 0:
+                self._select(self._scan_list[0])
+
+    def _select(self, channel: int):
+        for i in range(len(self._selects)):
+            self._selects[i].value = channel & (1 << i) != 0
+        self._selected = channel
+
+    def scan(self):
+        """
+        Read the selected channel, which has had since the last scan() to settle,
+        then select the next channel in use
+        """
+        count = len(self._scan_list)
+        if count == 0:
+            return
+        self.values[self._selected] = self._analog_in.value
+        if count > 1:
+            self._scan_index += 1
+            if self._scan_index >= count:
+                self._scan_index = 0
+            self._select(self._scan_list[self._scan_index])
+
+    def deinit(self):
+        self._analog_in.deinit()
+        for dio in self._selects:
+            dio.deinit()
+
+class MuxChannel:
+    """
+    One channel of an AnalogMux, used in place of an AnalogIn.
+    value is the latest reading from the background scan
+    """
+
+    def __init__(self, mux: AnalogMux, channel: int):
+        self._mux = mux
+        self._channel = channel
+
+    @property
+    def value(self) -> int:
+        return self._mux.values[self._channel]
+
+    def deinit(self):
+        self._mux.release(self._channel)
@@ -0,0 +1,181 @@
+from array import array
+
+from utils import clamp
+
+class AxisFilter:
+    """
+    Filters the raw ADC readings of one joystick axis into a gamepad axis value:
+
+    1. Averages ``oversample`` ADC readings per update
+    2. Exponential moving average with a weight of 1/2^``ema_shift`` for each new reading
+       (0 disables it)
+    3. Looks up the axis value in a precomputed table, see compile()
+    4. Ignores changes smaller than ``hysteresis``, except for reaching centre or the limits
+
+    The lookup table combines calibration, centre deadzone and response curve.
+    Settings only take effect when compile() rebuilds the table, so the
+    per-reading cost is a shift and an index.
+    """
+
+    def __init__(self, lut_bits: int = 10):
+        self._lut_shift = 16 - lut_bits
+        self._lut = array('h', bytes(2 << lut_bits))
+        self.oversample = 1
+        self.ema_shift = 0
+        self.deadzone = 0
+        self.hysteresis = 0
+        # Calibration, as raw 16-bit ADC readings
+        self.cal_min = 0
+        self.cal_centre = 32768
+        self.cal_max = 65535
+        self.invert = False
+        self.curve = 'linear'
+        # Calibration capture state, see start_calibration()
+        self._capturing = False
+        self.raw = 0
+        self.reset()
+
+    def configure(self, oversample: int, ema_shift: int, deadzone: int, hysteresis: int):
+        self.oversample = max(1, oversample)
+        self.ema_shift = max(0, ema_shift)
+        self.deadzone = clamp(deadzone, 0, 32766)
+        self.hysteresis = max(0, hysteresis)
+        self.reset()
+
+    def calibrate(self, cal_min: int, cal_centre: int, cal_max: int, invert: bool = False):
+        """
+        Set the raw ADC readings at the minimum, centre & maximum stick positions
+        """
+        if not 0 <= cal_min < cal_centre < cal_max <= 65535:
+            raise ValueError("Calibration must satisfy 0 <= min < centre < max <= 65535")
+        self.cal_min = cal_min
+        self.cal_centre = cal_centre
+        self.cal_max = cal_max
+        self.invert = invert
+
+    def set_curve(self, curve):
+        """
+        Set the response curve, one of:
+        - 'linear'
+        - 'expo' or ('expo', k): blend of linear & cubic response, k% cubic (default 50)
+        - a sequence of (in, out) points, sorted by in, both in the range -32767 to 32767.
+          Values in between are linearly interpolated
+        """
+        if isinstance(curve, str) and not curve in ('linear', 'expo'):
+            raise ValueError(f'Unknown response curve: {curve}')
+        self.curve = curve
+
+    def reset(self):
+        """
+        Forget filter history, e.g. after the axis is remapped to another input
+        """
+        # EMA accumulator, scaled up by 2^ema_shift. None until the first reading
+        self._ema_acc = None
+        self._value = 0
+
+    def compile(self):
+        """
+        Rebuild the lookup table from the calibration, deadzone & curve settings
+        """
+        size = len(self._lut)
+        for i in range(size):
+            self._lut[i] = self.transfer(i * 65535 // (size - 1))
+
+    def transfer(self, raw: int) -> int:
+        """
+        Map a raw ADC reading to an axis value using the calibration, deadzone & curve.
+        Slow, used to build the lookup table.
+        """
+        if raw >= self.cal_centre:
+            value = (raw - self.cal_centre) * 32767 / (self.cal_max - self.cal_centre)
+        else:
+            value = (raw - self.cal_centre) * 32767 / (self.cal_centre - self.cal_min)
+        value = clamp(value, -32767, 32767)
+        if self.invert:
+            value = -value
+        dz = self.deadzone
+        if -dz < value < dz:
+            return 0
+        if value > 0:
+            value = (value - dz) * 32767 / (32767 - dz)
+        else:
+            value = (value + dz) * 32767 / (32767 - dz)
+        return clamp(int(round(apply_curve(self.curve, value))), -32767, 32767)
+
+    def start_calibration(self):
+        """
+        Start capturing calibration. The stick should be at rest at its centre
+        and is then swept to its limits before calling finish_calibration()
+        """
+        self.cal_capture_min = self.raw
+        self.cal_capture_max = self.raw
+        self.cal_capture_centre = self.raw
+        self._capturing = True
+
+    def finish_calibration(self):
+        """
+        Stop capturing and set the captured calibration
+        """
+        self._capturing = False
+        self.calibrate(self.cal_capture_min, self.cal_capture_centre, self.cal_capture_max, self.invert)
+
+    @property
+    def value(self) -> int:
+        """
+        The last filtered axis value
+        """
+        return self._value
+
+    def update(self, analog_in) -> int:
+        """
+        Read analog_in and return the new filtered axis value
+        """
+        raw = 0
+        for _ in range(self.oversample):
+            raw += analog_in.value
+        raw //= self.oversample
+        if self.ema_shift > 0:
+            if self._ema_acc is None:
+                self._ema_acc = raw << self.ema_shift
+            else:
+                self._ema_acc += raw - (self._ema_acc >> self.ema_shift)
+            raw = self._ema_acc >> self.ema_shift
+        self.raw = raw
+        if self._capturing:
+            if raw < self.cal_capture_min:
+                self.cal_capture_min = raw
+            elif raw > self.cal_capture_max:
+                self.cal_capture_max = raw
+        return self.apply(self._lut[raw >> self._lut_shift])
+
+    def apply(self, value: int) -> int:
+        """
+        Apply hysteresis to an axis value and return the new filtered axis value
+        """
+        diff = value - self._value
+        if (diff >= self.hysteresis or -diff >= self.hysteresis
+                or value == 0 or value == 32767 or value == -32767):
+            self._value = value
+        return self._value
+
+def apply_curve(curve, value: float) -> float:
+    """
+    Apply a response curve (see AxisFilter.set_curve()) to an axis value
+    """
+    if curve == 'linear':
+        return value
+    if curve == 'expo':
+        curve = ('expo', 50)
+    if curve[0] == 'expo':
+        k = curve[1] / 100
+        norm = value / 32767
+        return ((1 - k) * norm + k * norm * norm * norm) * 32767
+    # Piecewise linear through (in, out) points
+    prev_in, prev_out = curve[0]
+    if value <= prev_in:
+        return prev_out
+    for point_in, point_out in curve[1:]:
+        if value <= point_in:
+            return prev_out + (value - prev_in) * (point_out - prev_out) / (point_in - prev_in)
+        prev_in, prev_out = point_in, point_out
+    return prev_out
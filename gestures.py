@@ -0,0 +1,138 @@
+"""
+Button gesture detection: hold (long press), chord & double-tap.
+
+Gestures are evaluated once per main loop iteration against the physical
+button state, using integer monotonic_ns() ticks & bitmasks of button slots
+(see buttons.button_slot) so that no objects are allocated per loop.
+
+Each gesture is a tuple of (kind, buttons, time_ms, action):
+
+* kind      - GESTURE_HOLD, GESTURE_CHORD or GESTURE_DOUBLE_TAP
+* buttons   - tuple of button IDs which make up the gesture
+* time_ms   - GESTURE_HOLD: how long all the buttons must be held
+              GESTURE_CHORD: maximum time between the first & last button presses, 0 for any
+              GESTURE_DOUBLE_TAP: maximum time between the two presses
+* action    - consumer control code (int) to send, or a serial command line (str) to process
+"""
+from time import monotonic_ns
+
+from globals import pressed_buttons, cc
+from config import button_gestures
+from buttons import NUM_BUTTON_SLOTS, button_slot
+import serial
+
+GESTURE_HOLD = 'hold'
+GESTURE_CHORD = 'chord'
+GESTURE_DOUBLE_TAP = 'double_tap'
+GESTURE_KINDS = (GESTURE_HOLD, GESTURE_CHORD, GESTURE_DOUBLE_TAP)
+
+# The ACTIVE gestures, held as parallel lists indexed by gesture number
+gesture_kinds: list[str] = []
+gesture_masks: list[int] = []
+gesture_times: list[int] = []       # ns
+gesture_actions: list = []
+# Per gesture detection state
+gesture_since: list[int] = []       # ns the gesture started, see update()
+gesture_fired: list[bool] = []      # GESTURE_HOLD: already fired for this hold
+# Button slot bitmask at the last update()
+last_state = 0
+
+def buttons_mask(btns) -> int:
+    """
+    Return the button slot bitmask for a tuple of button IDs
+    """
+    mask = 0
+    for btn in btns:
+        slot = button_slot(btn)
+        if not 0 <= slot < NUM_BUTTON_SLOTS:
+            # Only player 1 buttons can be used in gestures
+            raise ValueError(f'Unknown button {btn}')
+        mask |= 1 << slot
+    return mask
+
+def set_gestures(gestures: list):
+    """
+    Replace the active gestures. See the module docstring for the gesture tuple format.
+    Invalid gestures are reported & skipped.
+    """
+    clear()
+    for gesture in gestures:
+        try:
+            add_gesture(*gesture)
+        except (ValueError, TypeError) as e:
+            print(f'Error adding gesture {gesture}: {e}')
+
+def add_gesture(kind: str, btns, time_ms: int, action):
+    if kind not in GESTURE_KINDS:
+        raise ValueError(f'Unknown gesture kind {kind}')
+    mask = buttons_mask(btns)
+    if 0 == mask:
+        raise ValueError('No buttons')
+    print(f'Adding {kind} gesture: {btns}, {time_ms}ms -> {action}')
+    gesture_kinds.append(kind)
+    gesture_masks.append(mask)
+    gesture_times.append(int(time_ms) * 1_000_000)
+    gesture_actions.append(action)
+    gesture_since.append(0)
+    gesture_fired.append(False)
+
+def clear():
+    gesture_kinds.clear()
+    gesture_masks.clear()
+    gesture_times.clear()
+    gesture_actions.clear()
+    gesture_since.clear()
+    gesture_fired.clear()
+
+def fire(i: int):
+    action = gesture_actions[i]
+    print(f'Gesture {gesture_kinds[i]} {gesture_masks[i]:#x} detected: {action}')
+    if isinstance(action, str):
+        serial.process_line(action)
+    else:
+        cc.send(action)
+
+def update():
+    """
+    Detect gestures from the physical button state. Call once per main loop iteration.
+    """
+    global last_state
+    state = pressed_buttons.gamepad | (pressed_buttons.cc << 16)
+    prev_state = last_state
+    last_state = state
+    if 0 == state and 0 == prev_state:
+        # Nothing pressed, nothing to detect
+        return
+    now = monotonic_ns()
+    for i in range(len(gesture_masks)):
+        mask = gesture_masks[i]
+        down = state & mask
+        prev = prev_state & mask
+        kind = gesture_kinds[i]
+        if GESTURE_HOLD == kind:
+            if down != mask:
+                continue
+            if prev != mask:
+                # All the buttons have just been pressed, start timing
+                gesture_since[i] = now
+                gesture_fired[i] = False
+            if not gesture_fired[i] and now - gesture_since[i] >= gesture_times[i]:
+                gesture_fired[i] = True
+                fire(i)
+        elif GESTURE_CHORD == kind:
+            if 0 == prev and 0 != down:
+                # First button of the chord pressed
+                gesture_since[i] = now
+            if down == mask and prev != mask:
+                if 0 == gesture_times[i] or now - gesture_since[i] <= gesture_times[i]:
+                    fire(i)
+        elif down == mask and prev != mask:
+            # GESTURE_DOUBLE_TAP: fire on the second press if soon enough after the first
+            if 0 != gesture_since[i] and now - gesture_since[i] <= gesture_times[i]:
+                gesture_since[i] = 0
+                fire(i)
+            else:
+                gesture_since[i] = now
+
+def init():
+    set_gestures(button_gestures)
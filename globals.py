@@ -1,18 +1,32 @@
 import usb_hid
 
-from adafruit_hid.consumer_control import ConsumerControl
-
 from hid_gamepad import Gamepad
-from config import BUTTON_VOL_UP, BUTTON_VOL_DOWN, BUTTON_VOL_MUTE
+from hid_layout import GamepadLayout
+from hid_consumer_control import CachedConsumerControl
+from buttons import ButtonState
+from config import gamepad_layout, PLAYER_COUNT
+from players import PlayerButtons
 
 # Gamepad & Volume pressed buttons
-pressed_buttons = set()
-gp_valid_buttons = set(range(0,16))
-vol_valid_buttons = set((BUTTON_VOL_UP, BUTTON_VOL_DOWN, BUTTON_VOL_MUTE))
+pressed_buttons = ButtonState()
 # Gamepad joystick axes values
 gamepad_axes_values = {'x':0, 'y':0, 'z':0, 'r_z':0}
+# Buttons & joystick axes values synthesized by serial commands (see scheduler.py)
+# These are combined with the physical inputs when reporting. Injected axes take precedence.
+injected_buttons = ButtonState()
+injected_axes = {}
+# Buttons & joystick axes values set by stream frames (see stream.py). These stay until changed by a later frame
+# and are the base of the injected inputs, beneath those of any active commands.
+streamed_buttons = ButtonState()
+streamed_axes = {}
+
+# Buttons & joystick axes values of every player (see players.py), the first being pressed_buttons & gamepad_axes_values
+player_buttons = PlayerButtons([pressed_buttons] + [ButtonState() for _ in range(1, PLAYER_COUNT)])
+player_axes_values = [gamepad_axes_values] + [{'x':0, 'y':0, 'z':0, 'r_z':0} for _ in range(1, PLAYER_COUNT)]
 
-# Gamepad
-gp = Gamepad(usb_hid.devices)
+# Gamepad, for each player. The report IDs match those in boot.py
+gp = Gamepad(usb_hid.devices, GamepadLayout(**gamepad_layout))
+gamepads = [gp] + [Gamepad(usb_hid.devices, GamepadLayout(report_id=4 + player, **gamepad_layout))
+                   for player in range(1, PLAYER_COUNT)]
 # Consumer Control
-cc = ConsumerControl(usb_hid.devices)
+cc = CachedConsumerControl(usb_hid.devices)
@@ -0,0 +1,76 @@
+from adafruit_hid.consumer_control import ConsumerControl
+
+from buttons import CC_BUTTONS
+import stats
+
+class CachedConsumerControl:
+    """
+    Wraps adafruit_hid's ConsumerControl, which sends a report on every call,
+    so that a report is only sent when the code being sent actually changes.
+
+    A consumer control report carries a single code, so when several codes are
+    pressed at once they are delivered one after another (in CC_BUTTONS order)
+    rather than all but one being dropped.
+    """
+
+    def __init__(self, devices):
+        self._cc = ConsumerControl(devices)
+        # Code currently reported as pressed, 0 if released
+        self._sent_code = 0
+        # ButtonState.cc style bitmasks:
+        # - the bit currently reported as pressed
+        self._sent_bit = 0
+        # - the buttons pressed at the last update()
+        self._held = 0
+        # - buttons newly pressed but not yet delivered
+        self._pending = 0
+
+    def press(self, code: int):
+        """
+        Report code as pressed, unless it already is
+        """
+        if code != self._sent_code:
+            self._cc.press(code)
+            stats.cc_sent += 1
+            self._sent_code = code
+
+    def release(self):
+        """
+        Report all codes released, unless they already are
+        """
+        if self._sent_code != 0:
+            self._cc.release()
+            stats.cc_sent += 1
+            self._sent_code = 0
+        self._sent_bit = 0
+
+    def send(self, code: int):
+        """
+        Press & release code, regardless of the current state
+        """
+        self._cc.send(code)
+        # A press & a release report
+        stats.cc_sent += 2
+        self._sent_code = 0
+        self._sent_bit = 0
+
+    def update(self, pressed: int):
+        """
+        Report the consumer control buttons pressed, as a ButtonState.cc bitmask.
+        Call once per main loop iteration. At most one report is sent per call.
+        """
+        # Queue newly pressed buttons for delivery
+        self._pending |= pressed & ~self._held
+        self._held = pressed
+        if self._pending:
+            # Deliver the next queued button (lowest bit first)
+            bit = self._pending & -self._pending
+            self._pending &= ~bit
+            i = 0
+            while not bit & (1 << i):
+                i += 1
+            self.press(CC_BUTTONS[i])
+            self._sent_bit = bit
+        elif not self._sent_bit & pressed:
+            # The button being reported has been released
+            self.release()
@@ -9,48 +9,47 @@
 * Author(s): Dan Halbert
 """
 
-import struct
 import time
 
 from adafruit_hid import find_device
 
+from hid_layout import GamepadLayout
+import stats
+
 
 class Gamepad:
-    """Emulate a generic gamepad controller with 16 buttons,
+    """Emulate a generic gamepad controller with up to 16 buttons,
     numbered 1-16, and two joysticks, one controlling
     ``x` and ``y`` values, and the other controlling ``z`` and
     ``r_z`` (z rotation or ``Rz``) values.
 
     The joystick values could be interpreted
     differently by the receiving program: those are just the names used here.
-    The joystick values are in the range -127 to 127."""
+    The joystick values are in the range -32767 to 32767.
+
+    The buttons, joysticks & hat switch actually reported are set by a
+    ``GamepadLayout``, which must match the report descriptor in boot.py."""
 
-    def __init__(self, devices):
+    def __init__(self, devices, layout=None):
         """Create a Gamepad object that will send USB gamepad HID reports.
 
         Devices can be a list of devices that includes a gamepad device or a gamepad device
         itself. A device is any object that implements ``send_report()``, ``usage_page`` and
         ``usage``.
+
+        ``layout`` is the ``GamepadLayout`` of the reports. The default is
+        16 buttons and four 16 bit joystick axes.
         """
         self._gamepad_device = find_device(devices, usage_page=0x1, usage=0x04)
+        self._layout = layout if layout is not None else GamepadLayout()
 
-        # Reuse this bytearray to send mouse reports.
+        # Reuse this bytearray to send reports, packed as described by the layout.
         # Typically controllers start numbering buttons at 1 rather than 0.
-        # report[0] buttons 1-8 (LSB is button 1)
-        # report[1] buttons 9-16
-        # report[2] joystick x: -32767 to 32767 LSB
-        # report[3] joystick x: -32767 to 32767 MSB
-        # report[4] joystick y: -32767 to 32767 LSB
-        # report[5] joystick y: -32767 to 32767 MSB
-        # report[6] joystick z: -32767 to 32767 LSB
-        # report[7] joystick z: -32767 to 32767 MSB
-        # report[8] joystick Rz: -32767 to 32767 LSB
-        # report[9] joystick Rz: -32767 to 32767 MSB
-        self._report = bytearray(10)
+        self._report = bytearray(self._layout.report_length)
 
         # Remember the last report as well, so we can avoid sending
         # duplicate reports.
-        self._last_report = bytearray(10)
+        self._last_report = bytearray(self._layout.report_length)
 
         # Store settings separately before putting into report. Saves code
         # especially for buttons.
@@ -60,6 +59,10 @@ class Gamepad:
         self._joy_z = 0
         self._joy_r_z = 0
 
+        # Nesting depth of batch() contexts, and whether a send was deferred by one
+        self._batch_depth = 0
+        self._batch_pending = False
+
         # Send an initial report to test if HID device is ready.
         # If not, wait a bit and try once more.
         while True:
@@ -102,7 +105,7 @@ class Gamepad:
         and the other provides ``z`` and ``r_z`` (z rotation).
         Any values left as ``None`` will not be changed.
 
-        All values must be in the range -127 to 127 inclusive.
+        All values must be in the range -32767 to 32767 inclusive.
 
         Examples::
 
@@ -122,6 +125,69 @@ class Gamepad:
             self._joy_r_z = self._validate_joystick_value(r_z)
         self._send()
 
+    def set_state(self, buttons, x, y, z, r_z, send=True):
+        """Set the state of all buttons and joysticks at once, and send
+        at most one report.
+
+        ``buttons`` is a bitmask of pressed buttons, bit 0 being button 0.
+        All joystick values must be in the range -32767 to 32767 inclusive.
+        If ``send`` is ``False`` the report is only prepared, and is sent by ``flush()``.
+
+        Examples::
+
+            # Press buttons 0 & 2 and push the left joystick fully left
+            gp.set_state(0b101, -32767, 0, 0, 0)
+        """
+        if not 0 <= buttons <= 0xFFFF:
+            raise ValueError("Buttons mask must be in range 0 to 0xFFFF")
+        self._buttons_state = buttons
+        self._joy_x = self._validate_joystick_value(x)
+        self._joy_y = self._validate_joystick_value(y)
+        self._joy_z = self._validate_joystick_value(z)
+        self._joy_r_z = self._validate_joystick_value(r_z)
+        if send:
+            self._send()
+        else:
+            self._pack()
+
+    def flush(self):
+        """Send the report prepared by ``set_state(..., send=False)``,
+        if it has changed since the last report sent.
+        Returns ``True`` if a report was sent.
+        A report which fails to send is retried by the next ``flush()``.
+        """
+        if self._last_report == self._report:
+            stats.hid_suppressed += 1
+            return False
+        try:
+            self._send_report()
+        except OSError:
+            return False
+        return True
+
+    def batch(self):
+        """Group several changes into a single report.
+        Reports are deferred until the outermost ``with`` block exits,
+        then at most one report is sent.
+
+        Examples::
+
+            with gp.batch():
+                gp.press_buttons(1, 2)
+                gp.move_joysticks(x=100)
+        """
+        return self
+
+    def __enter__(self):
+        self._batch_depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._batch_depth -= 1
+        if self._batch_depth == 0 and self._batch_pending:
+            self._batch_pending = False
+            self._send()
+
     def reset_all(self):
         """Release all buttons and set joysticks to zero."""
         self._buttons_state = 0
@@ -134,11 +200,33 @@ class Gamepad:
     def _send(self, always=False):
         """Send a report with all the existing settings.
         If ``always`` is ``False`` (the default), send only if there have been changes.
+        Inside a ``batch()`` the send is deferred until the batch ends.
         """
-        struct.pack_into(
-            "<Hhhhh",
+        if self._batch_depth > 0:
+            self._batch_pending = True
+            return
+        self._pack()
+
+        if always or self._last_report != self._report:
+            self._send_report()
+        else:
+            stats.hid_suppressed += 1
+
+    def _send_report(self):
+        """Send the packed report, counting it in the instrumentation counters."""
+        try:
+            self._gamepad_device.send_report(self._report, self._layout.report_id)
+        except OSError:
+            stats.hid_errors += 1
+            raise
+        stats.hid_sent += 1
+        # Remember what we sent, without allocating new storage.
+        self._last_report[:] = self._report
+
+    def _pack(self):
+        """Pack the existing settings into the report, as described by the layout."""
+        self._layout.pack_into(
             self._report,
-            0,
             self._buttons_state,
             self._joy_x,
             self._joy_y,
@@ -146,15 +234,9 @@ class Gamepad:
             self._joy_r_z,
         )
 
-        if always or self._last_report != self._report:
-            self._gamepad_device.send_report(self._report)
-            # Remember what we sent, without allocating new storage.
-            self._last_report[:] = self._report
-
-    @staticmethod
-    def _validate_button_number(button):
-        if not 0 <= button <= 15:
-            raise ValueError("Button number must in range 0 to 15")
+    def _validate_button_number(self, button):
+        if not 0 <= button <= 15 or not self._layout.valid_mask & (1 << button):
+            raise ValueError("Button number is not in the gamepad layout")
         return button
 
     @staticmethod
@@ -0,0 +1,145 @@
+"""
+Gamepad HID report layouts.
+
+A GamepadLayout generates both the HID report descriptor (used in boot.py) and
+the matching report packing (used by hid_gamepad.Gamepad) from one spec, so the
+two cannot disagree. A report holds, in order:
+
+* ``buttons`` button bits (1-16), padded to a whole number of bytes
+* optionally a hat switch (4 bits + 4 bits padding) driven by the BUTTON_HAT_* buttons,
+  which are then not reported as buttons
+* ``axes`` joystick axes (0-4) from x, y, z, r_z in that order, of ``axis_bits`` (8 or 16) each
+
+Axes values are always -32767 to 32767, and are scaled down for 8 bit axes.
+"""
+
+import struct
+
+AXIS_USAGES = (0x30, 0x31, 0x32, 0x35)  # X, Y, Z, Rz
+# Hat switch value for each combination of (up, down, left, right) pressed bits, 8 is centred (null)
+HAT_VALUES = bytes((8, 0, 4, 8, 6, 7, 5, 6, 2, 1, 3, 2, 8, 0, 4, 8))
+
+def scale_axis_8bit(value: int) -> int:
+    """
+    Scale -32767..32767 to -127..127, truncating toward zero so -value scales to the negation of value
+    """
+    if value < 0:
+        return -(-value * 127 // 32767)
+    return value * 127 // 32767
+
+class GamepadLayout:
+
+    def __init__(self, buttons: int = 16, axes: int = 4, axis_bits: int = 16, hat: bool = False,
+                 report_id: int = 4, hat_buttons: tuple = (12, 13, 14, 15)):
+        if not 1 <= buttons <= 16:
+            raise ValueError("Button count must be in range 1 to 16")
+        if not 0 <= axes <= 4:
+            raise ValueError("Axis count must be in range 0 to 4")
+        if not axis_bits in (8, 16):
+            raise ValueError("Axis bits must be 8 or 16")
+        self.buttons = buttons
+        self.axes = axes
+        self.axis_bits = axis_bits
+        self.hat = hat
+        self.report_id = report_id
+        # Button bits reported as buttons
+        self.button_mask = (1 << buttons) - 1
+        # (up, down, left, right) button bits reported as the hat
+        self.hat_bits = tuple(1 << btn for btn in hat_buttons)
+        # Button bits reported as either buttons or the hat
+        self.valid_mask = self.button_mask
+        if hat:
+            for bit in self.hat_bits:
+                self.button_mask &= ~bit
+                self.valid_mask |= bit
+        # Precompiled pack format & the values list it packs, one entry per report field
+        button_bytes = (buttons + 7) // 8
+        self.format = '<' + 'BH'[button_bytes - 1] + ('B' if hat else '') + ('b' if 8 == axis_bits else 'h') * axes
+        self.report_length = struct.calcsize(self.format)
+        self._values = [0] * (1 + (1 if hat else 0) + axes)
+
+    def descriptor(self) -> bytes:
+        """
+        The HID report descriptor for this layout
+        """
+        d = bytearray((
+            0x05, 0x01,         # Usage Page (Generic Desktop Ctrls)
+            0x09, 0x04,         # Usage (Joystick)
+            0xA1, 0x01,         # Collection (Application)
+            0x85, self.report_id,   # Report ID
+            0x05, 0x09,         #   Usage Page (Button)
+            0x19, 0x01,         #   Usage Minimum (Button 1)
+            0x29, self.buttons, #   Usage Maximum (Button N)
+            0x15, 0x00,         #   Logical Minimum (0)
+            0x25, 0x01,         #   Logical Maximum (1)
+            0x75, 0x01,         #   Report Size (1)
+            0x95, self.buttons, #   Report Count (N)
+            0x81, 0x02,         #   Input (Data,Var,Abs)
+        ))
+        padding = -self.buttons % 8
+        if padding:
+            d.extend((
+                0x75, 0x01,     #   Report Size (1)
+                0x95, padding,  #   Report Count (padding bits)
+                0x81, 0x03,     #   Input (Const,Var,Abs)
+            ))
+        if self.hat:
+            d.extend((
+                0x05, 0x01,         #   Usage Page (Generic Desktop Ctrls)
+                0x09, 0x39,         #   Usage (Hat switch)
+                0x15, 0x00,         #   Logical Minimum (0)
+                0x25, 0x07,         #   Logical Maximum (7)
+                0x35, 0x00,         #   Physical Minimum (0)
+                0x46, 0x3B, 0x01,   #   Physical Maximum (315)
+                0x65, 0x14,         #   Unit (Degrees)
+                0x75, 0x04,         #   Report Size (4)
+                0x95, 0x01,         #   Report Count (1)
+                0x81, 0x42,         #   Input (Data,Var,Abs,Null State)
+                0x65, 0x00,         #   Unit (None)
+                0x45, 0x00,         #   Physical Maximum (0)
+                0x75, 0x04,         #   Report Size (4)
+                0x95, 0x01,         #   Report Count (1)
+                0x81, 0x03,         #   Input (Const,Var,Abs)
+            ))
+        if self.axes > 0:
+            d.extend((0x05, 0x01))                          #   Usage Page (Generic Desktop Ctrls)
+            if 8 == self.axis_bits:
+                d.extend((0x15, 0x81, 0x25, 0x7F))          #   Logical Minimum (-127), Maximum (127)
+            else:
+                d.extend((0x16, 0x01, 0x80, 0x26, 0xFF, 0x7F))  #   Logical Minimum (-32767), Maximum (32767)
+            for usage in AXIS_USAGES[0:self.axes]:
+                d.extend((0x09, usage))                     #   Usage (X/Y/Z/Rz)
+            d.extend((
+                0x75, self.axis_bits,   #   Report Size (8/16)
+                0x95, self.axes,        #   Report Count (axes)
+                0x81, 0x02,             #   Input (Data,Var,Abs)
+            ))
+        d.append(0xC0)          # End Collection
+        return bytes(d)
+
+    def pack_into(self, report: bytearray, buttons: int, x: int, y: int, z: int, r_z: int):
+        """
+        Pack a report for button bitmask (bit N == button N) & axes values
+        """
+        values = self._values
+        values[0] = buttons & self.button_mask
+        i = 1
+        if self.hat:
+            up, down, left, right = self.hat_bits
+            values[1] = HAT_VALUES[(1 if buttons & up else 0) | (2 if buttons & down else 0)
+                                   | (4 if buttons & left else 0) | (8 if buttons & right else 0)]
+            i = 2
+        if self.axes > 0:
+            if 8 == self.axis_bits:
+                x = scale_axis_8bit(x)
+                y = scale_axis_8bit(y)
+                z = scale_axis_8bit(z)
+                r_z = scale_axis_8bit(r_z)
+            values[i] = x
+            if self.axes > 1:
+                values[i + 1] = y
+            if self.axes > 2:
+                values[i + 2] = z
+            if self.axes > 3:
+                values[i + 3] = r_z
+        struct.pack_into(self.format, report, 0, *values)
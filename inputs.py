@@ -1,36 +1,196 @@
+from time import monotonic_ns
 from analogio import AnalogIn
 from digitalio import DigitalInOut, Pull
 from microcontroller import Pin
 from rotaryio import IncrementalEncoder
+try:
+    import keypad
+except ImportError:
+    keypad = None
 
-from adafruit_datetime import datetime
 
 from globals import *
 from config import *
-from utils import range_map
+from filters import AxisFilter
+from buttons import NUM_PLAYER_BUTTON_SLOTS, button_slot
+from debounce import Debouncer
+from keyevents import KeyEventReader
+from utils import clamp
+from players import ALL_AXES, AXIS_TARGETS, button_player
+from expanders import ShiftRegisterChain, ShiftRegisterInput, AnalogMux
+import profiles
+import stats
 
 # DO NOT manually manipulate these dictionaries!
 # Use inputs.set_joystick_mappings() & inputs.set_button_mappings() to maintain consistency
 # The ACTIVE set of joystick inputs: gamepad axis -> (Pin, AnalogIo)
 joystick_ais: dict[str, (Pin, AnalogIn)] = {}
 # The ACTIVE set of button inputs: button ID -> (Pin, DigitalInOut)
+# The DigitalInOut is None when using the 'keypad' backend
 button_dios: dict[int, (Pin, DigitalInOut)] = {}
 # The ACTIVE set of rotary encoder inputs: enc_id: str -> (Pin, Pin, int, int, IncrementalEncoder)
 rotary_encoders: dict[str, (Pin, Pin, int, int, IncrementalEncoder)] = {}
 # The ACTIVE set of rotary encoder last readings: inputs: enc_id: str -> value: int
 rotary_encoder_values: dict[str, int] = {}
-# The ACTIVE set of Pins in use. object value will be either:
+# The ACTIVE set of rotary encoder step pulse states: enc_id: str -> list indexed by ROT_ENC_*
+rotary_encoder_pulses: dict[str, list] = {}
+ROT_ENC_PENDING = 0     # Steps not yet delivered, -ve for decrement
+ROT_ENC_PRESSED = 1     # Button currently pressed for a step, or None
+ROT_ENC_NEXT_NS = 2     # Time of the next press/release
+ROT_ENC_LAST_NS = 3     # Time of the last step read from the encoder
+# The ACTIVE set of shift register button inputs: button ID -> ((chain ID, input), ShiftRegisterInput)
+button_srs: dict[int, ((str, int), ShiftRegisterInput)] = {}
+# Input expanders from config.py: chain/mux ID -> ShiftRegisterChain/AnalogMux
+sr_chains: dict[str, ShiftRegisterChain] = {}
+muxes: dict[str, AnalogMux] = {}
+# The ACTIVE set of Pins in use. Expander inputs use their (chain/mux ID, input) tuple as the Pin.
+# object value will be either:
 # - int (button)
 # - str (js axis OR rot_enc id)
 pin_ios: dict[Pin, object] = {}  
+# Filters applied to the ADC readings of each gamepad axis
+axis_filters: dict[str, AxisFilter] = { axis: AxisFilter(AXIS_LUT_BITS) for axis in ALL_AXES }
+# Debounce state of all buttons
+button_debouncer = Debouncer(NUM_PLAYER_BUTTON_SLOTS, BUTTON_DEBOUNCE_PRESS_MS, BUTTON_DEBOUNCE_RELEASE_MS)
+# 'keypad' button backend state:
+use_keypad = BUTTON_INPUT_BACKEND == 'keypad' and None != keypad
+if BUTTON_INPUT_BACKEND == 'keypad' and not use_keypad:
+    print('keypad module not available, using digitalio button backend')
+# - keypad.Keys scanning all the button pins, rebuilt when button mappings change
+button_keys = None
+button_keys_dirty = False
+# - key_number -> button ID, Pin & whether the key is pressed
+button_key_btns: list[int] = []
+button_key_pins: list[Pin] = []
+button_key_pressed: list[bool] = []
+# - keys carried over pressed from the previous keypad.Keys which the new one has not reported yet (bit N == key N),
+#   & when the new one was created
+unconfirmed_keys = 0
+button_keys_created_ns = 0
+# - applies the queued events, at most one change per key per iteration
+key_reader = KeyEventReader() if use_keypad else None
+# Joystick axis currently capturing calibration, if any
+calibrating_axis: str = None
+# Profile waiting to be applied between main loop iterations, see apply_mappings()
+pending_profile: dict = None
 
 def init():
-    # Set the default joystick input mappings
-    set_joystick_mappings(default_joystick_pins)
-    # Set the default button input mappings
-    set_button_mappings(default_button_pins)
-    # Set the default rotary encoder mappings
-    set_rotary_encoder_mappings(default_rotary_encoder_pins)
+    # Set up input expanders
+    init_expanders()
+    # Apply the boot profile saved in NVM, or the defaults from config.py if there isn't one
+    profile = profiles.load_boot_profile()
+    if None == profile:
+        profile = default_profile()
+    apply_profile(profile)
+
+def default_profile() -> dict:
+    """
+    The mappings & joystick axis settings from config.py, as a profile (see profiles.py)
+    """
+    return {
+        'buttons'       : default_button_pins,
+        'joysticks'     : default_joystick_pins,
+        'encoders'      : default_rotary_encoder_pins,
+        'filters'       : default_axis_filters,
+        'calibrations'  : default_axis_calibrations,
+        'curves'        : default_axis_curves,
+    }
+
+def input_key(pin, *key_maps) -> str:
+    """
+    Return the config.py input key for a Pin (or expander input), searching the key -> Pin dicts given
+    """
+    for key_map in key_maps:
+        for key in key_map:
+            if key_map[key] == pin:
+                return key
+    return None
+
+def current_profile() -> dict:
+    """
+    The ACTIVE mappings & joystick axis settings, as a profile (see profiles.py)
+    """
+    profile = { 'buttons': {}, 'joysticks': {}, 'encoders': {}, 'filters': {}, 'calibrations': {}, 'curves': {} }
+    for btn in button_dios:
+        profile['buttons'][btn] = input_key(button_dios[btn][0], digital_ins)
+    for btn in button_srs:
+        profile['buttons'][btn] = input_key(button_srs[btn][0], shift_register_ins)
+    for axis in joystick_ais:
+        profile['joysticks'][axis] = input_key(joystick_ais[axis][0], analog_ins, mux_analog_ins)
+    for rot_enc_id in rotary_encoders:
+        pin_clk, pin_dt, btn_dec, btn_inc, _ = rotary_encoders[rot_enc_id]
+        profile['encoders'][rot_enc_id] = (input_key(pin_clk, digital_ins), input_key(pin_dt, digital_ins), btn_dec, btn_inc)
+    for axis in axis_filters:
+        f = axis_filters[axis]
+        profile['filters'][axis] = (f.oversample, f.ema_shift, f.deadzone, f.hysteresis)
+        profile['calibrations'][axis] = (f.cal_min, f.cal_centre, f.cal_max, f.invert)
+        profile['curves'][axis] = f.curve
+    return profile
+
+def apply_mappings(profile: dict):
+    """
+    Apply a profile (see profiles.py) at the start of the next main loop iteration,
+    so that no report is sent from a partly applied set of mappings.
+    """
+    global pending_profile
+    pending_profile = profile
+
+def apply_pending_mappings():
+    """
+    Apply any profile passed to apply_mappings(). Call between main loop iterations.
+    """
+    global pending_profile
+    if None != pending_profile:
+        profile = pending_profile
+        pending_profile = None
+        apply_profile(profile)
+
+def apply_profile(profile: dict):
+    """
+    Make the ACTIVE mappings & joystick axis settings match a profile (see profiles.py) immediately.
+    Only the mappings & settings which differ are changed, so unchanged inputs are not
+    released & re-created and keep their state (e.g. a held button stays pressed).
+    """
+    finish_axis_calibration()
+    current = current_profile()
+    # Release the mappings which are removed or changed
+    for rot_enc_id in current['encoders']:
+        if current['encoders'][rot_enc_id] != profile['encoders'].get(rot_enc_id):
+            release_rotary_encoder_mapping(rot_enc_id)
+    for axis in current['joysticks']:
+        if current['joysticks'][axis] != profile['joysticks'].get(axis):
+            release_joystick_mapping(axis)
+    for btn in current['buttons']:
+        if current['buttons'][btn] != profile['buttons'].get(btn):
+            release_button_mapping(btn)
+    # Set the changed joystick axis filters, calibrations & response curves
+    set_axis_filters(changed_entries(current['filters'], profile['filters']))
+    try:
+        set_axis_calibrations(changed_entries(current['calibrations'], profile['calibrations']))
+    except ValueError as ve:
+        print(f'Error setting joystick axis calibrations: {ve}')
+    set_axis_curves(changed_entries(current['curves'], profile['curves']))
+    # Set the added or changed mappings
+    set_joystick_mappings(changed_entries(current['joysticks'], profile['joysticks']))
+    set_button_mappings(changed_entries(current['buttons'], profile['buttons']))
+    set_rotary_encoder_mappings(changed_entries(current['encoders'], profile['encoders']))
+
+def changed_entries(current: dict, new: dict) -> dict:
+    """
+    Return the entries of new which are not in current, or differ from current
+    """
+    return { key: new[key] for key in new if current.get(key) != new[key] }
+
+def init_expanders():
+    for chain_id, (clock, data, latch, key_count) in shift_register_chains.items():
+        try:
+            sr_chains[chain_id] = ShiftRegisterChain(clock, data, latch, key_count, KEYPAD_SCAN_INTERVAL_MS)
+            print(f'Adding shift register chain: {chain_id}->({clock}, {data}, {latch}, {key_count})')
+        except RuntimeError as e:
+            print(f'Error adding shift register chain {chain_id}: {e}')
+    for mux_id, (common_pin, select_pins) in analog_muxes.items():
+        muxes[mux_id] = AnalogMux(common_pin, select_pins)
+        print(f'Adding analog mux: {mux_id}->({common_pin}, {select_pins})')
 
 def release_pin(pin: Pin):
     """
@@ -54,20 +214,103 @@ def set_joystick_mappings(js_maps: dict[str, str]) -> None:
     """
     global pin_ios, joystick_ais, analog_ins
     for axis, ai_key in js_maps.items():
-        if not axis in ['x', 'y', 'z', 'r_z']:
+        if not axis in ALL_AXES:
             continue
         # Release any existing AnalogIn for this axis and remove the mapping
         release_joystick_mapping(axis)
         # Look up the Pin for the key matching axis
         pin = analog_ins.get(ai_key)
+        mux_in = mux_analog_ins.get(ai_key)
         if None != pin:
             # Release any existing mapping for the new pin
             release_pin(pin)
             # Create an AnalogIn
             pin_ios[pin] = axis
+            release_button_keys_pins(pin)
             analog_in = AnalogIn(pin)
+        elif None != mux_in and mux_in[0] in muxes:
+            # Analog mux channel, used like an AnalogIn
+            analog_in = muxes[mux_in[0]].input(mux_in[1])
+            release_pin(mux_in)
+            pin = mux_in
+            pin_ios[pin] = axis
+        if None != pin:
             print(f'Adding joystick axis mapping: {axis}->({pin}, {analog_in})')
+            stats.mapping_changes += 1
             joystick_ais[axis] = (pin, analog_in)
+            axis_filters[axis].reset()
+            axis_filters[axis].compile()
+
+def set_axis_filters(filters: dict[str, (int, int, int, int)]) -> None:
+    """
+    Configure the filters for joystick axes with (oversample, ema_shift, deadzone, hysteresis) tuples
+    """
+    for axis, (oversample, ema_shift, deadzone, hysteresis) in filters.items():
+        axis_filter = axis_filters.get(axis)
+        if None != axis_filter:
+            print(f'Setting joystick axis filter: {axis}->({oversample}, {ema_shift}, {deadzone}, {hysteresis})')
+            axis_filter.configure(oversample, ema_shift, deadzone, hysteresis)
+            compile_axis_filter(axis)
+
+def set_axis_calibrations(cals: dict[str, (int, int, int, bool)]) -> None:
+    """
+    Configure joystick axes calibration with (min, centre, max, invert) tuples of raw ADC readings
+    """
+    for axis, (cal_min, cal_centre, cal_max, invert) in cals.items():
+        axis_filter = axis_filters.get(axis)
+        if None != axis_filter:
+            print(f'Setting joystick axis calibration: {axis}->({cal_min}, {cal_centre}, {cal_max}, {invert})')
+            axis_filter.calibrate(cal_min, cal_centre, cal_max, invert)
+            compile_axis_filter(axis)
+
+def set_axis_curves(curves: dict[str, object]) -> None:
+    """
+    Configure joystick axes response curves. See AxisFilter.set_curve()
+    """
+    for axis, curve in curves.items():
+        axis_filter = axis_filters.get(axis)
+        if None != axis_filter:
+            print(f'Setting joystick axis response curve: {axis}->{curve}')
+            axis_filter.set_curve(curve)
+            compile_axis_filter(axis)
+
+def compile_axis_filter(axis: str):
+    """
+    Rebuild an axis lookup table after its settings changed.
+    Unmapped axes are compiled when they are mapped.
+    """
+    if axis in joystick_ais:
+        axis_filters[axis].compile()
+
+def start_axis_calibration(axis: str):
+    """
+    Start capturing calibration for an axis. The stick must be at rest when this is called
+    and should then be swept to its limits before calling finish_axis_calibration()
+    """
+    global calibrating_axis
+    if not axis in joystick_ais:
+        print(f'Cannot calibrate unmapped joystick axis: {axis}')
+        return
+    finish_axis_calibration()
+    print(f'Capturing joystick axis calibration: {axis}. Sweep the stick to its limits')
+    axis_filters[axis].start_calibration()
+    calibrating_axis = axis
+
+def finish_axis_calibration():
+    """
+    Stop capturing calibration and apply it
+    """
+    global calibrating_axis
+    if None == calibrating_axis:
+        return
+    axis_filter = axis_filters[calibrating_axis]
+    try:
+        axis_filter.finish_calibration()
+        print(f'Captured joystick axis calibration: {calibrating_axis}->({axis_filter.cal_min}, {axis_filter.cal_centre}, {axis_filter.cal_max}, {axis_filter.invert})')
+        compile_axis_filter(calibrating_axis)
+    except ValueError as ve:
+        print(f'Error capturing joystick axis calibration: {calibrating_axis}: {ve}')
+    calibrating_axis = None
 
 def release_joystick_mapping(axis: str):
     """
@@ -77,6 +320,7 @@ def release_joystick_mapping(axis: str):
     try:
         pin, analog_in = joystick_ais.get(axis)
         print(f'Removing existing joystick mapping: {axis}->({pin}, {analog_in})')
+        stats.mapping_changes += 1
         joystick_ais.pop(axis)
         analog_in.deinit()
         pin_ios.pop(pin)
@@ -89,6 +333,9 @@ def set_button_mappings(but_maps: dict[int, str]) -> None:
     """
     global pin_ios, button_dios, digital_ins
     for btn, di_key in but_maps.items():
+        if not 0 <= button_player(btn) < PLAYER_COUNT:
+            print(f'Cannot map button {btn}, there are {PLAYER_COUNT} players')
+            continue
         # Release any existing DigitalInOut for ths button and remove the mapping
         release_button_mapping(btn)
         # Look up the Pin for the key matching btn
@@ -96,27 +343,117 @@ def set_button_mappings(but_maps: dict[int, str]) -> None:
         if None != pin:
             # Release any existing mapping for the new pin
             release_pin(pin)
-            # Create a DigitalInOut for the pin and map it
             pin_ios[pin] = btn
-            dio = DigitalInOut(pin)
-            dio.switch_to_input(Pull.UP)
+            if use_keypad:
+                # The pin will be scanned by keypad.Keys
+                dio = None
+                mark_button_keys_dirty()
+            else:
+                # Create a DigitalInOut for the pin and map it
+                dio = DigitalInOut(pin)
+                dio.switch_to_input(Pull.UP)
             print(f'Adding button mapping: {btn}->({pin}, {dio})')
+            stats.mapping_changes += 1
             button_dios[btn] = (pin, dio)
+            button_debouncer.reset(button_slot(btn))
+            continue
+        # Look up a shift register input for the key instead
+        sr_in = shift_register_ins.get(di_key)
+        if None != sr_in and sr_in[0] in sr_chains:
+            release_pin(sr_in)
+            sr_input = sr_chains[sr_in[0]].input(sr_in[1], btn)
+            pin_ios[sr_in] = btn
+            print(f'Adding button mapping: {btn}->({sr_in}, {sr_input})')
+            stats.mapping_changes += 1
+            button_srs[btn] = (sr_in, sr_input)
 
 def release_button_mapping(btn: int):
     """
     Remove a button mapping and release the underlying DigitalInOut for Pin reuse
     """
     global button_dios, pin_ios
+    if btn in button_srs:
+        sr_in, sr_input = button_srs.pop(btn)
+        print(f'Removing existing button mapping: {btn}->({sr_in}, {sr_input})')
+        stats.mapping_changes += 1
+        sr_input.deinit()
+        pin_ios.pop(sr_in)
+        player_buttons.release(btn)
+        return
     try:
         pin, dio = button_dios.get(btn)
         print(f'Removing existing button mapping: {btn}->({pin}, {dio})')
+        stats.mapping_changes += 1
         button_dios.pop(btn)
-        dio.deinit()
+        if use_keypad:
+            mark_button_keys_dirty()
+        else:
+            dio.deinit()
         pin_ios.pop(pin)
+        player_buttons.release(btn)
     except:
         pass
 
+def mark_button_keys_dirty():
+    """
+    Update the keypad.Keys scanning the button pins to the new button mappings
+    in the next update_buttons_from_keypad()
+    """
+    global button_keys_dirty
+    button_keys_dirty = True
+
+def release_button_keys_pins(*pins):
+    """
+    Release the keypad.Keys if it scans any of these pins, so they can be used by another input
+    """
+    global button_keys
+    if None == button_keys:
+        return
+    for pin in pins:
+        if pin in button_key_pins:
+            button_keys.deinit()
+            button_keys = None
+            return
+
+def rebuild_button_keys():
+    """
+    Make the keypad.Keys scan all the mapped button pins. The keypad.Keys is only replaced
+    if the set of pins has changed. Buttons on pins which are still scanned keep their state.
+    """
+    global button_keys, button_keys_dirty, unconfirmed_keys, button_keys_created_ns
+    button_keys_dirty = False
+    pins = [button_dios[btn][0] for btn in button_dios]
+    if None != button_keys and len(pins) == len(button_key_pins) and all(pin in button_key_pins for pin in pins):
+        # Same pins, so keep the keypad.Keys (with its queued events) & just update the button of each key
+        for key in range(len(button_key_pins)):
+            button_key_btns[key] = pin_ios[button_key_pins[key]]
+            player_buttons.set(button_key_btns[key], button_key_pressed[key])
+        return
+    was_pressed = { button_key_pins[key]: button_key_pressed[key] for key in range(len(button_key_pins)) }
+    if None != button_keys:
+        button_keys.deinit()
+        button_keys = None
+    key_reader.clear()
+    unconfirmed_keys = 0
+    button_key_btns.clear()
+    button_key_pins.clear()
+    button_key_pressed.clear()
+    for btn in button_dios:
+        pin = button_dios[btn][0]
+        pressed = was_pressed.get(pin, False)
+        if pressed:
+            # Held through the rebuild: stays pressed until the new keypad.Keys has had time to scan it
+            unconfirmed_keys |= 1 << len(button_key_btns)
+        player_buttons.set(btn, pressed)
+        button_key_btns.append(btn)
+        button_key_pins.append(pin)
+        button_key_pressed.append(pressed)
+    if len(pins) > 0:
+        # Pins are pulled up, so a pressed button reads False
+        button_keys = keypad.Keys(tuple(button_key_pins), value_when_pressed=False, pull=True,
+                                  interval=KEYPAD_SCAN_INTERVAL_MS / 1000)
+        button_keys_created_ns = monotonic_ns()
+
 def set_rotary_encoder_mappings(rot_enc_maps: dict[str: (str, str, int, int)]):
     """
     Add a rotary encoder on digital inputs, and configure the increment and
@@ -126,12 +463,13 @@ def set_rotary_encoder_mappings(rot_enc_maps: dict[str: (str, str, int, int)]):
     and all DigitalInOuts already in use will be deinit() 
     Also, any other button mappings on the CLK/DT DIOs will be removed
     before being passed to rotaryio.IncrementalEncoder which will re-initialize them.
-
-    Rotary encoder support is not (yet) supported via the serial interface.    
     """
 
     global rotary_encoders, pin_ios
     for rot_enc_id, (dio_clk, dio_dt, btn_dec, btn_inc) in rot_enc_maps.items():
+        if not (0 <= button_player(btn_dec) < PLAYER_COUNT and 0 <= button_player(btn_inc) < PLAYER_COUNT):
+            print(f'Cannot map rotary encoder {rot_enc_id} to buttons {btn_dec}, {btn_inc}, there are {PLAYER_COUNT} players')
+            continue
         # Release any existing rotary encoder mapped to these buttons
         release_rotary_encoder_mapping(rot_enc_id)
         # Lookup the requested pins
@@ -139,15 +477,18 @@ def set_rotary_encoder_mappings(rot_enc_maps: dict[str: (str, str, int, int)]):
         pin_dt= digital_ins.get(dio_dt)
         if None == pin_clk or None == pin_dt:
             print(f'Insufficient pins to add IncrementalEncoder on {dio_clk}={pin_clk}, {dio_dt}={pin_dt}. Check digital_ins mappings')
-            return
+            continue
         # Release any button mappings and DigitalInOut resources using the requested pins
         release_pin(pin_clk)
         release_pin(pin_dt)
         # Add the rotary encoder
+        release_button_keys_pins(pin_clk, pin_dt)
         encoder = IncrementalEncoder(pin_clk, pin_dt)
         print(f'Adding rotary encoder mapping: {rot_enc_id}->({pin_clk}, {pin_dt}, {btn_dec}, {btn_inc}, {encoder})')
+        stats.mapping_changes += 1
         rotary_encoders[rot_enc_id] = (pin_clk, pin_dt, btn_dec, btn_inc, encoder)
         rotary_encoder_values[rot_enc_id] = encoder.position
+        rotary_encoder_pulses[rot_enc_id] = [0, None, 0, 0]
         pin_ios[pin_clk] = rot_enc_id
         pin_ios[pin_dt] = rot_enc_id
 
@@ -159,8 +500,12 @@ def release_rotary_encoder_mapping(rot_enc_id:str):
     try:
         pin_clk, pin_dt, but_dec, but_inc, encoder = rotary_encoders.get(rot_enc_id)
         print(f'Removing existing rotary encoder mapping: {rot_enc_id}->({pin_clk}, {pin_dt}, {but_dec}, {but_inc}, {encoder})')
+        stats.mapping_changes += 1
         rotary_encoders.pop(rot_enc_id)
         rotary_encoder_values.pop(rot_enc_id)
+        pulse = rotary_encoder_pulses.pop(rot_enc_id)
+        if None != pulse[ROT_ENC_PRESSED]:
+            player_buttons.release(pulse[ROT_ENC_PRESSED])
         encoder.deinit()
         pin_ios.pop(pin_clk)
         pin_ios.pop(pin_dt)
@@ -170,63 +515,103 @@ def release_rotary_encoder_mapping(rot_enc_id:str):
 
 def update_gamepad_axis_from_adc():
     # Read analog inputs
-    for axis, (_, analog_in) in joystick_ais.items():
-        gamepad_axes_values[axis] = range_map(analog_in.value, 0, 65535, -32767, 32767)
-
-# 'Hold START for shutdown' feature handling
-start_button_down = None
-power_cmd_sent = False
+    for axis in joystick_ais:
+        player, player_axis = AXIS_TARGETS[axis]
+        player_axes_values[player][player_axis] = axis_filters[axis].update(joystick_ais[axis][1])
 
-def check_start_button_held_for_shutdown(pressed : bool):
-    global start_button_down
-    global power_cmd_sent
-
-    if pressed:
-        if None == start_button_down:
-            start_button_down = datetime.now()
-        else:
-            start_button_held = datetime.now() - start_button_down
-            if start_button_held.seconds >= START_BUTTON_HOLD_FOR_SHUTDOWN_SECS and not power_cmd_sent:
-                # Initiate system shutdown
-                print(f'Start button held for {start_button_held.seconds} seconds. Sending KEY_POWER code')
-                cc.send(CC_POWER_CODE)
-                power_cmd_sent = True
-    else:
-        start_button_down = None
-        power_cmd_sent = False
+# Note: the update_* functions below are called every main loop iteration.
+# They iterate mapping dict keys & index the dicts rather than using items(),
+# which would allocate a new tuple per entry on every call.
 
 def update_buttons_from_digital_inputs():
-    # Read buttons
-    global pressed_buttons
+    # Read & debounce buttons
+    now = monotonic_ns()
+    for btn in button_dios:
+        player_buttons.set(btn, button_debouncer.update(button_slot(btn), not button_dios[btn][1].value, now))
 
-    for btn, (_, dio) in button_dios.items():
-        btn_pressed = not dio.value
-        if btn_pressed:
-            pressed_buttons.add(btn)
-        else:
-            pressed_buttons.discard(btn)
-        if BUTTON_START == btn:
-            # handle 'Hold start btn for shutdown'
-            check_start_button_held_for_shutdown(btn_pressed)
+def apply_button_key(key: int, pressed: bool):
+    button_key_pressed[key] = pressed
+    player_buttons.set(button_key_btns[key], pressed)
+
+def update_buttons_from_keypad():
+    # Apply queued button press/release events from the background keypad scan.
+    # Each key changes at most once per iteration, so a press & release queued together are both reported.
+    global unconfirmed_keys
+    if button_keys_dirty:
+        rebuild_button_keys()
+    if None == button_keys:
+        return
+    events = button_keys.events
+    if events.overflowed:
+        # Events were lost, resynchronise with the current state of every key
+        print('Button event queue overflowed, resynchronising')
+        events.clear()
+        key_reader.clear()
+        unconfirmed_keys = 0
+        for key in range(len(button_key_btns)):
+            button_key_pressed[key] = False
+            player_buttons.release(button_key_btns[key])
+        button_keys.reset()
+    unconfirmed_keys &= ~key_reader.read(events, apply_button_key)
+    # Only once the queue has been emptied can a key held through a rebuild be known to be released
+    if 0 != unconfirmed_keys and key_reader.deferred_key < 0 and monotonic_ns() - button_keys_created_ns > 2 * KEYPAD_SCAN_INTERVAL_MS * 1_000_000:
+        # Keys held before the keypad.Keys was rebuilt which it has not reported pressed were released meanwhile
+        for key in range(len(button_key_btns)):
+            if unconfirmed_keys & (1 << key):
+                button_key_pressed[key] = False
+                player_buttons.release(button_key_btns[key])
+        unconfirmed_keys = 0
 
 def update_rotary_encoders():
-    global pressed_buttons
-    for rot_enc_id, (_, _, btn_dec, btn_inc, encoder) in rotary_encoders.items():
-        pressed_buttons.discard(btn_dec)
-        pressed_buttons.discard(btn_inc)
+    # Queue steps read from the encoders & deliver them as paced button press/release pulses
+    now = monotonic_ns()
+    for rot_enc_id in rotary_encoders:
+        _, _, btn_dec, btn_inc, encoder = rotary_encoders[rot_enc_id]
+        pulse = rotary_encoder_pulses[rot_enc_id]
         current_val = encoder.position
-        last_val = rotary_encoder_values[rot_enc_id]
-        diff = current_val - last_val
-        if diff < 0:
-            # press decrement button
-            pressed_buttons.add(btn_dec)
-        elif diff > 0:
-            # press increment button
-            pressed_buttons.add(btn_inc)
-        rotary_encoder_values[rot_enc_id] = current_val
+        diff = current_val - rotary_encoder_values[rot_enc_id]
+        if diff != 0:
+            rotary_encoder_values[rot_enc_id] = current_val
+            if now - pulse[ROT_ENC_LAST_NS] < ROTARY_ENCODER_ACCEL_MS * 1_000_000:
+                diff *= ROTARY_ENCODER_ACCEL_FACTOR
+            pulse[ROT_ENC_LAST_NS] = now
+            pending = pulse[ROT_ENC_PENDING]
+            if (pending < 0 < diff) or (diff < 0 < pending):
+                # Changed direction, drop steps still queued for the old direction
+                pending = 0
+            pulse[ROT_ENC_PENDING] = clamp(pending + diff, -ROTARY_ENCODER_MAX_PENDING, ROTARY_ENCODER_MAX_PENDING)
+        if now < pulse[ROT_ENC_NEXT_NS]:
+            continue
+        if None != pulse[ROT_ENC_PRESSED]:
+            # End of a step's press
+            player_buttons.release(pulse[ROT_ENC_PRESSED])
+            pulse[ROT_ENC_PRESSED] = None
+            pulse[ROT_ENC_NEXT_NS] = now + ROTARY_ENCODER_RELEASE_MS * 1_000_000
+        elif pulse[ROT_ENC_PENDING] != 0:
+            # Start the next step's press
+            if pulse[ROT_ENC_PENDING] > 0:
+                btn = btn_inc
+                pulse[ROT_ENC_PENDING] -= 1
+            else:
+                btn = btn_dec
+                pulse[ROT_ENC_PENDING] += 1
+            player_buttons.press(btn)
+            pulse[ROT_ENC_PRESSED] = btn
+            pulse[ROT_ENC_NEXT_NS] = now + ROTARY_ENCODER_PRESS_MS * 1_000_000
+
+def update_expanders():
+    # Apply shift register button events & step analog mux scans
+    for chain_id in sr_chains:
+        sr_chains[chain_id].scan(player_buttons)
+    for mux_id in muxes:
+        muxes[mux_id].scan()
 
 def update_all():
+    update_expanders()
     update_gamepad_axis_from_adc()
-    update_buttons_from_digital_inputs()
+    if use_keypad:
+        update_buttons_from_keypad()
+    else:
+        update_buttons_from_digital_inputs()
     update_rotary_encoders()
    
\ No newline at end of file
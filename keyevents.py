@@ -0,0 +1,48 @@
+try:
+    import keypad
+except ImportError:
+    keypad = None
+
+class KeyEventReader:
+    """
+    Applies the press/release events queued by a keypad scanner (e.g. keypad.Keys) once per main loop iteration.
+
+    Each key changes at most once per read(), so that a press & release queued together are both
+    reported: a key's second change, and the events queued after it, are left until the next read().
+    """
+
+    def __init__(self):
+        # Reused for reading events without allocating
+        self._event = keypad.Event()
+        # A key's second change since the last read(), held back for the next read() (-1 if none)
+        self.deferred_key = -1
+        self._deferred_pressed = False
+
+    def clear(self):
+        """
+        Forget any held back change, e.g. when the scanner is reset or replaced
+        """
+        self.deferred_key = -1
+
+    def read(self, events, apply) -> int:
+        """
+        Call apply(key_number, pressed) for the changes queued in a keypad.EventQueue.
+        Returns the keys changed as a bitmask (bit N == key N).
+        """
+        # Bit N set if key N has changed in this call
+        changed = 0
+        if self.deferred_key >= 0:
+            changed = 1 << self.deferred_key
+            apply(self.deferred_key, self._deferred_pressed)
+            self.deferred_key = -1
+        event = self._event
+        while events.get_into(event):
+            key = event.key_number
+            if changed & (1 << key):
+                # Leave this change & the rest of the queue until the first change has been reported
+                self.deferred_key = key
+                self._deferred_pressed = event.pressed
+                return changed
+            changed |= 1 << key
+            apply(key, event.pressed)
+        return changed
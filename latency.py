@@ -0,0 +1,48 @@
+"""
+End-to-end latency probes.
+
+The 'ping={seq}' serial command is answered on the data CDC channel, once the main loop
+iteration which processed it has sent its reports, with:
+
+    ping={seq} rx_ns={rx} parse_ns={parse} report_ns={report}
+
+where each time is the board's time.monotonic_ns() when:
+
+    rx      the bytes completing the command were read from usb_cdc.data
+    parse   the command was decoded
+    report  the first gamepad report of that iteration was sent (send_report() returned),
+            or 0 if no report was sent
+
+Combined with inputs in the same command (e.g. 'ping=7;btn11=1;hold=0.02;post=0;overlap=1')
+report is when the probe's input change was sent to the host. See tools/latency_probe.py.
+"""
+
+from time import monotonic_ns
+
+import serial
+
+# Probes processed this main loop iteration: (seq, rx_ns, parse_ns)
+pending: list = []
+# Time of the first gamepad report sent since the pending probes were parsed, 0 if none
+report_ns = 0
+
+def ping(seq: int):
+    pending.append((seq, serial.rx_ns, monotonic_ns()))
+
+def report_sent():
+    """
+    Call when a gamepad report has been sent while probes are pending
+    """
+    global report_ns
+    if 0 == report_ns:
+        report_ns = monotonic_ns()
+
+def reply():
+    """
+    Answer the pending probes. Call at the end of each main loop iteration, after report().
+    """
+    global report_ns
+    for seq, rx_ns, parse_ns in pending:
+        serial.write_line(f'ping={seq} rx_ns={rx_ns} parse_ns={parse_ns} report_ns={report_ns}')
+    pending.clear()
+    report_ns = 0
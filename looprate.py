@@ -0,0 +1,121 @@
+"""
+Fixed rate main loop pacing & iteration timing statistics.
+
+Call begin() at the start of each main loop iteration and end() at the end.
+end() waits until the next iteration deadline, so iterations start at a steady rate.
+An iteration that runs past its deadline is counted as an overrun and
+the following deadlines are re-aligned to the end of the slow iteration.
+The longest iteration is also tracked per WINDOW_NS window, to give a rolling maximum.
+"""
+
+from time import monotonic_ns, sleep
+
+import stats
+
+# Upper bounds (in microseconds) of the iteration time histogram buckets.
+# A final bucket counts iterations longer than the last bound.
+HIST_BOUNDS_US = (250, 500, 1000, 2000, 4000, 8000)
+
+# Remaining waits longer than this are slept rather than busy-waited
+SLEEP_THRESHOLD_NS = 2_000_000
+# Length of the rolling maximum iteration time windows
+WINDOW_NS = 1_000_000_000
+
+rate_hz = 0
+period_ns = 0
+deadline_ns = 0
+iter_start_ns = 0
+# Statistics
+iterations = 0
+overruns = 0
+iter_min_ns = 0
+iter_max_ns = 0
+iter_total_ns = 0
+histogram = [0] * (len(HIST_BOUNDS_US) + 1)
+# Longest iteration in the current & the previous window, and the end of the current window
+window_max_ns = 0
+prev_window_max_ns = 0
+window_end_ns = 0
+
+def set_rate(hz: int):
+    """
+    Set the main loop rate in Hz. 0 runs the loop as fast as possible.
+    """
+    global rate_hz, period_ns, deadline_ns
+    rate_hz = max(0, hz)
+    period_ns = 1_000_000_000 // rate_hz if rate_hz > 0 else 0
+    deadline_ns = monotonic_ns() + period_ns
+    print(f'Main loop rate: {rate_hz} Hz')
+
+def reset_stats():
+    global iterations, overruns, iter_min_ns, iter_max_ns, iter_total_ns, window_max_ns, prev_window_max_ns
+    iterations = 0
+    overruns = 0
+    iter_min_ns = 0
+    iter_max_ns = 0
+    iter_total_ns = 0
+    for i in range(len(histogram)):
+        histogram[i] = 0
+    window_max_ns = 0
+    prev_window_max_ns = 0
+
+def begin():
+    """
+    Mark the start of a main loop iteration
+    """
+    global iter_start_ns
+    iter_start_ns = monotonic_ns()
+
+def end():
+    """
+    Mark the end of a main loop iteration, record its timing and wait for the next deadline
+    """
+    global iterations, overruns, iter_min_ns, iter_max_ns, iter_total_ns, deadline_ns
+    global window_max_ns, prev_window_max_ns, window_end_ns
+    now = monotonic_ns()
+    elapsed = now - iter_start_ns
+    # Record iteration time
+    iterations += 1
+    iter_total_ns += elapsed
+    if elapsed > iter_max_ns:
+        iter_max_ns = elapsed
+    if elapsed < iter_min_ns or iterations == 1:
+        iter_min_ns = elapsed
+    elapsed_us = elapsed // 1000
+    bucket = 0
+    for bound in HIST_BOUNDS_US:
+        if elapsed_us < bound:
+            break
+        bucket += 1
+    histogram[bucket] += 1
+    if elapsed > window_max_ns:
+        window_max_ns = elapsed
+    if now >= window_end_ns:
+        prev_window_max_ns = window_max_ns
+        window_max_ns = 0
+        window_end_ns = now + WINDOW_NS
+        stats.sample_heap()
+    # Pace the loop
+    if period_ns == 0:
+        return
+    if now >= deadline_ns:
+        overruns += 1
+        deadline_ns = now + period_ns
+        return
+    remaining = deadline_ns - now
+    if remaining > SLEEP_THRESHOLD_NS:
+        # sleep() is coarse, so leave the last part of the wait to the busy-wait below
+        sleep((remaining - SLEEP_THRESHOLD_NS // 2) / 1_000_000_000)
+    while monotonic_ns() < deadline_ns:
+        pass
+    deadline_ns += period_ns
+
+def format_stats() -> str:
+    """
+    Single line summary of the loop statistics, times in microseconds
+    """
+    mean_us = iter_total_ns // iterations // 1000 if iterations > 0 else 0
+    hist = ','.join(str(count) for count in histogram)
+    return (f'rate={rate_hz} iters={iterations} overruns={overruns} '
+            f'min_us={iter_min_ns // 1000} mean_us={mean_us} max_us={iter_max_ns // 1000} '
+            f'max1s_us={max(window_max_ns, prev_window_max_ns) // 1000} hist={hist}')
@@ -0,0 +1,169 @@
+"""
+Named macros: sequences of synthesized inputs compiled once into compact step arrays.
+
+Macros are defined as a list of step dicts, with these (optional) keys:
+
+    'btns'              tuple of button IDs to press (gamepad or consumer control)
+    'x','y','z','r_z'   joystick axes values
+    'hold'              time in ms to hold the inputs, default 500
+    'pre'               time in ms to wait before the inputs, default 0
+    'post'              time in ms to wait after the inputs, default 500
+
+Each step is packed into a bytearray as STEP_FORMAT:
+
+    uint16  gamepad buttons mask (bit N == button N)
+    uint8   consumer control buttons mask (see buttons.ButtonState)
+    uint8   axes mask (bit N == AXES[N] is set by this step)
+    int16   x, y, z, r_z joystick axes
+    uint16  hold, pre, post times in milliseconds
+
+Playing a macro schedules its steps (see scheduler.py) without any parsing.
+"""
+
+import struct
+
+import scheduler
+from buttons import ButtonState
+from utils import clamp
+from config import *
+
+STEP_FORMAT = '<HBBhhhhHHH'
+STEP_SIZE = struct.calcsize(STEP_FORMAT)
+AXES = ('x', 'y', 'z', 'r_z')
+
+# Serial commands which are checked before macro names (see serial.process_line), so cannot be macro names
+RESERVED_NAMES = ('mode=bin', 'stats', 'stats_reset', 'stream_end')
+
+# The registered macros: name -> compiled steps
+macros: dict[str, bytearray] = {}
+
+def compile_macro(steps: list) -> bytearray:
+    """
+    Compile a list of step dicts into a packed step array.
+    Raises ValueError for an invalid step.
+    """
+    compiled = bytearray(STEP_SIZE * len(steps))
+    buttons = ButtonState()
+    for i, step in enumerate(steps):
+        buttons.clear()
+        for btn in step.get('btns', ()):
+            buttons.press(btn)
+            if not buttons.is_pressed(btn):
+                raise ValueError(f'Unknown button {btn}')
+        axes_mask = 0
+        axes_values = [0, 0, 0, 0]
+        for a, axis in enumerate(AXES):
+            if axis in step:
+                axes_mask |= 1 << a
+                axes_values[a] = clamp(int(step[axis]), -32767, 32767)
+        struct.pack_into(STEP_FORMAT, compiled, i * STEP_SIZE,
+                         buttons.gamepad, buttons.cc, axes_mask, *axes_values,
+                         step.get('hold', 500), step.get('pre', 0), step.get('post', 500))
+    return compiled
+
+def register_macro(name: str, steps: list):
+    """
+    Compile & register a macro, replacing any existing macro with the same name
+    """
+    if name in RESERVED_NAMES:
+        print(f'Cannot register macro {name}: the name is a built-in command')
+        return
+    try:
+        macros[name] = compile_macro(steps)
+    except Exception as e:
+        print(f'Error compiling macro {name}: {e}')
+
+def play_macro(name: str) -> bool:
+    """
+    Schedule the steps of a registered macro.
+    Returns False if there is no such macro, or no room in the scheduler for all its steps.
+    """
+    compiled = macros.get(name)
+    if None == compiled:
+        return False
+    if not scheduler.has_room(len(compiled) // STEP_SIZE):
+        print(f'Command queue full, not playing macro {name}')
+        return False
+    print(f'Playing macro {name}')
+    for offset in range(0, len(compiled), STEP_SIZE):
+        gamepad, cc, axes_mask, x, y, z, r_z, hold_ms, pre_ms, post_ms = struct.unpack_from(STEP_FORMAT, compiled, offset)
+        buttons = ButtonState()
+        buttons.gamepad = gamepad
+        buttons.cc = cc
+        axes = {}
+        if axes_mask & 0x1:
+            axes['x'] = x
+        if axes_mask & 0x2:
+            axes['y'] = y
+        if axes_mask & 0x4:
+            axes['z'] = z
+        if axes_mask & 0x8:
+            axes['r_z'] = r_z
+        scheduler.schedule_command(scheduler.TimedCommand(buttons, axes),
+                                   pre_ms * 1_000_000, hold_ms * 1_000_000, post_ms * 1_000_000)
+    return True
+
+# EmulationStation 'Configure Input'
+CONF_ES_STEPS = [
+    { 'btns' : (BUTTON_SELECT,), 'hold' : 3000, 'post' : 1000 },  # Initial 'hold any button'
+    { 'btns' : (BUTTON_HAT_UP,),        'post' : 1000 },
+    { 'btns' : (BUTTON_HAT_DOWN,),      'post' : 1000 },
+    { 'btns' : (BUTTON_HAT_LEFT,),      'post' : 1000 },
+    { 'btns' : (BUTTON_HAT_RIGHT,),     'post' : 1000 },
+    { 'btns' : (BUTTON_START,),         'post' : 1000 },
+    { 'btns' : (BUTTON_SELECT,),        'post' : 1000 },
+    { 'btns' : (BUTTON_EAST_A,),        'post' : 1000 },
+    { 'btns' : (BUTTON_SOUTH_B,),       'post' : 1000 },
+    { 'btns' : (BUTTON_NORTH_X,),       'post' : 1000 },
+    { 'btns' : (BUTTON_WEST_Y,),        'post' : 1000 },
+    { 'btns' : (BUTTON_SHOULDER_L,),    'post' : 1000 },
+    { 'btns' : (BUTTON_SHOULDER_R,),    'post' : 1000 },
+    { 'btns' : (BUTTON_TRIGGER_L,),     'post' : 1000 },
+    { 'btns' : (BUTTON_TRIGGER_R,),     'post' : 1000 },
+    { 'btns' : (BUTTON_THUMB_L,),       'post' : 1000 },
+    { 'btns' : (BUTTON_THUMB_R,),       'post' : 1000 },
+    { 'y'    : -32767,                  'post' : 1000 },
+    { 'y'    :  32767,                  'post' : 1000 },
+    { 'x'    : -32767,                  'post' : 1000 },
+    { 'x'    :  32767,                  'post' : 1000 },
+    { 'r_z'  : -32767,                  'post' : 1000 },
+    { 'r_z'  :  32767,                  'post' : 1000 },
+    { 'z'    : -32767,                  'post' : 1000 },
+    { 'z'    :  32767,                  'post' : 1000 },
+    { 'btns' : (BUTTON_SELECT,),        'post' : 1000 },  # Hotkey
+    { 'btns' : (BUTTON_EAST_A,) },                        # 'OK' / Finish
+]
+
+# RetroArch 'Set All Controls'
+CONF_RA_STEPS = [
+    { 'btns' : (BUTTON_SOUTH_B,) },
+    { 'btns' : (BUTTON_WEST_Y,) },
+    { 'btns' : (BUTTON_SELECT,) },
+    { 'btns' : (BUTTON_START,) },
+    { 'btns' : (BUTTON_HAT_UP,) },
+    { 'btns' : (BUTTON_HAT_DOWN,) },
+    { 'btns' : (BUTTON_HAT_LEFT,) },
+    { 'btns' : (BUTTON_HAT_RIGHT,) },
+    { 'btns' : (BUTTON_EAST_A,) },
+    { 'btns' : (BUTTON_NORTH_X,) },
+    { 'btns' : (BUTTON_SHOULDER_L,) },
+    { 'btns' : (BUTTON_SHOULDER_R,) },
+    { 'btns' : (BUTTON_TRIGGER_L,) },
+    { 'btns' : (BUTTON_TRIGGER_R,) },
+    { 'btns' : (BUTTON_THUMB_L,) },
+    { 'btns' : (BUTTON_THUMB_R,) },
+    { 'x'    :  32767 },
+    { 'x'    : -32767 },
+    { 'y'    :  32767 },
+    { 'y'    : -32767 },
+    { 'z'    :  32767 },
+    { 'z'    : -32767 },
+    { 'r_z'  :  32767 },
+    { 'r_z'  : -32767 },
+]
+
+# Compile the built-in & user macros once, at import
+register_macro('conf_es', CONF_ES_STEPS)
+register_macro('conf_ra', CONF_RA_STEPS)
+for macro_name in user_macros:
+    register_macro(macro_name, user_macros[macro_name])
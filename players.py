@@ -0,0 +1,57 @@
+"""
+Multiple player support.
+
+Each player has its own gamepad (a report ID of the gamepad HID device, see boot.py),
+buttons & joystick axes. Player 1 uses the usual button IDs & axis names.
+Inputs of players 2, 3 ... are mapped using:
+
+* button IDs offset by PLAYER_BUTTON_BASE per player, e.g. PLAYER_BUTTON_BASE + BUTTON_START for player 2
+* axis names suffixed with the player number, e.g. 'x2', 'r_z2' for player 2
+"""
+
+from config import PLAYER_COUNT, PLAYER_BUTTON_BASE
+from buttons import ButtonState
+
+AXES = ('x', 'y', 'z', 'r_z')
+
+def axis_name(player: int, axis: str) -> str:
+    """
+    Name of a joystick axis of a player, numbered from 0
+    """
+    return axis if 0 == player else f'{axis}{player + 1}'
+
+# Joystick axis names of all players
+ALL_AXES = tuple(axis_name(player, axis) for player in range(PLAYER_COUNT) for axis in AXES)
+# Joystick axis name -> (player, axis)
+AXIS_TARGETS = { axis_name(player, axis): (player, axis) for player in range(PLAYER_COUNT) for axis in AXES }
+
+def button_player(btn: int) -> int:
+    """
+    Player (numbered from 0) of a button ID
+    """
+    return btn // PLAYER_BUTTON_BASE
+
+class PlayerButtons:
+    """
+    The ButtonStates of all players, addressed by button IDs including the player offset.
+    Otherwise used just like a ButtonState.
+    """
+
+    def __init__(self, states: list[ButtonState]):
+        self.states = states
+
+    def press(self, btn: int):
+        self.states[btn // PLAYER_BUTTON_BASE].press(btn % PLAYER_BUTTON_BASE)
+
+    def release(self, btn: int):
+        self.states[btn // PLAYER_BUTTON_BASE].release(btn % PLAYER_BUTTON_BASE)
+
+    def set(self, btn: int, pressed: bool):
+        self.states[btn // PLAYER_BUTTON_BASE].set(btn % PLAYER_BUTTON_BASE, pressed)
+
+    def is_pressed(self, btn: int) -> bool:
+        return self.states[btn // PLAYER_BUTTON_BASE].is_pressed(btn % PLAYER_BUTTON_BASE)
+
+    def clear(self):
+        for state in self.states:
+            state.clear()
@@ -0,0 +1,230 @@
+"""
+Mapping & calibration profiles stored in non-volatile memory (microcontroller.nvm)
+
+A profile is a dict with the same shapes as the defaults in config.py:
+
+    'buttons'       button ID -> digital input key        (see default_button_pins)
+    'joysticks'     axis -> analog input key               (see default_joystick_pins)
+    'encoders'      encoder ID -> (clk, dt, btn_dec, btn_inc) (see default_rotary_encoder_pins)
+    'filters'       axis -> (oversample, ema_shift, deadzone, hysteresis)
+    'calibrations'  axis -> (min, centre, max, invert)
+    'curves'        axis -> response curve
+
+NVM holds a directory header followed by PROFILE_SLOTS slots of PROFILE_SLOT_SIZE bytes:
+
+    directory   DIR_FORMAT: magic, version, boot slot (NO_SLOT if none)
+    slot        SLOT_FORMAT: magic, version, body length, CRC-32 of the body
+                followed by the body
+
+The body is packed little-endian as:
+
+    per axis (players.ALL_AXES order):  str analog input key ('' if unmapped)
+                            uint16 oversample, uint8 ema_shift, uint16 deadzone, uint16 hysteresis
+                            uint16 min, centre, max, uint8 invert
+                            uint8 curve kind, then for CURVE_EXPO uint8 k,
+                            for CURVE_POINTS uint8 count & count int16 (in, out) pairs
+    uint8 button count,  per button:    uint16 button ID, str digital input key
+    uint8 encoder count, per encoder:   str encoder ID, str clk key, str dt key, uint16 btn_dec, uint16 btn_inc
+
+where each str is a uint8 length followed by that many ASCII bytes.
+A profile saved with a different PLAYER_COUNT has a different number of axes, so is rejected as malformed.
+"""
+
+import struct
+from binascii import crc32
+from microcontroller import nvm
+
+from config import PROFILE_NVM_OFFSET, PROFILE_SLOTS, PROFILE_SLOT_SIZE
+from players import ALL_AXES
+
+PROFILE_VERSION = 1
+DIR_MAGIC = b'TGPD'
+DIR_FORMAT = '<4sBB'
+DIR_SIZE = struct.calcsize(DIR_FORMAT)
+SLOT_MAGIC = b'TGPP'
+SLOT_FORMAT = '<4sBHI'
+SLOT_HEADER_SIZE = struct.calcsize(SLOT_FORMAT)
+NO_SLOT = 0xFF
+
+AXIS_FORMAT = '<HBHHHHHBB'
+CURVE_LINEAR = 0
+CURVE_EXPO = 1
+CURVE_POINTS = 2
+
+def pack_str(out: bytearray, s: str):
+    data = s.encode('ascii')
+    if len(data) > 255:
+        raise ValueError(f'String too long: {s}')
+    out.append(len(data))
+    out.extend(data)
+
+def unpack_str(buf, offset: int) -> (str, int):
+    n = buf[offset]
+    return str(buf[offset + 1:offset + 1 + n], 'ascii'), offset + 1 + n
+
+def encode(profile: dict) -> bytearray:
+    """
+    Pack a profile into a body. Raises ValueError if it cannot be represented.
+    """
+    out = bytearray()
+    for axis in ALL_AXES:
+        pack_str(out, profile['joysticks'].get(axis, ''))
+        oversample, ema_shift, deadzone, hysteresis = profile['filters'][axis]
+        cal_min, cal_centre, cal_max, invert = profile['calibrations'][axis]
+        curve = profile['curves'][axis]
+        if 'linear' == curve:
+            kind = CURVE_LINEAR
+        elif 'expo' == curve or (not isinstance(curve, str) and 'expo' == curve[0]):
+            kind = CURVE_EXPO
+        else:
+            kind = CURVE_POINTS
+        out.extend(struct.pack(AXIS_FORMAT, oversample, ema_shift, deadzone, hysteresis,
+                               cal_min, cal_centre, cal_max, 1 if invert else 0, kind))
+        if CURVE_EXPO == kind:
+            out.append(50 if isinstance(curve, str) else curve[1])
+        elif CURVE_POINTS == kind:
+            out.append(len(curve))
+            for point in curve:
+                out.extend(struct.pack('<hh', point[0], point[1]))
+    buttons = profile['buttons']
+    out.append(len(buttons))
+    for btn in buttons:
+        out.extend(struct.pack('<H', btn))
+        pack_str(out, buttons[btn])
+    encoders = profile['encoders']
+    out.append(len(encoders))
+    for enc_id in encoders:
+        dio_clk, dio_dt, btn_dec, btn_inc = encoders[enc_id]
+        pack_str(out, enc_id)
+        pack_str(out, dio_clk)
+        pack_str(out, dio_dt)
+        out.extend(struct.pack('<HH', btn_dec, btn_inc))
+    return out
+
+def decode(buf, offset: int, end: int) -> dict:
+    """
+    Unpack a profile body. Raises ValueError if it is malformed.
+    """
+    profile = { 'buttons': {}, 'joysticks': {}, 'encoders': {}, 'filters': {}, 'calibrations': {}, 'curves': {} }
+    try:
+        for axis in ALL_AXES:
+            key, offset = unpack_str(buf, offset)
+            if len(key) > 0:
+                profile['joysticks'][axis] = key
+            (oversample, ema_shift, deadzone, hysteresis,
+             cal_min, cal_centre, cal_max, invert, kind) = struct.unpack_from(AXIS_FORMAT, buf, offset)
+            offset += struct.calcsize(AXIS_FORMAT)
+            profile['filters'][axis] = (oversample, ema_shift, deadzone, hysteresis)
+            profile['calibrations'][axis] = (cal_min, cal_centre, cal_max, invert != 0)
+            if CURVE_LINEAR == kind:
+                profile['curves'][axis] = 'linear'
+            elif CURVE_EXPO == kind:
+                profile['curves'][axis] = ('expo', buf[offset])
+                offset += 1
+            elif CURVE_POINTS == kind:
+                count = buf[offset]
+                offset += 1
+                points = []
+                for _ in range(count):
+                    points.append(struct.unpack_from('<hh', buf, offset))
+                    offset += 4
+                profile['curves'][axis] = points
+            else:
+                raise ValueError(f'Unknown curve kind {kind}')
+        count = buf[offset]
+        offset += 1
+        for _ in range(count):
+            btn = struct.unpack_from('<H', buf, offset)[0]
+            profile['buttons'][btn], offset = unpack_str(buf, offset + 2)
+        count = buf[offset]
+        offset += 1
+        for _ in range(count):
+            enc_id, offset = unpack_str(buf, offset)
+            dio_clk, offset = unpack_str(buf, offset)
+            dio_dt, offset = unpack_str(buf, offset)
+            btn_dec, btn_inc = struct.unpack_from('<HH', buf, offset)
+            offset += 4
+            profile['encoders'][enc_id] = (dio_clk, dio_dt, btn_dec, btn_inc)
+    except Exception as e:
+        raise ValueError(f'Malformed profile: {e}')
+    if offset != end:
+        raise ValueError('Malformed profile: length mismatch')
+    return profile
+
+def slot_offset(slot: int) -> int:
+    if not 0 <= slot < PROFILE_SLOTS:
+        raise ValueError(f'Profile slot must be in range 0 to {PROFILE_SLOTS - 1}')
+    return PROFILE_NVM_OFFSET + DIR_SIZE + slot * PROFILE_SLOT_SIZE
+
+def save(slot: int, profile: dict):
+    """
+    Write a profile to a slot. Raises ValueError if the profile does not fit.
+    """
+    offset = slot_offset(slot)
+    try:
+        body = encode(profile)
+    except Exception as e:
+        raise ValueError(f'Cannot store profile: {e}')
+    if SLOT_HEADER_SIZE + len(body) > PROFILE_SLOT_SIZE:
+        raise ValueError(f'Profile is too large ({len(body)} bytes) for a slot')
+    header = struct.pack(SLOT_FORMAT, SLOT_MAGIC, PROFILE_VERSION, len(body), crc32(body))
+    # Write the whole slot at once, since each write to nvm may erase & rewrite flash
+    nvm[offset:offset + SLOT_HEADER_SIZE + len(body)] = header + body
+    print(f'Saved profile to slot {slot} ({len(body)} bytes)')
+
+def load(slot: int) -> dict:
+    """
+    Read the profile from a slot. Returns None if the slot is empty, invalid or from another version.
+    """
+    offset = slot_offset(slot)
+    header = nvm[offset:offset + SLOT_HEADER_SIZE]
+    magic, version, length, checksum = struct.unpack(SLOT_FORMAT, header)
+    if SLOT_MAGIC != magic:
+        print(f'No profile in slot {slot}')
+        return None
+    if PROFILE_VERSION != version:
+        print(f'Ignoring profile version {version} in slot {slot}, expected version {PROFILE_VERSION}')
+        return None
+    if SLOT_HEADER_SIZE + length > PROFILE_SLOT_SIZE:
+        print(f'Invalid profile length in slot {slot}')
+        return None
+    body = nvm[offset + SLOT_HEADER_SIZE:offset + SLOT_HEADER_SIZE + length]
+    if crc32(body) != checksum:
+        print(f'Profile checksum mismatch in slot {slot}')
+        return None
+    try:
+        return decode(body, 0, length)
+    except ValueError as ve:
+        print(f'Error reading profile in slot {slot}: {ve}')
+        return None
+
+def erase(slot: int):
+    offset = slot_offset(slot)
+    nvm[offset:offset + SLOT_HEADER_SIZE] = bytes(SLOT_HEADER_SIZE)
+    if boot_slot() == slot:
+        set_boot_slot(NO_SLOT)
+
+def boot_slot() -> int:
+    """
+    Return the slot of the profile applied at boot, or NO_SLOT for the defaults in config.py
+    """
+    magic, version, slot = struct.unpack(DIR_FORMAT, nvm[PROFILE_NVM_OFFSET:PROFILE_NVM_OFFSET + DIR_SIZE])
+    if DIR_MAGIC != magic or PROFILE_VERSION != version or slot >= PROFILE_SLOTS:
+        return NO_SLOT
+    return slot
+
+def set_boot_slot(slot: int):
+    if NO_SLOT != slot:
+        slot_offset(slot)
+    if boot_slot() != slot:
+        nvm[PROFILE_NVM_OFFSET:PROFILE_NVM_OFFSET + DIR_SIZE] = struct.pack(DIR_FORMAT, DIR_MAGIC, PROFILE_VERSION, slot)
+
+def load_boot_profile() -> dict:
+    """
+    Read the profile to apply at boot. Returns None to use the defaults in config.py
+    """
+    slot = boot_slot()
+    if NO_SLOT == slot:
+        return None
+    print(f'Loading boot profile from slot {slot}')
+    return load(slot)
@@ -0,0 +1,87 @@
+"""
+Compact binary framed command protocol.
+
+Every frame on the wire has this fixed layout:
+
+    offset  size  field
+    0       1     SYNC (0xA5)
+    1       1     LEN: number of bytes that follow, excluding the checksum
+    2       1     OPCODE
+    3       LEN-1 opcode payload
+    2+LEN   1     CHECKSUM: sum of LEN, OPCODE and payload bytes, modulo 256
+
+The OP_INPUT payload is packed little-endian as INPUT_FORMAT:
+    uint16  buttons mask (bit N == button N)
+    int16   x, y, z, r_z joystick axes
+    uint16  hold, pre, post times in milliseconds
+
+The OP_STREAM payload (see stream.py) is packed as STREAM_FORMAT:
+    uint16  sequence number
+    uint16  buttons mask
+    int16   x, y, z, r_z joystick axes
+
+The OP_STREAM_DELTA payload is packed as STREAM_DELTA_FORMAT:
+    uint16  sequence number
+    uint16  mask of buttons to press, then mask of buttons to release
+    int16   x, y, z, r_z joystick axes movements
+"""
+
+import struct
+
+SYNC = 0xA5
+
+# Opcodes
+OP_INPUT = 0x01     # Synthesize inputs, equivalent of a 'name=value;...' text command
+OP_TEXT = 0x02      # Leave binary mode and return to the text protocol
+OP_STREAM = 0x03    # Stream frame setting the whole streamed input state
+OP_STREAM_DELTA = 0x04  # Stream frame changing the streamed input state
+
+INPUT_FORMAT = '<HhhhhHHH'
+INPUT_SIZE = struct.calcsize(INPUT_FORMAT)
+STREAM_FORMAT = '<HHhhhh'
+STREAM_SIZE = struct.calcsize(STREAM_FORMAT)
+STREAM_DELTA_FORMAT = '<HHHhhhh'
+STREAM_DELTA_SIZE = struct.calcsize(STREAM_DELTA_FORMAT)
+
+# SYNC + LEN + OPCODE + largest payload + CHECKSUM
+MAX_FRAME_SIZE = 3 + INPUT_SIZE + 1
+
+def payload_size(opcode: int) -> int:
+    """
+    Return the payload size for a known opcode, or -1 if the opcode is not recognised
+    """
+    if opcode == OP_INPUT:
+        return INPUT_SIZE
+    if opcode == OP_TEXT:
+        return 0
+    if opcode == OP_STREAM:
+        return STREAM_SIZE
+    if opcode == OP_STREAM_DELTA:
+        return STREAM_DELTA_SIZE
+    return -1
+
+def checksum(buf, start: int, end: int) -> int:
+    """
+    8-bit additive checksum of buf[start:end]
+    """
+    total = 0
+    for i in range(start, end):
+        total += buf[i]
+    return total & 0xFF
+
+def encode_frame(opcode: int, *values) -> bytes:
+    """
+    Build a complete frame. Mainly useful to host-side tools & for testing.
+    """
+    if opcode == OP_INPUT:
+        payload = struct.pack(INPUT_FORMAT, *values)
+    elif opcode == OP_STREAM:
+        payload = struct.pack(STREAM_FORMAT, *values)
+    elif opcode == OP_STREAM_DELTA:
+        payload = struct.pack(STREAM_DELTA_FORMAT, *values)
+    else:
+        payload = b''
+    frame = bytearray((SYNC, len(payload) + 1, opcode))
+    frame += payload
+    frame.append(checksum(frame, 1, len(frame)))
+    return bytes(frame)
@@ -0,0 +1,226 @@
+"""
+Recording & exact-timing replay of the physical inputs.
+
+While recording, each change of the physical input state is appended to a
+preallocated buffer as a RECORD_FORMAT record:
+
+    uint32  time since the previous record in microseconds
+    uint16  gamepad buttons mask (bit N == button N)
+    uint8   consumer control buttons mask (see buttons.ButtonState)
+    int16   x, y, z, r_z joystick axes
+
+The first record holds the state when recording started.
+During replay the recorded state replaces the physical inputs, and each record
+is reported at its recorded time by busy-waiting for records due before the
+next main loop iteration.
+
+Recordings can be dumped over the serial interface as 'rec_data={hex}' lines,
+which can be sent back verbatim to upload a recording.
+"""
+
+import struct
+from binascii import hexlify, unhexlify
+from time import monotonic_ns
+
+from globals import pressed_buttons, gamepad_axes_values
+from config import RECORDING_BUFFER_SIZE, RECORDING_FILE, RECORDING_AUTOSAVE
+from report import report
+import looprate
+import serial
+
+RECORD_FORMAT = '<IHBhhhh'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+# Recording bytes per 'rec_data' line when dumping
+DUMP_CHUNK_SIZE = 64
+
+rec_buf = bytearray(RECORDING_BUFFER_SIZE - RECORDING_BUFFER_SIZE % RECORD_SIZE)
+rec_len = 0
+recording = False
+playing = False
+looping = False
+# Recording: time of the last record, as recorded (i.e. rounded to whole microseconds)
+last_ns = 0
+# Recording: the last recorded state
+last_gamepad = 0
+last_cc = 0
+last_x = 0
+last_y = 0
+last_z = 0
+last_r_z = 0
+# Replay: offset of the next record & the time it is due
+play_offset = 0
+play_due_ns = 0
+# Replay: the physical input state to restore when replay finishes
+saved_state = None
+
+def start_recording():
+    global rec_len, recording, last_ns
+    stop_playback()
+    print('Recording inputs')
+    rec_len = 0
+    recording = True
+    last_ns = monotonic_ns()
+    append_record(0)
+
+def stop_recording():
+    global recording
+    if recording:
+        recording = False
+        print(f'Recorded {rec_len // RECORD_SIZE} input changes')
+        if RECORDING_AUTOSAVE:
+            save()
+
+def append_record(delta_us: int):
+    global rec_len, last_gamepad, last_cc, last_x, last_y, last_z, last_r_z
+    if rec_len + RECORD_SIZE > len(rec_buf):
+        print('Recording buffer full')
+        stop_recording()
+        return
+    last_gamepad = pressed_buttons.gamepad
+    last_cc = pressed_buttons.cc
+    last_x = gamepad_axes_values['x']
+    last_y = gamepad_axes_values['y']
+    last_z = gamepad_axes_values['z']
+    last_r_z = gamepad_axes_values['r_z']
+    struct.pack_into(RECORD_FORMAT, rec_buf, rec_len, delta_us,
+                     last_gamepad, last_cc, last_x, last_y, last_z, last_r_z)
+    rec_len += RECORD_SIZE
+
+def record():
+    """
+    Record the physical input state if it has changed. Call once per main loop iteration, after reading the inputs.
+    """
+    global last_ns
+    if not recording:
+        return
+    if (pressed_buttons.gamepad == last_gamepad and pressed_buttons.cc == last_cc
+            and gamepad_axes_values['x'] == last_x and gamepad_axes_values['y'] == last_y
+            and gamepad_axes_values['z'] == last_z and gamepad_axes_values['r_z'] == last_r_z):
+        return
+    delta_us = min((monotonic_ns() - last_ns) // 1000, 0xFFFFFFFF)
+    # Accumulate whole microseconds so rounding errors don't drift over a long recording
+    last_ns += delta_us * 1000
+    append_record(delta_us)
+
+def start_playback(loop: bool = False):
+    global playing, looping, play_offset, play_due_ns, saved_state
+    stop_recording()
+    if 0 == rec_len or 0 != rec_len % RECORD_SIZE:
+        print(f'No valid recording to replay ({rec_len} bytes)')
+        return
+    if loop and 0 == duration_us():
+        # Looping would replay the whole recording over & over without time passing
+        print('Recording has no duration, replaying it once')
+        loop = False
+    if not playing:
+        saved_state = (pressed_buttons.gamepad, pressed_buttons.cc, gamepad_axes_values['x'],
+                       gamepad_axes_values['y'], gamepad_axes_values['z'], gamepad_axes_values['r_z'])
+    print(f'Replaying {rec_len // RECORD_SIZE} input changes')
+    playing = True
+    looping = loop
+    play_offset = 0
+    play_due_ns = monotonic_ns()
+
+def duration_us() -> int:
+    """
+    Total of the recorded times between records, i.e. the time taken by one pass of a looped replay
+    """
+    total = 0
+    for offset in range(0, rec_len, RECORD_SIZE):
+        total += struct.unpack_from('<I', rec_buf, offset)[0]
+    return total
+
+def stop_playback():
+    global playing
+    if not playing:
+        return
+    playing = False
+    # Restore the physical input state from before replay. Input changes since are applied from the next loop.
+    (pressed_buttons.gamepad, pressed_buttons.cc, gamepad_axes_values['x'],
+     gamepad_axes_values['y'], gamepad_axes_values['z'], gamepad_axes_values['r_z']) = saved_state
+    print('Replay finished')
+
+def play():
+    """
+    Replay the records due before the next main loop iteration, each reported at its recorded time.
+    Call once per main loop iteration in place of reading the physical inputs.
+    At most one pass of the recording (so at most one wrap around when looping) is replayed per call.
+    """
+    global play_offset, play_due_ns
+    remaining = rec_len // RECORD_SIZE
+    # Records due before the next iteration starts are busy-waited for, rather than reported late
+    while playing and remaining > 0 and (play_due_ns < looprate.deadline_ns or play_due_ns <= monotonic_ns()):
+        remaining -= 1
+        _, gamepad, cc, x, y, z, r_z = struct.unpack_from(RECORD_FORMAT, rec_buf, play_offset)
+        while monotonic_ns() < play_due_ns:
+            pass
+        pressed_buttons.gamepad = gamepad
+        pressed_buttons.cc = cc
+        gamepad_axes_values['x'] = x
+        gamepad_axes_values['y'] = y
+        gamepad_axes_values['z'] = z
+        gamepad_axes_values['r_z'] = r_z
+        report()
+        play_offset += RECORD_SIZE
+        if play_offset >= rec_len:
+            if not looping:
+                stop_playback()
+                return
+            play_offset = 0
+        play_due_ns += struct.unpack_from('<I', rec_buf, play_offset)[0] * 1000
+
+def dump():
+    """
+    Write the recording to the serial interface as 'rec_data={hex}' lines
+    """
+    serial.write_line(f'rec_dump begin len={rec_len}')
+    mv = memoryview(rec_buf)
+    for offset in range(0, rec_len, DUMP_CHUNK_SIZE):
+        serial.write_line('rec_data=' + str(hexlify(mv[offset:min(offset + DUMP_CHUNK_SIZE, rec_len)]), 'ascii'))
+    serial.write_line('rec_dump end')
+
+def upload(hex_data: str):
+    """
+    Append hex encoded recording data, as written by dump()
+    """
+    global rec_len
+    stop_recording()
+    stop_playback()
+    try:
+        data = unhexlify(hex_data)
+    except ValueError as e:
+        print(f'Error decoding recording data: {e}')
+        return
+    if rec_len + len(data) > len(rec_buf):
+        print('Recording buffer full')
+        return
+    rec_buf[rec_len:rec_len + len(data)] = data
+    rec_len += len(data)
+
+def clear():
+    global rec_len
+    stop_recording()
+    stop_playback()
+    rec_len = 0
+
+def save():
+    """
+    Write the recording to RECORDING_FILE.
+    Note that CIRCUITPY is only writable by code if boot.py has remounted it so.
+    """
+    try:
+        with open(RECORDING_FILE, 'wb') as f:
+            f.write(memoryview(rec_buf)[0:rec_len])
+        print(f'Saved recording to {RECORDING_FILE}')
+    except OSError as e:
+        print(f'Error saving recording to {RECORDING_FILE}: {e}')
+
+def load():
+    global rec_len
+    clear()
+    try:
+        with open(RECORDING_FILE, 'rb') as f:
+            rec_len = f.readinto(rec_buf)
+        print(f'Loaded recording from {RECORDING_FILE}')
+    except OSError as e:
+        print(f'Error loading recording from {RECORDING_FILE}: {e}')
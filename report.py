@@ -1,20 +1,39 @@
-from config import BUTTON_VOL_UP, BUTTON_VOL_DOWN, BUTTON_VOL_MUTE
 from globals import *
+from config import PLAYER_COUNT, GAMEPAD_REPORTS_PER_LOOP
+import latency
 
-def report():
-    # Report Gamepad buttons
-    gp_pressed_buttons = gp_valid_buttons.intersection(pressed_buttons)
-    gp_released_buttons = gp_valid_buttons.difference(pressed_buttons)
-    gp.press_buttons(*gp_pressed_buttons)
-    gp.release_buttons(*gp_released_buttons)
-    # Report Gamepad joystick axes
-    gp.move_joysticks(**gamepad_axes_values)
-    # Report CC (Volume) events
-    vol_pressed_buttons = vol_valid_buttons.intersection(pressed_buttons)
-    # - for sanity sake we'll only report one volume key at a time!
-    if len(vol_pressed_buttons) > 0:
-        cc.press(list(vol_pressed_buttons)[0])
-    else:
-        cc.release()
-
+# Player to offer the first report to in the next report(), so changed players take turns
+next_player = 0
 
+def report():
+    global next_player
+    # Report Gamepad buttons & joystick axes together in a single report.
+    # Physical & injected inputs are combined, injected axes take precedence.
+    gp.set_state(
+        pressed_buttons.gamepad | injected_buttons.gamepad,
+        injected_axes.get('x', gamepad_axes_values['x']),
+        injected_axes.get('y', gamepad_axes_values['y']),
+        injected_axes.get('z', gamepad_axes_values['z']),
+        injected_axes.get('r_z', gamepad_axes_values['r_z']),
+        send=False,
+    )
+    cc_pressed = pressed_buttons.cc | injected_buttons.cc
+    for player in range(1, PLAYER_COUNT):
+        buttons = player_buttons.states[player]
+        axes = player_axes_values[player]
+        gamepads[player].set_state(buttons.gamepad, axes['x'], axes['y'], axes['z'], axes['r_z'], send=False)
+        cc_pressed |= buttons.cc
+    # Send the changed reports, at most GAMEPAD_REPORTS_PER_LOOP. Players take turns to go first
+    # so a busy player cannot starve the others. Unsent changes are sent by following calls.
+    sent = 0
+    for i in range(PLAYER_COUNT):
+        player = (next_player + i) % PLAYER_COUNT
+        if gamepads[player].flush():
+            if latency.pending:
+                latency.report_sent()
+            next_player = (player + 1) % PLAYER_COUNT
+            sent += 1
+            if sent >= GAMEPAD_REPORTS_PER_LOOP:
+                break
+    # Report CC (Volume) events. Only changes are sent
+    cc.update(cc_pressed)
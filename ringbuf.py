@@ -0,0 +1,95 @@
+class RingBuffer:
+    """
+    Fixed size byte ring buffer.
+    All storage is allocated up front, so filling and draining it does not allocate
+    """
+
+    def __init__(self, size: int):
+        self._buf = bytearray(size)
+        self._mv = memoryview(self._buf)
+        self._size = size
+        # Index of the oldest byte & number of bytes held
+        self._head = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def free(self) -> int:
+        return self._size - self._count
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+
+    def fill_from(self, stream) -> int:
+        """
+        Read everything waiting on stream, up to the free space available,
+        using at most two readinto() calls. Returns the number of bytes read.
+        """
+        total = 0
+        waiting = stream.in_waiting
+        while waiting > 0 and self._count < self._size:
+            tail = self._head + self._count
+            if tail >= self._size:
+                tail -= self._size
+            # Largest contiguous free region starting at tail
+            end = self._size if tail >= self._head else self._head
+            n = stream.readinto(self._mv[tail:min(end, tail + waiting)])
+            if not n:
+                break
+            self._count += n
+            total += n
+            waiting -= n
+        return total
+
+    def peek(self, offset: int) -> int:
+        """
+        Return the byte at offset from the oldest byte held
+        """
+        i = self._head + offset
+        if i >= self._size:
+            i -= self._size
+        return self._buf[i]
+
+    def find(self, a: int, b: int, start: int = 0) -> int:
+        """
+        Return the offset of the first byte equal to a or b at or after start, or -1
+        """
+        mv = self._mv
+        begin = self._head + start
+        end = self._head + self._count
+        # First contiguous segment, up to the end of the storage
+        for i in range(begin, min(end, self._size)):
+            c = mv[i]
+            if c == a or c == b:
+                return i - self._head
+        # Second segment, wrapped around to the start of the storage
+        if end > self._size:
+            for i in range(max(begin, self._size) - self._size, end - self._size):
+                c = mv[i]
+                if c == a or c == b:
+                    return i + self._size - self._head
+        return -1
+
+    def copy_into(self, dst, n: int):
+        """
+        Copy the n oldest bytes into the start of dst without consuming them
+        """
+        first = min(n, self._size - self._head)
+        dst[0:first] = self._mv[self._head:self._head + first]
+        if first < n:
+            dst[first:n] = self._mv[0:n - first]
+
+    def skip(self, n: int):
+        """
+        Consume (discard) the n oldest bytes
+        """
+        n = min(n, self._count)
+        self._count -= n
+        self._head += n
+        if self._head >= self._size:
+            self._head -= self._size
+        if self._count == 0:
+            self._head = 0
@@ -0,0 +1,123 @@
+from time import monotonic_ns
+
+from globals import *
+from buttons import ButtonState
+from config import MAX_PENDING_EVENTS
+
+class TimedCommand:
+    """
+    The inputs synthesized by a single command.
+    These are injected from its 'press' event until its 'release' event.
+    """
+
+    def __init__(self, buttons: ButtonState, axes: dict[str, int]):
+        self.buttons = buttons
+        self.axes = axes
+
+# Pending (due_ns, press, TimedCommand) events, a priority queue ordered by due time.
+# Events due at the same time stay in the order they were scheduled.
+events: list = []
+# Commands between their press & release events, in the order they were pressed
+active_cmds: list[TimedCommand] = []
+# Earliest time the next sequential command may start, i.e. the previous one's release + post wait
+next_start_ns = 0
+# Commands pressed in the current service() call, reused to avoid allocating each iteration
+pressed_now: list[TimedCommand] = []
+
+def schedule_command(cmd: TimedCommand, pre_ns: int, hold_ns: int, post_ns: int, overlap: bool = False) -> bool:
+    """
+    Queue press & release events for a command.
+    Commands run one after another, each starting after the previous command's post wait,
+    unless overlap is set in which case the command starts straight away
+    alongside any other commands still pending.
+    Returns False, scheduling nothing, if the queue is full.
+    """
+    global next_start_ns
+    if not has_room(1):
+        print(f'Command queue full ({len(events)} events), dropping command')
+        return False
+    now = monotonic_ns()
+    start_ns = now if overlap else max(now, next_start_ns)
+    press_ns = start_ns + pre_ns
+    release_ns = press_ns + hold_ns
+    if not overlap:
+        next_start_ns = release_ns + post_ns
+    push_event(press_ns, True, cmd)
+    push_event(release_ns, False, cmd)
+    return True
+
+def has_room(commands: int) -> bool:
+    """
+    True if this many more commands can be scheduled without exceeding MAX_PENDING_EVENTS
+    """
+    return len(events) + 2 * commands <= MAX_PENDING_EVENTS
+
+def push_event(due_ns: int, press: bool, cmd: TimedCommand):
+    """
+    Insert an event into the queue, after any events due at the same time
+    """
+    lo = 0
+    hi = len(events)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if events[mid][0] <= due_ns:
+            lo = mid + 1
+        else:
+            hi = mid
+    events.insert(lo, (due_ns, press, cmd))
+
+def pending() -> bool:
+    """
+    True if any command has not been released yet
+    """
+    return len(events) > 0
+
+def clear():
+    """
+    Drop all pending commands and release any injected inputs
+    """
+    global next_start_ns
+    events.clear()
+    active_cmds.clear()
+    next_start_ns = 0
+    apply_active_commands()
+
+def service() -> bool:
+    """
+    Apply all the events which are due. Call once per main loop iteration before report().
+    A command pressed & released in the same call has its release deferred
+    so that the press is always reported.
+    Returns True if the injected inputs changed.
+    """
+    now = monotonic_ns()
+    changed = False
+    pressed_now.clear()
+    while len(events) > 0 and events[0][0] <= now:
+        _, press, cmd = events[0]
+        if press:
+            active_cmds.append(cmd)
+            pressed_now.append(cmd)
+        elif cmd in pressed_now:
+            break
+        else:
+            active_cmds.remove(cmd)
+        events.pop(0)
+        changed = True
+    pressed_now.clear()
+    if changed:
+        apply_active_commands()
+    return changed
+
+def apply_active_commands():
+    """
+    Rebuild the injected inputs from the streamed inputs (see stream.py) & the active commands.
+    Later commands take precedence for axes.
+    """
+    injected_buttons.gamepad = streamed_buttons.gamepad
+    injected_buttons.cc = streamed_buttons.cc
+    injected_axes.clear()
+    injected_axes.update(streamed_axes)
+    for cmd in active_cmds:
+        injected_buttons.gamepad |= cmd.buttons.gamepad
+        injected_buttons.cc |= cmd.buttons.cc
+        injected_axes.update(cmd.axes)
@@ -1,6 +1,15 @@
+import struct
 import usb_cdc
+from time import monotonic_ns
 
 import commands
+import looprate
+import macros
+import protocol
+import stats
+import stream
+from config import SERIAL_BUFFER_SIZE
+from ringbuf import RingBuffer
 
 def init():
     # USB CDC Serial input
@@ -8,62 +17,202 @@ def init():
     # Clear any existing pending serial data
     usb_cdc.data.reset_input_buffer()
 
-cdc_data = bytearray()
+# Bytes read from usb_cdc.data which have not been consumed as lines/frames yet
+rx_buf = RingBuffer(SERIAL_BUFFER_SIZE)
+# A single line or frame is copied out of rx_buf into here for decoding
+line_buf = bytearray(SERIAL_BUFFER_SIZE)
+line_mv = memoryview(line_buf)
+# Number of bytes at the start of rx_buf already scanned for CR/LF
+scanned = 0
+# Set when an over-long line is being discarded, up to its CR/LF
+discarding = False
+# Time of the last read from usb_cdc.data which returned any bytes, see latency.py
+rx_ns = 0
+
 def read_cdc_line_from_serial() -> str:
     """
-    Read data from usb_cdc.data into cdc_data until CR (0xd) or LF(0xa) are found
+    Take the next line from rx_buf, i.e. all bytes up to a CR (0xd) or LF(0xa)
     Backspaces (0x8) will remove the last char read prior to a CR/LF
+    Returns None if rx_buf does not hold a complete line.
+    If rx_buf fills up without a CR/LF the whole line is discarded.
     """
-    global cdc_data
-    cdc_str = None
-    bytes_waiting = usb_cdc.data.in_waiting
-    while bytes_waiting > 0:
-        #print(f'Serial: {bytes_waiting} bytes waiting')
-        # Read serial data into cdc_data until we hit a newline
-        next_byte = usb_cdc.data.read(1)
-        if len(next_byte) > 0:
-            #print(f'Serial: read char: {next_byte[0]}')
-            # Break on CR/LF
-            if next_byte[0] == 0xd or next_byte[0] == 0xa:
-                if len(cdc_data) > 0:
-                    # Decode buffer
-                    cdc_str = cdc_data.decode("utf-8")
-                    # Reset buffer for next sequence
-                    cdc_data = bytearray()
-                break
-            # handle backspace
-            if next_byte[0] == 0x8 and len(cdc_data) > 0:
-                cdc_data = cdc_data[0:-1]
-                continue
-            # Add byte to cdc_data buffer
-            cdc_data += next_byte
-        bytes_waiting = usb_cdc.data.in_waiting
+    global scanned, discarding
+    while True:
+        eol = rx_buf.find(0xd, 0xa, scanned)
+        if eol < 0:
+            scanned = len(rx_buf)
+            if rx_buf.free == 0 or discarding:
+                if not discarding:
+                    print(f'Serial: discarding line longer than {SERIAL_BUFFER_SIZE} bytes')
+                    stats.serial_rejected += 1
+                    discarding = True
+                rx_buf.clear()
+                scanned = 0
+            return None
+        scanned = 0
+        if discarding:
+            # End of an over-long line
+            rx_buf.skip(eol + 1)
+            discarding = False
+            continue
+        rx_buf.copy_into(line_buf, eol)
+        rx_buf.skip(eol + 1)
+        # handle backspace, compacting the line in place
+        length = 0
+        for i in range(eol):
+            c = line_buf[i]
+            if c == 0x8:
+                if length > 0:
+                    length -= 1
+            else:
+                line_buf[length] = c
+                length += 1
+        if length > 0:
+            stats.serial_lines += 1
+            try:
+                return str(line_mv[0:length], 'utf-8')
+            except UnicodeError as e:
+                print(f'Serial: discarding undecodable line: {e}')
+                stats.serial_rejected += 1
+        # Empty line (e.g. the LF of a CR/LF pair), try the next one
 
-    return cdc_str
+def write_line(line: str):
+    """
+    Write a line of text back to the host on usb_cdc.data
+    """
+    usb_cdc.data.write(line.encode('utf-8') + b'\r\n')
 
-def read_cmd_from_serial() -> bool:
+# Binary framed protocol state. See protocol.py for the frame layout
+binary_mode = False
+
+def set_binary_mode(enable: bool):
     """
-    Attempt to read a valid command sequence from usb_cdc.data serial
+    Switch between the text 'name=value;...' protocol and the binary framed protocol
     """
-    cdc_str = read_cdc_line_from_serial()
-    if None == cdc_str:
-        return False
-    print(f'Read cmd line from usb cdc: {cdc_str}')
+    global binary_mode
+    binary_mode = enable
+    mode = 'bin' if enable else 'text'
+    print(f'Serial protocol mode: {mode}')
+    write_line(f'mode={mode}')
+
+def read_frame_from_serial() -> bool:
+    """
+    Take the next complete frame from rx_buf into line_buf.
+    Bytes preceding a SYNC byte and frames with an unknown opcode, bad length
+    or bad checksum are discarded.
+    Returns False if rx_buf does not hold a complete frame.
+    """
+    while len(rx_buf) >= 3:
+        if rx_buf.peek(0) != protocol.SYNC:
+            # Not synchronised, skip until we see a SYNC byte
+            rx_buf.skip(1)
+            continue
+        length = rx_buf.peek(1)
+        if protocol.payload_size(rx_buf.peek(2)) + 1 != length:
+            print(f'Dropping binary frame: opcode={rx_buf.peek(2)}, len={length}')
+            stats.serial_rejected += 1
+            rx_buf.skip(1)
+            continue
+        if len(rx_buf) < length + 3:
+            # Wait for the rest of the frame
+            return False
+        rx_buf.copy_into(line_buf, length + 3)
+        if protocol.checksum(line_buf, 1, length + 2) != line_buf[length + 2]:
+            print('Dropping binary frame: bad checksum')
+            stats.serial_rejected += 1
+            rx_buf.skip(1)
+            continue
+        rx_buf.skip(length + 3)
+        stats.serial_frames += 1
+        return True
+    return False
+
+def process_frame() -> bool:
+    """
+    Dispatch the complete, verified frame held in line_buf
+    """
+    opcode = line_buf[2]
+    if opcode == protocol.OP_INPUT:
+        return commands.process_input_frame(*struct.unpack_from(protocol.INPUT_FORMAT, line_buf, 3))
+    elif opcode == protocol.OP_STREAM:
+        return stream.process_state_frame(*struct.unpack_from(protocol.STREAM_FORMAT, line_buf, 3))
+    elif opcode == protocol.OP_STREAM_DELTA:
+        return stream.process_delta_frame(*struct.unpack_from(protocol.STREAM_DELTA_FORMAT, line_buf, 3))
+    elif opcode == protocol.OP_TEXT:
+        set_binary_mode(False)
+    return True
+
+def process_line(cdc_str: str) -> bool:
+    """
+    Process a single text command line
+    """
+    # Echo interactive commands, but not stream frames (lines with a 'seq' key) which arrive continuously
+    if not cdc_str.startswith('seq=') and ';seq=' not in cdc_str:
+        print(f'Read cmd line from usb cdc: {cdc_str}')
     # Process cdc_str
-    if cdc_str == 'conf_es':
-        commands.configure_emulation_station()
+    if cdc_str == 'mode=bin':
+        set_binary_mode(True)
         return True
-    if cdc_str == 'conf_ra':
-        commands.configure_retroarch()
+    if cdc_str == 'stats':
+        write_line(f'stats {looprate.format_stats()} {stats.format_stats()}')
         return True
+    if cdc_str == 'stats_reset':
+        looprate.reset_stats()
+        stats.reset()
+        write_line('stats_reset')
+        return True
+    if cdc_str == 'stream_end':
+        stream.end()
+        return True
+    if cdc_str in macros.macros:
+        # A named macro, e.g. 'conf_es' or 'conf_ra'
+        return macros.play_macro(cdc_str)
     # decode 'name=value' pair commands. e.g cdc_str = "b1=0;b2=1; ... ;x=32767;y=-32767;z=0;r_z="
     try:
         cmds = dict(item.split("=") for item in cdc_str.split(";"))
     except:
         return False
     if len(cmds) > 0:  
+        if 'seq' in cmds:
+            # A stream frame, applied in place rather than scheduled
+            return stream.process_text_frame(cmds)
         print(f'Decoded cmds: {cmds}')
-        commands.process_commands(**cmds)
-        return True
+        return commands.process_commands(**cmds)
     return False
 
+def process_next():
+    """
+    Process the next complete line or frame held in rx_buf, depending on the protocol mode.
+    Returns None if there is nothing complete to process, otherwise whether it was a valid command.
+    """
+    if binary_mode:
+        if not read_frame_from_serial():
+            return None
+        return process_frame()
+    cdc_str = read_cdc_line_from_serial()
+    if None == cdc_str:
+        return None
+    return process_line(cdc_str)
+
+def read_cmd_from_serial() -> bool:
+    """
+    Read what is waiting on usb_cdc.data into rx_buf, up to its free space, and process all the
+    complete command lines (or binary frames) it holds as a batch. Anything more is left for
+    the next call, so a host sending continuously cannot hold up the main loop.
+    Returns True if any valid command was processed.
+    """
+    global rx_ns
+    processed = False
+    bytes_read = rx_buf.fill_from(usb_cdc.data)
+    if bytes_read > 0:
+        rx_ns = monotonic_ns()
+        stats.serial_bytes += bytes_read
+    result = process_next()
+    while None != result:
+        if result:
+            stats.serial_commands += 1
+        else:
+            stats.serial_rejected += 1
+        processed = processed or result
+        result = process_next()
+    return processed
@@ -0,0 +1,14 @@
+"""
+Host-side simulator: runs the unmodified firmware modules under CPython with fake hardware.
+
+    sim/fakes/      stand-ins for the CircuitPython modules the firmware imports
+                    (board, microcontroller, digitalio, analogio, rotaryio, keypad,
+                    usb_hid, usb_cdc, usb_midi, supervisor) and the adafruit_hid library
+    sim/hardware.py scriptable pin levels, ADC values, shift register inputs & encoder positions
+    sim/clock.py    a virtual clock standing in for time.monotonic_ns() & time.sleep()
+    sim/runner.py   runs boot.py & the main loop (app.py) for N iterations
+
+Time only advances when the firmware reads the clock or sleeps, so a run is
+deterministic: the same script always produces the same reports at the same times.
+See "Host-side Simulator" in README.md.
+"""
@@ -0,0 +1,3 @@
+from sim.runner import main
+
+main()
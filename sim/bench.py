@@ -0,0 +1,417 @@
+"""
+Benchmarks of the poll -> report hot path & serial command throughput, on the simulated hardware.
+
+    python -m sim.bench [--output FILE] [--baseline FILE] [--save-baseline] [--tolerance FRACTION]
+                        [--processes N] [--no-compare]
+
+Measures:
+
+* loop.{case}.{idle|active}.median_us   wall clock time of inputs.update_all() + report() per iteration,
+                                         for sets of mapped buttons/axes/encoders (see CASES), with the
+                                         inputs steady (idle) or changing (active)
+* alloc.{case}.peak_bytes               most memory allocated (and not yet freed) during an active iteration,
+                                         i.e. garbage the CircuitPython GC will have to collect
+* alloc.{case}.growth_bytes             growth in memory held over many active iterations, i.e. leaks
+* serial.{text|binary}.commands_per_sec commands processed by serial.read_cmd_from_serial()
+* reports.*                             HID reports sent per input change or per 1000 noisy iterations,
+                                         running the whole main loop at LOOP_RATE_HZ on the virtual clock
+
+Wall clock times are CPython timings of the firmware (and the fakes it calls). To allow for the
+speed of the machine varying, timings are compared with the baseline relative to the time of a
+fixed calibration workload measured alongside ('relative' in the results). Still, only compare
+runs on similar machines & the same Python version. The report & allocation counts are deterministic.
+
+Results are written as JSON. Given a baseline (a previous results file) the run fails, with exit
+status 1, if any metric is worse than the baseline: timings by more than the tolerance fraction,
+counts at all.
+"""
+
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(SIM_DIR, 'bench_baseline.json')
+
+# Iterations timed per case, in REPEATS runs. The median of each run is taken so that the odd
+# slow iteration (e.g. a CPython GC pause) does not skew the result, then the best run so that
+# a run slowed by other processes does not.
+TIMED_ITERATIONS = 1000
+REPEATS = 5
+WARMUP_ITERATIONS = 100
+# Input changes every this many iterations in the active runs
+ACTIVE_PERIOD = 16
+
+# Mappings benchmarked: case name -> (buttons, joysticks, encoders) as in config.py defaults
+CASES = {
+    'empty'     : (0, 0, 0),
+    'buttons8'  : (8, 0, 0),
+    'axes4'     : (0, 4, 0),
+    'default'   : (8, 4, 0),
+    'encoders2' : (4, 4, 2),
+}
+
+# Metric kinds, deciding how a metric is compared with the baseline
+TIME = 'time'       # lower is better, within the tolerance
+RATE = 'rate'       # higher is better, within the tolerance
+COUNT = 'count'     # lower is better, deterministic so no tolerance
+
+def calibration_workload():
+    """
+    A fixed piece of pure Python, similar in mix to the hot path, timed to gauge the machine's speed
+    """
+    state = {'x': 0, 'y': 0}
+    values = list(range(64))
+    total = 0
+    for i in range(200):
+        value = values[i & 63] * 3 >> 1
+        if value != state['x']:
+            state['x'] = value
+            total += value
+    return total
+
+def calibrate() -> int:
+    """
+    Best time of the calibration workload, in ns
+    """
+    clock = time.perf_counter_ns
+    best = None
+    for _ in range(50):
+        start = clock()
+        calibration_workload()
+        elapsed = clock() - start
+        best = elapsed if None == best else min(best, elapsed)
+    return best
+
+class Bench:
+
+    def __init__(self):
+        from sim.runner import Simulator
+        self.sim = Simulator()
+        import app
+        import config
+        import inputs
+        import looprate
+        import report
+        import scheduler
+        import serial
+        self.app = app
+        self.config = config
+        self.inputs = inputs
+        self.looprate = looprate
+        self.report = report.report
+        self.scheduler = scheduler
+        self.serial = serial
+        self.hw = self.sim.hardware
+        self.metrics = {}
+
+    def add(self, name: str, value, unit: str, kind: str):
+        self.metrics[name] = { 'value': value, 'unit': unit, 'kind': kind }
+
+    def add_timed(self, name: str, measure, unit: str, kind: str):
+        """
+        Add a TIME or RATE metric, the value returned by measure(). Both it and the calibration
+        workload are measured REPEATS times, interleaved, and the best of each kept, so a repeat
+        slowed by other processes does not skew the result. The value relative to the calibration
+        is what is compared with the baseline.
+        """
+        best = None
+        calibration_ns = None
+        for _ in range(REPEATS):
+            ns = calibrate()
+            calibration_ns = ns if None == calibration_ns else min(calibration_ns, ns)
+            value = measure()
+            if None == best or (value < best if TIME == kind else value > best):
+                best = value
+        relative = best * 1000 / calibration_ns if TIME == kind else best * calibration_ns / 1_000_000_000
+        self.add(name, round(best, 2), unit, kind)
+        self.metrics[name]['relative'] = round(relative, 4)
+
+    def map_case(self, buttons: int, axes: int, encoders: int):
+        """
+        Map the first N buttons, axes & encoders. Encoders use the digital inputs after the buttons.
+        """
+        config = self.config
+        profile = dict(self.inputs.default_profile())
+        btns = list(config.default_button_pins)[0:buttons]
+        profile['buttons'] = { btn: config.default_button_pins[btn] for btn in btns }
+        profile['joysticks'] = { axis: config.default_joystick_pins[axis]
+                                 for axis in list(config.default_joystick_pins)[0:axes] }
+        free = [key for key in config.digital_ins if not key in profile['buttons'].values()]
+        enc_btns = ((config.BUTTON_HAT_UP, config.BUTTON_HAT_DOWN), (config.BUTTON_HAT_LEFT, config.BUTTON_HAT_RIGHT))
+        profile['encoders'] = { f'rot{i}': (free[2 * i], free[2 * i + 1]) + enc_btns[i] for i in range(encoders) }
+        self.inputs.apply_profile(profile)
+        self.hw.reset()
+        self.button_pins = [config.digital_ins[key] for key in profile['buttons'].values()]
+        self.axis_pins = [config.analog_ins[key] for key in profile['joysticks'].values()]
+        self.encoder_pins = [config.digital_ins[enc[0]] for enc in profile['encoders'].values()]
+
+    def drive_inputs(self, i: int):
+        """
+        Change the mapped inputs for active iteration i: every ADC reading moves, and
+        every ACTIVE_PERIOD iterations the buttons toggle & the encoders turn
+        """
+        for n, pin in enumerate(self.axis_pins):
+            self.hw.set_adc(pin, (i * 997 + n * 16384) & 0xFFFF)
+        if 0 == i % ACTIVE_PERIOD:
+            pressed = 0 == (i // ACTIVE_PERIOD) % 2
+            for pin in self.button_pins:
+                self.hw.set_pin(pin, not pressed)
+            for pin in self.encoder_pins:
+                self.hw.turn_encoder(pin, 1)
+
+    def hot_path(self, iterations: int, active: bool) -> list:
+        """
+        Run & time inputs.update_all() + report() for some iterations, returning each time in ns
+        """
+        update_all = self.inputs.update_all
+        report = self.report
+        clock = time.perf_counter_ns
+        times = []
+        for i in range(iterations):
+            if active:
+                self.drive_inputs(i)
+            start = clock()
+            update_all()
+            report()
+            times.append(clock() - start)
+        return times
+
+    def median_us(self, active: bool) -> float:
+        times = sorted(self.hot_path(TIMED_ITERATIONS, active))
+        return times[len(times) // 2] / 1000
+
+    def bench_loop(self):
+        for case in CASES:
+            self.map_case(*CASES[case])
+            for active in (False, True):
+                self.hot_path(WARMUP_ITERATIONS, active)
+                mode = 'active' if active else 'idle'
+                self.add_timed(f'loop.{case}.{mode}.median_us', lambda: self.median_us(active), 'us', TIME)
+            self.bench_alloc(case)
+
+    def bench_alloc(self, case: str):
+        # Warm up first, so that one-off allocations (e.g. caches, list growth) are not counted
+        self.hot_path(ACTIVE_PERIOD * 4, True)
+        update_all = self.inputs.update_all
+        report = self.report
+        # Keep the reports recorded by the fake HID devices out of the counts
+        devices = self.sim.usb_hid.devices
+        for device in devices:
+            device.record = False
+        tracemalloc.start()
+        peak = 0
+        settled = 0
+        for i in range(ACTIVE_PERIOD * 10):
+            if ACTIVE_PERIOD * 2 == i:
+                # The inputs have gone through a full cycle, so all the state values have been replaced once
+                settled = tracemalloc.get_traced_memory()[0]
+            self.drive_inputs(i)
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            update_all()
+            report()
+            _, iter_peak = tracemalloc.get_traced_memory()
+            peak = max(peak, iter_peak - current)
+        growth = tracemalloc.get_traced_memory()[0] - settled
+        tracemalloc.stop()
+        for device in devices:
+            device.record = True
+        self.add(f'alloc.{case}.peak_bytes', peak, 'bytes', COUNT)
+        self.add(f'alloc.{case}.growth_bytes', max(0, growth), 'bytes', COUNT)
+
+    def command_rate(self, batches: list, count: int) -> float:
+        """
+        Commands per second processed by serial.read_cmd_from_serial(), for count commands in batches.
+        Each batch must fit in the scheduler (see MAX_PENDING_EVENTS), which is cleared between batches.
+        Each call only reads up to SERIAL_BUFFER_SIZE bytes, so it is called until the batch has been read.
+        """
+        elapsed = 0
+        data_in = self.sim.usb_cdc.data
+        for data in batches:
+            data_in.host_write(data)
+            start = time.perf_counter_ns()
+            while data_in.in_waiting > 0:
+                self.serial.read_cmd_from_serial()
+            elapsed += time.perf_counter_ns() - start
+            self.scheduler.clear()
+        return count * 1_000_000_000 / elapsed
+
+    def bench_serial(self):
+        import protocol
+        count = 1000
+        batch = self.config.MAX_PENDING_EVENTS // 2
+        lines = [b''.join(f'btn1={i & 1};x={i * 32 - 16000};hold=0\r\n'.encode('ascii')
+                          for i in range(start, min(start + batch, count)))
+                 for start in range(0, count, batch)]
+        self.add_timed('serial.text.commands_per_sec', lambda: self.command_rate(lines, count), 'cmd/s', RATE)
+        self.sim.send('mode=bin')
+        self.serial.read_cmd_from_serial()
+        frames = [b''.join(protocol.encode_frame(protocol.OP_INPUT, 2, i * 32 - 16000, 0, 0, 0, 0, 0, 0)
+                           for i in range(start, min(start + batch, count)))
+                  for start in range(0, count, batch)]
+        self.add_timed('serial.binary.commands_per_sec', lambda: self.command_rate(frames, count), 'cmd/s', RATE)
+        self.sim.send_bytes(protocol.encode_frame(protocol.OP_TEXT))
+        self.serial.read_cmd_from_serial()
+        self.sim.usb_cdc.data.host_read()
+
+    def run_loop(self, iterations: int, drive) -> int:
+        """
+        Run the whole main loop at LOOP_RATE_HZ, calling drive(i) before each iteration.
+        Returns the number of gamepad reports sent.
+        """
+        gamepad = self.sim.usb_hid.devices[0]
+        sent = gamepad.sent
+        self.looprate.set_rate(self.config.LOOP_RATE_HZ)
+        for i in range(iterations):
+            drive(i)
+            self.app.loop()
+        return gamepad.sent - sent
+
+    def bench_reports(self):
+        import random
+        self.map_case(*CASES['default'])
+        self.run_loop(100, lambda i: None)
+        x_pin = self.axis_pins[0]
+        iterations = 1000
+        # Noise of +/- 8 LSBs of a 12 bit ADC on a stick at rest, in the centre & pushed part way
+        rng = random.Random(1)
+        for name, rest in (('centre', 32768), ('offcentre', 49152)):
+            self.hw.set_adc(x_pin, rest)
+            self.run_loop(100, lambda i: None)
+            noisy = lambda i: self.hw.set_adc(x_pin, rest + rng.randint(-8, 8) * 16)
+            sent = self.run_loop(iterations, noisy)
+            self.add(f'reports.stick_noise_{name}.per_1000_iters', sent * 1000 // iterations, 'reports', COUNT)
+        # A steady full range sweep of the stick, one ADC step per iteration
+        self.hw.set_adc(x_pin, 0)
+        self.run_loop(100, lambda i: None)
+        step = 65535 // iterations
+        sent = self.run_loop(iterations, lambda i: self.hw.set_adc(x_pin, i * step))
+        self.add('reports.stick_sweep.per_change', round(sent / iterations, 3), 'reports', COUNT)
+        # A button pressed & released every 20 iterations, well beyond the debounce times
+        self.hw.set_adc(x_pin, 32768)
+        self.run_loop(100, lambda i: None)
+        btn_pin = self.config.digital_ins[self.config.default_button_pins[self.config.BUTTON_START]]
+        def toggle(i: int):
+            if 0 == i % 20:
+                self.hw.set_pin(btn_pin, 0 != (i // 20) % 2)
+        changes = iterations // 20
+        sent = self.run_loop(iterations, toggle)
+        self.add('reports.button.per_change', round(sent / changes, 3), 'reports', COUNT)
+
+    def run(self) -> dict:
+        # Run flat out for the timings, so looprate.end() does not wait
+        self.looprate.set_rate(0)
+        self.bench_loop()
+        self.bench_serial()
+        self.bench_reports()
+        return {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'metrics': self.metrics,
+        }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Return a description of each metric worse than in the baseline
+    """
+    regressions = []
+    for name in results['metrics']:
+        metric = results['metrics'][name]
+        base = baseline['metrics'].get(name)
+        if None == base:
+            continue
+        kind = metric['kind']
+        if TIME == kind:
+            worse = metric['relative'] > base['relative'] * (1 + tolerance)
+        elif RATE == kind:
+            worse = metric['relative'] < base['relative'] * (1 - tolerance)
+        else:
+            worse = metric['value'] > base['value']
+        if worse:
+            regressions.append(f'{name}: {metric["value"]} {metric["unit"]}, baseline {base["value"]} {metric["unit"]}')
+    return regressions
+
+def merge(runs: list) -> dict:
+    """
+    Combine the results of several processes, keeping the best of each timing
+    """
+    results = runs[0]
+    for run in runs[1:]:
+        for name in run['metrics']:
+            metric = run['metrics'][name]
+            best = results['metrics'][name]
+            if ((TIME == metric['kind'] and metric['relative'] < best['relative'])
+                    or (RATE == metric['kind'] and metric['relative'] > best['relative'])):
+                results['metrics'][name] = metric
+    return results
+
+def run_worker() -> dict:
+    # The firmware prints as it goes, keep that out of the results
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            return Bench().run()
+        finally:
+            sys.stdout = stdout
+
+def main(argv: list = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m sim.bench', description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', help='write the results to this JSON file, rather than stdout')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='results to compare against (default %(default)s)')
+    parser.add_argument('--no-compare', action='store_true', help='do not compare against the baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='fraction a timing may be worse than the baseline before failing (default %(default)s)')
+    parser.add_argument('--processes', type=int, default=3,
+                        help='run the benchmarks in this many processes, keeping the best timings (default %(default)s)')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker()))
+        return 0
+    # Each process gets its own Simulator, since only one can be created per process.
+    # Timings also vary from process to process (e.g. with memory layout), more than within one.
+    import subprocess
+    runs = []
+    for _ in range(max(1, args.processes)):
+        worker = subprocess.run([sys.executable, '-m', 'sim.bench', '--worker'], cwd=os.path.dirname(SIM_DIR),
+                                stdout=subprocess.PIPE, check=True)
+        runs.append(json.loads(worker.stdout))
+    results = merge(runs)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if None != args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(text + '\n')
+        print(f'Saved baseline to {args.baseline}', file=sys.stderr)
+        return 0
+    if args.no_compare or not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('python') != results['python']:
+        print(f'Warning: baseline is from Python {baseline.get("python")}, this is {results["python"]}',
+              file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}', file=sys.stderr)
+    if len(regressions) > 0:
+        return 1
+    print(f'No regressions against {args.baseline}', file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+Virtual clock for deterministic simulation.
+
+install() replaces time.monotonic_ns(), time.monotonic() & time.sleep() before the
+firmware modules import them. The clock only moves when:
+
+* the firmware reads it: each read advances it by tick_ns, standing in for the
+  time taken by the code between reads (and letting busy-waits finish)
+* the firmware sleeps: it advances by the time slept
+* the simulator calls advance()
+"""
+
+import time
+
+# Start well away from 0, like a board that has been up for a while
+START_NS = 1_000_000_000
+
+now_ns = START_NS
+tick_ns = 1_000
+
+def monotonic_ns() -> int:
+    global now_ns
+    now_ns += tick_ns
+    return now_ns
+
+def monotonic() -> float:
+    return monotonic_ns() / 1_000_000_000
+
+def sleep(seconds: float):
+    global now_ns
+    if seconds < 0:
+        raise ValueError('sleep length must be non-negative')
+    now_ns += int(seconds * 1_000_000_000)
+
+def advance(ns: int):
+    """
+    Move the clock forward without the firmware running, e.g. to model time spent elsewhere
+    """
+    global now_ns
+    now_ns += ns
+
+def peek_ns() -> int:
+    """
+    The current time, without advancing the clock
+    """
+    return now_ns
+
+def install(start_ns: int = START_NS, tick: int = 1_000):
+    """
+    Patch the time module. Must be called before any firmware module is imported,
+    since they take their own references with 'from time import monotonic_ns'.
+    """
+    global now_ns, tick_ns
+    now_ns = start_ns
+    tick_ns = tick
+    time.monotonic_ns = monotonic_ns
+    time.monotonic = monotonic
+    time.sleep = sleep
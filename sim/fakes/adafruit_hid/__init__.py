@@ -0,0 +1,11 @@
+"""
+Minimal stand-in for the adafruit_hid library, covering what the firmware uses
+"""
+
+def find_device(devices, *, usage_page: int, usage: int):
+    if hasattr(devices, 'send_report'):
+        devices = [devices]
+    for device in devices:
+        if device.usage_page == usage_page and device.usage == usage:
+            return device
+    raise ValueError('Could not find matching HID device.')
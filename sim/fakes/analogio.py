@@ -0,0 +1,33 @@
+"""
+Fake analogio module. Inputs read the values in sim.hardware.adc_values, or mid-scale.
+"""
+
+from microcontroller import claim, unclaim
+from sim import hardware
+
+class AnalogIn:
+
+    def __init__(self, pin):
+        claim(pin)
+        self._pin = pin
+        self.reference_voltage = 3.3
+
+    def __repr__(self):
+        return f'<AnalogIn {self._pin}>'
+
+    def deinit(self):
+        if None != self._pin:
+            unclaim(self._pin)
+            self._pin = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.deinit()
+
+    @property
+    def value(self) -> int:
+        if None == self._pin:
+            raise ValueError('Object has been deinitialized and can no longer be used. Create a new object.')
+        return hardware.adc_values.get(self._pin.name, hardware.ADC_CENTRE)
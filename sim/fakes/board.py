@@ -0,0 +1,16 @@
+"""
+Fake board module, with the pins of a Raspberry Pi Pico
+"""
+
+from microcontroller import Pin
+
+for _i in range(29):
+    globals()[f'GP{_i}'] = Pin(f'GP{_i}')
+# The analog pins are aliases of GP26-GP28, as on the Pico. A3 (GP29) measures VSYS.
+GP29 = Pin('GP29')
+A0 = GP26
+A1 = GP27
+A2 = GP28
+A3 = GP29
+LED = GP25
+del _i
@@ -0,0 +1,71 @@
+"""
+Fake digitalio module. Inputs read the levels in sim.hardware.pin_levels, or float to their pull.
+"""
+
+from microcontroller import claim, unclaim
+from sim import hardware
+
+class Direction:
+    INPUT = 'INPUT'
+    OUTPUT = 'OUTPUT'
+
+class Pull:
+    UP = 'UP'
+    DOWN = 'DOWN'
+
+class DriveMode:
+    PUSH_PULL = 'PUSH_PULL'
+    OPEN_DRAIN = 'OPEN_DRAIN'
+
+class DigitalInOut:
+
+    def __init__(self, pin):
+        claim(pin)
+        self._pin = pin
+        self.direction = Direction.INPUT
+        self.pull = None
+        self.drive_mode = DriveMode.PUSH_PULL
+
+    def __repr__(self):
+        return f'<DigitalInOut {self._pin}>'
+
+    def deinit(self):
+        if None != self._pin:
+            unclaim(self._pin)
+            self._pin = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.deinit()
+
+    def _check(self):
+        if None == self._pin:
+            raise ValueError('Object has been deinitialized and can no longer be used. Create a new object.')
+
+    def switch_to_input(self, pull=None):
+        self._check()
+        self.direction = Direction.INPUT
+        self.pull = pull
+
+    def switch_to_output(self, value: bool = False, drive_mode=DriveMode.PUSH_PULL):
+        self._check()
+        self.direction = Direction.OUTPUT
+        self.pull = None
+        self.drive_mode = drive_mode
+        hardware.output_levels[self._pin.name] = value
+
+    @property
+    def value(self) -> bool:
+        self._check()
+        if Direction.OUTPUT == self.direction:
+            return hardware.output_levels[self._pin.name]
+        return hardware.pin_levels.get(self._pin.name, Pull.UP == self.pull)
+
+    @value.setter
+    def value(self, value: bool):
+        self._check()
+        if Direction.OUTPUT != self.direction:
+            raise AttributeError('Cannot set value when direction is input.')
+        hardware.output_levels[self._pin.name] = value
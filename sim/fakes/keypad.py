@@ -0,0 +1,132 @@
+"""
+Fake keypad module. Keys are scanned from sim.hardware when their events are read,
+at most once per scan interval of the (virtual) clock, like the real background scan.
+"""
+
+import time
+
+from microcontroller import claim, unclaim
+from sim import hardware
+import supervisor
+
+class Event:
+
+    def __init__(self, key_number: int = 0, pressed: bool = True):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.timestamp = 0
+
+    @property
+    def released(self) -> bool:
+        return not self.pressed
+
+    def __eq__(self, other):
+        return self.key_number == other.key_number and self.pressed == other.pressed
+
+    def __repr__(self):
+        return f'<Event: key_number {self.key_number} {"pressed" if self.pressed else "released"}>'
+
+class EventQueue:
+
+    def __init__(self, max_events: int):
+        self._events = []
+        self._max_events = max_events
+        self.overflowed = False
+
+    def get(self) -> Event:
+        event = Event()
+        return event if self.get_into(event) else None
+
+    def get_into(self, event: Event) -> bool:
+        if 0 == len(self._events):
+            return False
+        event.key_number, event.pressed, event.timestamp = self._events.pop(0)
+        return True
+
+    def clear(self):
+        self._events.clear()
+        self.overflowed = False
+
+    def __len__(self):
+        return len(self._events)
+
+    def __bool__(self):
+        return len(self._events) > 0
+
+    def _put(self, key_number: int, pressed: bool):
+        if len(self._events) >= self._max_events:
+            self.overflowed = True
+        else:
+            self._events.append((key_number, pressed, supervisor.ticks_ms()))
+
+class _Scanner:
+
+    def __init__(self, pins, key_count: int, interval: float, max_events: int):
+        claim(*pins)
+        self._pins = pins
+        self.key_count = key_count
+        self._interval_ns = int(interval * 1_000_000_000)
+        # Like the real background scan, the first scan happens one interval after construction
+        self._next_scan_ns = time.monotonic_ns() + self._interval_ns
+        self._pressed = [False] * key_count
+        self._events = EventQueue(max_events)
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self._pins}>'
+
+    def deinit(self):
+        if None != self._pins:
+            unclaim(*self._pins)
+            self._pins = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.deinit()
+
+    def reset(self):
+        # Assume all keys are released, so keys held now are reported as newly pressed
+        for i in range(self.key_count):
+            self._pressed[i] = False
+        self._next_scan_ns = 0
+
+    @property
+    def events(self) -> EventQueue:
+        now = time.monotonic_ns()
+        if now >= self._next_scan_ns:
+            self._next_scan_ns = now + self._interval_ns
+            for i in range(self.key_count):
+                pressed = self._is_pressed(i)
+                if pressed != self._pressed[i]:
+                    self._pressed[i] = pressed
+                    self._events._put(i, pressed)
+        return self._events
+
+    def _is_pressed(self, key_number: int) -> bool:
+        raise NotImplementedError
+
+class Keys(_Scanner):
+
+    def __init__(self, pins, *, value_when_pressed: bool, pull: bool = True,
+                 interval: float = 0.02, max_events: int = 64):
+        super().__init__(tuple(pins), len(pins), interval, max_events)
+        self._value_when_pressed = value_when_pressed
+        # With pull enabled, the pull is away from the pressed value
+        self._idle_level = pull and not value_when_pressed
+
+    def _is_pressed(self, key_number: int) -> bool:
+        level = hardware.pin_levels.get(self._pins[key_number].name, self._idle_level)
+        return level == self._value_when_pressed
+
+class ShiftRegisterKeys(_Scanner):
+
+    def __init__(self, *, clock, data, latch, value_to_latch: bool = True, key_count: int,
+                 value_when_pressed: bool, interval: float = 0.02, max_events: int = 64):
+        super().__init__((clock, data, latch), key_count, interval, max_events)
+        self._value_when_pressed = value_when_pressed
+
+    def _is_pressed(self, key_number: int) -> bool:
+        levels = hardware.shift_register_levels.get(self._pins[1].name, ())
+        level = levels[key_number] if key_number < len(levels) else True
+        return level == self._value_when_pressed
@@ -0,0 +1,30 @@
+"""
+Fake microcontroller module: Pins (which track whether they are in use, like the
+real ones) and an in-memory nvm.
+"""
+
+class Pin:
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_use = False
+
+    def __repr__(self):
+        return f'board.{self.name}'
+
+def claim(*pins):
+    """
+    Mark pins in use, raising ValueError like CircuitPython if one already is
+    """
+    for pin in pins:
+        if pin._in_use:
+            raise ValueError(f'{pin.name} in use')
+    for pin in pins:
+        pin._in_use = True
+
+def unclaim(*pins):
+    for pin in pins:
+        pin._in_use = False
+
+# Non-volatile memory, as on an RP2040 board
+nvm = bytearray(b'\xff' * 4096)
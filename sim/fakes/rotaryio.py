@@ -0,0 +1,37 @@
+"""
+Fake rotaryio module. Encoders read the positions in sim.hardware.encoder_positions, keyed by the A pin.
+"""
+
+from microcontroller import claim, unclaim
+from sim import hardware
+
+class IncrementalEncoder:
+
+    def __init__(self, pin_a, pin_b, divisor: int = 4):
+        claim(pin_a, pin_b)
+        self._pins = (pin_a, pin_b)
+        self.divisor = divisor
+        # Subtracted from the hardware position, so position can be set like the real one
+        self._offset = hardware.encoder_positions.get(pin_a.name, 0)
+
+    def __repr__(self):
+        return f'<IncrementalEncoder {self._pins}>'
+
+    def deinit(self):
+        if None != self._pins:
+            unclaim(*self._pins)
+            self._pins = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.deinit()
+
+    @property
+    def position(self) -> int:
+        return hardware.encoder_positions.get(self._pins[0].name, 0) - self._offset
+
+    @position.setter
+    def position(self, value: int):
+        self._offset = hardware.encoder_positions.get(self._pins[0].name, 0) - value
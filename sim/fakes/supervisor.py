@@ -0,0 +1,21 @@
+"""
+Fake supervisor module
+"""
+
+import time
+
+class Runtime:
+
+    def __init__(self):
+        self.autoreload = True
+        self.serial_connected = True
+        self.usb_connected = True
+
+runtime = Runtime()
+
+def ticks_ms() -> int:
+    # Wraps at 2**29 like CircuitPython's
+    return (time.monotonic_ns() // 1_000_000) & ((1 << 29) - 1)
+
+def reload():
+    raise SystemExit('supervisor.reload()')
@@ -0,0 +1,78 @@
+"""
+Fake usb_cdc module. Each Serial is an in-memory stream: the host side writes with
+host_write() and reads whatever the firmware wrote with host_read().
+"""
+
+class Serial:
+
+    def __init__(self):
+        self._rx = bytearray()
+        self._tx = bytearray()
+        self.timeout = 1.0
+        self.write_timeout = None
+        self.connected = True
+
+    # Firmware side
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._rx)
+
+    @property
+    def out_waiting(self) -> int:
+        return 0
+
+    def read(self, size: int = 1) -> bytes:
+        n = min(size, len(self._rx))
+        data = bytes(self._rx[:n])
+        del self._rx[:n]
+        return data
+
+    def readinto(self, buf) -> int:
+        n = min(len(buf), len(self._rx))
+        buf[0:n] = self._rx[:n]
+        del self._rx[:n]
+        return n
+
+    def readline(self, size: int = -1) -> bytes:
+        end = self._rx.find(b'\n') + 1
+        if 0 == end:
+            end = len(self._rx)
+        if size >= 0:
+            end = min(end, size)
+        return self.read(end)
+
+    def write(self, buf) -> int:
+        self._tx.extend(buf)
+        return len(buf)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._rx.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    # Host side
+
+    def host_write(self, data: bytes):
+        self._rx.extend(data)
+
+    def host_read(self) -> bytes:
+        data = bytes(self._tx)
+        self._tx.clear()
+        return data
+
+# The serial channels enabled by boot.py. Unlike on a board, enable() takes effect immediately.
+console = Serial()
+data = None
+
+def enable(*, console: bool = True, data: bool = False):
+    g = globals()
+    g['console'] = Serial() if console else None
+    g['data'] = Serial() if data else None
+
+def disable():
+    enable(console=False, data=False)
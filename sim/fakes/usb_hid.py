@@ -0,0 +1,54 @@
+"""
+Fake usb_hid module. Each Device records the reports sent to it, with the time they were sent.
+"""
+
+import time
+
+class Device:
+
+    def __init__(self, *, report_descriptor: bytes, usage_page: int, usage: int,
+                 report_ids: tuple, in_report_lengths: tuple, out_report_lengths: tuple):
+        self.report_descriptor = bytes(report_descriptor)
+        self.usage_page = usage_page
+        self.usage = usage
+        self.report_ids = tuple(report_ids)
+        self.in_report_lengths = tuple(in_report_lengths)
+        self.out_report_lengths = tuple(out_report_lengths)
+        # (monotonic_ns, report ID, report bytes) of each report sent, while record is set
+        self.reports: list[(int, int, bytes)] = []
+        self.record = True
+        # Number of reports sent, recorded or not
+        self.sent = 0
+
+    def send_report(self, report, report_id: int = None):
+        if None == report_id:
+            report_id = self.report_ids[0]
+        if not report_id in self.report_ids:
+            raise ValueError(f'Invalid report_id {report_id}')
+        expected = self.in_report_lengths[self.report_ids.index(report_id)]
+        if len(report) != expected:
+            raise ValueError(f'Buffer is not {expected} bytes long')
+        self.sent += 1
+        if self.record:
+            self.reports.append((time.monotonic_ns(), report_id, bytes(report)))
+
+    def get_last_received_report(self, report_id: int = None):
+        return None
+
+Device.KEYBOARD = Device(report_descriptor=b'', usage_page=0x01, usage=0x06,
+                         report_ids=(1,), in_report_lengths=(8,), out_report_lengths=(1,))
+Device.MOUSE = Device(report_descriptor=b'', usage_page=0x01, usage=0x02,
+                      report_ids=(2,), in_report_lengths=(4,), out_report_lengths=(0,))
+Device.CONSUMER_CONTROL = Device(report_descriptor=b'', usage_page=0x0C, usage=0x01,
+                                 report_ids=(3,), in_report_lengths=(2,), out_report_lengths=(0,))
+
+# The devices enabled by boot.py. Unlike on a board, enable() takes effect immediately.
+devices = (Device.KEYBOARD, Device.MOUSE, Device.CONSUMER_CONTROL)
+
+def enable(devs, boot_device: int = 0):
+    global devices
+    devices = tuple(devs)
+
+def disable():
+    global devices
+    devices = ()
@@ -0,0 +1,11 @@
+"""
+Fake usb_midi module
+"""
+
+ports = ()
+
+def enable():
+    pass
+
+def disable():
+    pass
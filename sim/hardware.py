@@ -0,0 +1,62 @@
+"""
+Scriptable state of the simulated hardware, read by the fake modules in sim/fakes.
+
+Pins may be given as a Pin or by board name, e.g. 'GP4' or 'A0'.
+Everything here can be changed between (or during) main loop iterations.
+"""
+
+# Pin name -> level driven onto a digital input (True == high). Unset inputs float to their pull.
+pin_levels: dict[str, bool] = {}
+# Pin name -> level last written to a digital output
+output_levels: dict[str, bool] = {}
+# Pin name -> ADC reading (0-65535). Unset inputs read mid-scale.
+adc_values: dict[str, int] = {}
+# Shift register chain data pin name -> level of each input on the chain. Unset inputs read high.
+shift_register_levels: dict[str, list[bool]] = {}
+# Encoder (A pin name) -> position
+encoder_positions: dict[str, int] = {}
+
+ADC_CENTRE = 32768
+
+def pin_name(pin) -> str:
+    """
+    The name of a Pin, resolving board aliases (e.g. 'A0' is 'GP26')
+    """
+    if isinstance(pin, str):
+        import board
+        pin = getattr(board, pin)
+    return pin.name
+
+def set_pin(pin, level: bool):
+    pin_levels[pin_name(pin)] = level
+
+def release_pin(pin):
+    """
+    Stop driving a digital input, so it floats to its pull again
+    """
+    pin_levels.pop(pin_name(pin), None)
+
+def set_adc(pin, value: int):
+    if not 0 <= value <= 65535:
+        raise ValueError('ADC value must be in range 0 to 65535')
+    adc_values[pin_name(pin)] = value
+
+def set_shift_register_input(data_pin, index: int, level: bool):
+    levels = shift_register_levels.setdefault(pin_name(data_pin), [])
+    while len(levels) <= index:
+        levels.append(True)
+    levels[index] = level
+
+def turn_encoder(pin_a, steps: int):
+    """
+    Turn an encoder by a number of detents, -ve for anti-clockwise
+    """
+    name = pin_name(pin_a)
+    encoder_positions[name] = encoder_positions.get(name, 0) + steps
+
+def reset():
+    pin_levels.clear()
+    output_levels.clear()
+    adc_values.clear()
+    shift_register_levels.clear()
+    encoder_positions.clear()
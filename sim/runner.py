@@ -0,0 +1,199 @@
+"""
+Run the firmware main loop (app.py) under CPython with the fake hardware in sim/fakes.
+
+    python -m sim.runner [-n ITERATIONS] [--script FILE] [--send LINE] [--pin NAME=LEVEL]
+                         [--adc NAME=VALUE] [--reports]
+
+A script is a text file of timed actions, one per line ('#' starts a comment):
+
+    <iteration> send <serial line>          write a line to the data CDC serial
+    <iteration> pin <name> <0|1|float>      drive (or stop driving) a digital input
+    <iteration> adc <name> <0-65535>        set an ADC reading
+    <iteration> sr <data pin> <input> <0|1> set a shift register input
+    <iteration> enc <A pin> <steps>         turn a rotary encoder
+
+Actions are applied just before their main loop iteration starts (iterations count from 0).
+
+The firmware modules keep their state in module globals, so only one Simulator can be
+created per process.
+"""
+
+import os
+import runpy
+import sys
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+FIRMWARE_DIR = os.path.dirname(SIM_DIR)
+FAKES_DIR = os.path.join(SIM_DIR, 'fakes')
+
+class Simulator:
+    """
+    The firmware running on the simulated hardware. Construction runs boot.py & app.setup().
+    config overrides settings in config.py, e.g. { 'BUTTON_INPUT_BACKEND': 'keypad' }.
+    """
+
+    def __init__(self, tick_ns: int = 1_000, pins: dict = None, adcs: dict = None, config: dict = None):
+        if 'app' in sys.modules:
+            raise RuntimeError('Only one Simulator can be created per process')
+        # The fakes must shadow any real modules, & the firmware modules must be found as on the board
+        for path in (FIRMWARE_DIR, FAKES_DIR):
+            if path in sys.path:
+                sys.path.remove(path)
+        sys.path[0:0] = [FAKES_DIR, FIRMWARE_DIR]
+        from sim import clock, hardware
+        clock.install(tick=tick_ns)
+        self.clock = clock
+        self.hardware = hardware
+        # Inputs held at power up
+        for name in pins or {}:
+            self.set_pin(name, pins[name])
+        for name in adcs or {}:
+            hardware.set_adc(name, adcs[name])
+        if None != config:
+            import config as firmware_config
+            for name in config:
+                setattr(firmware_config, name, config[name])
+        # Files like the recording file are relative to the CIRCUITPY root
+        os.chdir(FIRMWARE_DIR)
+        runpy.run_path(os.path.join(FIRMWARE_DIR, 'boot.py'), run_name='boot')
+        import usb_cdc
+        import usb_hid
+        self.usb_cdc = usb_cdc
+        self.usb_hid = usb_hid
+        import app
+        self.app = app
+        self.iterations = 0
+        # Scripted actions: iteration -> list of (action, args)
+        self.actions: dict[int, list] = {}
+        app.setup()
+
+    def set_pin(self, name: str, level):
+        """
+        Drive a digital input high (True) or low (False), or stop driving it (None)
+        """
+        if None == level:
+            self.hardware.release_pin(name)
+        else:
+            self.hardware.set_pin(name, level)
+
+    def send(self, line: str):
+        """
+        Write a line to the data CDC serial, as the host would
+        """
+        self.usb_cdc.data.host_write(line.encode('utf-8') + b'\r\n')
+
+    def send_bytes(self, data: bytes):
+        self.usb_cdc.data.host_write(data)
+
+    def read_lines(self) -> list[str]:
+        """
+        The lines written to the data CDC serial since the last call
+        """
+        data = self.usb_cdc.data.host_read()
+        return [line for line in str(data, 'utf-8').split('\r\n') if len(line) > 0]
+
+    def reports(self, device: int = 0) -> list:
+        """
+        The (monotonic_ns, report ID, report bytes) of each report sent to a HID device:
+        0 is the gamepad, 1 consumer control (see boot.py)
+        """
+        return self.usb_hid.devices[device].reports
+
+    def at(self, iteration: int, action: str, *args):
+        """
+        Schedule a script action (see the module docstring) before a main loop iteration
+        """
+        self.actions.setdefault(iteration, []).append((action, args))
+
+    def load_script(self, path: str):
+        with open(path) as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.split('#', 1)[0].strip()
+                if 0 == len(line):
+                    continue
+                parts = line.split(None, 2)
+                if len(parts) < 3:
+                    raise ValueError(f'{path}:{line_no}: expected <iteration> <action> <args>')
+                args = (parts[2],) if 'send' == parts[1] else tuple(parts[2].split())
+                self.at(int(parts[0]), parts[1], *args)
+
+    def apply(self, action: str, args: tuple):
+        if 'send' == action:
+            self.send(args[0])
+        elif 'pin' == action:
+            self.set_pin(args[0], None if 'float' == args[1] else args[1] != '0')
+        elif 'adc' == action:
+            self.hardware.set_adc(args[0], int(args[1]))
+        elif 'sr' == action:
+            self.hardware.set_shift_register_input(args[0], int(args[1]), args[2] != '0')
+        elif 'enc' == action:
+            self.hardware.turn_encoder(args[0], int(args[1]))
+        else:
+            raise ValueError(f'Unknown script action: {action}')
+
+    def step(self):
+        """
+        Run one main loop iteration, after applying any script actions due
+        """
+        for action, args in self.actions.pop(self.iterations, ()):
+            self.apply(action, args)
+        self.app.loop()
+        self.iterations += 1
+
+    def run(self, iterations: int):
+        for _ in range(iterations):
+            self.step()
+
+def format_report(start_ns: int, report: tuple) -> str:
+    t_ns, report_id, data = report
+    return f'{(t_ns - start_ns) / 1_000_000:12.3f} ms  id={report_id}  {data.hex()}'
+
+def parse_assignment(arg: str) -> (str, str):
+    name, sep, value = arg.partition('=')
+    if not sep:
+        raise ValueError(f'Expected NAME=VALUE: {arg}')
+    return name, value
+
+def main(argv: list = None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m sim.runner', description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--iterations', type=int, default=1000, help='main loop iterations to run')
+    parser.add_argument('--script', help='file of timed actions, see above')
+    parser.add_argument('--send', action='append', default=[], help='serial line to send before the first iteration')
+    parser.add_argument('--pin', action='append', default=[], help='digital input level at power up, e.g. GP4=0')
+    parser.add_argument('--adc', action='append', default=[], help='ADC reading at power up, e.g. A0=65535')
+    parser.add_argument('--tick-ns', type=int, default=1_000, help='virtual time taken by each clock read')
+    parser.add_argument('--reports', action='store_true', help='list every HID report sent')
+    args = parser.parse_args(argv)
+
+    pins = {}
+    for arg in args.pin:
+        name, value = parse_assignment(arg)
+        pins[name] = value != '0'
+    adcs = {}
+    for arg in args.adc:
+        name, value = parse_assignment(arg)
+        adcs[name] = int(value)
+    sim = Simulator(tick_ns=args.tick_ns, pins=pins, adcs=adcs)
+    if None != args.script:
+        sim.load_script(args.script)
+    for line in args.send:
+        sim.at(0, 'send', line)
+    start_ns = sim.clock.peek_ns()
+    sim.run(args.iterations)
+    elapsed_ns = sim.clock.peek_ns() - start_ns
+
+    for line in sim.read_lines():
+        print(f'serial: {line}')
+    for i, name in enumerate(('gamepad', 'consumer control')):
+        reports = sim.reports(i)
+        if args.reports:
+            for report in reports:
+                print(f'{name}: {format_report(start_ns, report)}')
+        print(f'{name}: {len(reports)} reports')
+    import looprate
+    print(f'{sim.iterations} iterations in {elapsed_ns / 1_000_000:.3f} ms simulated time')
+    print(f'loop: {looprate.format_stats()}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Simulator tests of the 'keypad' button backend.
+
+    python -m pytest sim
+
+The firmware keeps its state in module globals, so all tests in a process share one Simulator.
+"""
+
+import pytest
+
+from sim.runner import Simulator
+
+# BUTTON_START (button 9) is on GP2 & BUTTON_SOUTH_B (button 1) on GP4, see config.py
+HELD_PIN = 'GP4'
+HELD_BUTTON = 1
+
+@pytest.fixture(scope='module')
+def sim():
+    return Simulator(config={ 'BUTTON_INPUT_BACKEND': 'keypad' })
+
+def is_pressed(report: bytes, button: int) -> bool:
+    return 0 != report[button // 8] & (1 << (button % 8))
+
+def test_held_button_survives_unrelated_mapping_changes(sim):
+    import inputs
+    assert inputs.use_keypad
+    sim.set_pin(HELD_PIN, False)
+    sim.run(20)
+    assert is_pressed(sim.reports(0)[-1][2], HELD_BUTTON)
+    start = len(sim.reports(0))
+    # Remap another pin (same set of scanned pins), unmap pins (a new keypad.Keys),
+    # then restore the default mappings (another new keypad.Keys)
+    for line in ('d7=12', 'rot_x=d6,d7,12,13', 'profile=default'):
+        sim.send(line)
+        sim.run(30)
+    for ns, report_id, report in sim.reports(0)[start:]:
+        assert is_pressed(report, HELD_BUTTON), f'button {HELD_BUTTON} released at {ns} ns'
+    sim.set_pin(HELD_PIN, None)
+    sim.run(30)
+    assert not is_pressed(sim.reports(0)[-1][2], HELD_BUTTON)
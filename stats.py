@@ -0,0 +1,87 @@
+"""
+Always-on instrumentation counters, read with the 'stats' serial command.
+
+The hot paths increment these module globals directly (e.g. stats.hid_sent += 1),
+which costs little more than a global lookup. Main loop timing statistics are kept
+by looprate.py and reported alongside.
+
+The heap is only sampled once per looprate statistics window (see sample_heap()),
+since gc.mem_free() & gc.mem_alloc() walk the whole heap on CircuitPython.
+"""
+
+import gc
+
+# gc.mem_free() & gc.mem_alloc() are CircuitPython/MicroPython only
+mem_free = getattr(gc, 'mem_free', None)
+mem_alloc = getattr(gc, 'mem_alloc', None)
+
+# Gamepad HID reports sent, suppressed as unchanged since the last report, and failed to send
+hid_sent = 0
+hid_suppressed = 0
+hid_errors = 0
+# Consumer control HID reports sent
+cc_sent = 0
+# Serial: bytes read, text lines & binary frames received, commands processed & rejected
+serial_bytes = 0
+serial_lines = 0
+serial_frames = 0
+serial_commands = 0
+serial_rejected = 0
+# Stream frames applied, dropped as stale or out of order, and streams ended by the watchdog
+stream_frames = 0
+stream_dropped = 0
+stream_timeouts = 0
+# Input mappings added or removed (remapping an input counts both)
+mapping_changes = 0
+# Garbage collections seen, free heap at the last sample & lowest free heap sampled (-1 if unknown)
+gc_runs = 0
+heap_free = -1
+heap_min_free = -1
+# Allocated heap at the last sample
+last_heap_alloc = 0
+
+def reset():
+    global hid_sent, hid_suppressed, hid_errors, cc_sent
+    global serial_bytes, serial_lines, serial_frames, serial_commands, serial_rejected
+    global stream_frames, stream_dropped, stream_timeouts, mapping_changes, gc_runs, heap_min_free
+    hid_sent = 0
+    hid_suppressed = 0
+    hid_errors = 0
+    cc_sent = 0
+    serial_bytes = 0
+    serial_lines = 0
+    serial_frames = 0
+    serial_commands = 0
+    serial_rejected = 0
+    stream_frames = 0
+    stream_dropped = 0
+    stream_timeouts = 0
+    mapping_changes = 0
+    gc_runs = 0
+    heap_min_free = heap_free
+
+def sample_heap():
+    """
+    Sample the heap. A collection is counted when the allocated heap has shrunk since the
+    last sample, so gc_runs is a lower bound: several collections between samples count once.
+    """
+    global gc_runs, heap_free, heap_min_free, last_heap_alloc
+    if None == mem_free:
+        return
+    heap_alloc = mem_alloc()
+    if heap_alloc < last_heap_alloc:
+        gc_runs += 1
+    last_heap_alloc = heap_alloc
+    heap_free = mem_free()
+    if heap_free < heap_min_free or heap_min_free < 0:
+        heap_min_free = heap_free
+
+def format_stats() -> str:
+    """
+    Single line summary of the counters
+    """
+    return (f'hid_sent={hid_sent} hid_supp={hid_suppressed} hid_err={hid_errors} cc_sent={cc_sent} '
+            f'ser_bytes={serial_bytes} ser_lines={serial_lines} ser_frames={serial_frames} '
+            f'ser_cmds={serial_commands} ser_rej={serial_rejected} '
+            f'stream={stream_frames} stream_drop={stream_dropped} stream_tmo={stream_timeouts} maps={mapping_changes} '
+            f'gc={gc_runs} heap_free={heap_free} heap_min={heap_min_free}')
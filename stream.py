@@ -0,0 +1,143 @@
+"""
+Continuous input streaming, e.g. for steering or light-gun style analog control from the host.
+
+Other commands press their inputs, hold them & then release them again (see scheduler.py),
+so the joysticks snap back to centre between commands. Stream frames instead update the
+streamed input state in place, where it stays until a later frame changes it.
+Frames carry a 16 bit sequence number which wraps around. A frame whose sequence number is
+not after that of the last applied frame (i.e. a stale, duplicate or out-of-order frame) is dropped.
+
+Text stream frames are command lines containing a 'seq' key, e.g. 'seq=41;x=-12000;dy=250;btn3=1', with:
+
+    seq={N}         sequence number, 0 to 65535
+    btn{N}={0|1}    release or press button N
+    x, y, z, r_z    set a joystick axis
+    dx, dy, dz, dr_z  move a joystick axis by a (+ve or -ve) amount
+    ping={seq}      latency probe (see latency.py)
+
+Binary stream frames are the OP_STREAM (whole state) & OP_STREAM_DELTA opcodes (see protocol.py).
+
+All the frames processed in a main loop iteration are coalesced, so at most one report per
+player is sent for them. If no frame is applied for STREAM_TIMEOUT_MS the watchdog releases the
+streamed buttons & centres the streamed axes, handing them back to the physical inputs,
+and the next frame may start from any sequence number. 'stream_end' does the same straight away.
+"""
+
+from time import monotonic_ns
+
+from globals import streamed_buttons, streamed_axes
+from config import STREAM_TIMEOUT_MS
+import latency
+import scheduler
+import stats
+from utils import clamp
+
+AXES = ('x', 'y', 'z', 'r_z')
+DELTA_AXES = { 'dx': 'x', 'dy': 'y', 'dz': 'z', 'dr_z': 'r_z' }
+
+# Set while frames are arriving, cleared by the watchdog or stream_end
+active = False
+# Sequence number of the last applied frame
+last_seq = 0
+# Time the last frame was applied
+last_ns = 0
+# Set when the streamed state has changed since it was last applied to the injected inputs
+changed = False
+
+def accept(seq: int) -> bool:
+    """
+    Check a frame's sequence number, returning False if it should be dropped
+    """
+    global active, last_seq, last_ns, changed
+    seq &= 0xFFFF
+    if active and not 0 < (seq - last_seq) & 0xFFFF < 0x8000:
+        stats.stream_dropped += 1
+        return False
+    active = True
+    last_seq = seq
+    last_ns = monotonic_ns()
+    changed = True
+    stats.stream_frames += 1
+    return True
+
+def move_axis(axis: str, delta: int):
+    streamed_axes[axis] = clamp(streamed_axes.get(axis, 0) + delta, -32767, 32767)
+
+def process_text_frame(cmds: dict) -> bool:
+    """
+    Apply a decoded text stream frame. Returns False if it was rejected or dropped.
+    """
+    try:
+        seq = int(cmds['seq'])
+    except ValueError as ve:
+        print(f'Error reading stream frame sequence number: {ve}')
+        return False
+    if not accept(seq):
+        return False
+    for input, value in cmds.items():
+        try:
+            if len(input) > 3 and input[0:3] == 'btn':
+                streamed_buttons.set(int(input[3:]), int(value) != 0)
+            elif input in AXES:
+                streamed_axes[input] = clamp(int(value), -32767, 32767)
+            elif input in DELTA_AXES:
+                move_axis(DELTA_AXES[input], int(value))
+            elif input == 'ping':
+                latency.ping(int(value))
+            elif input != 'seq':
+                print(f'Ignoring {input} in stream frame')
+        except ValueError as ve:
+            print(f'Error reading stream frame ({input}={value}): {ve}')
+    return True
+
+def process_state_frame(seq: int, buttons: int, x: int, y: int, z: int, r_z: int) -> bool:
+    """
+    Apply a binary OP_STREAM frame, which replaces the streamed gamepad buttons & all the axes.
+    Returns False if it was dropped.
+    """
+    if not accept(seq):
+        return False
+    streamed_buttons.gamepad = buttons
+    streamed_axes['x'] = clamp(x, -32767, 32767)
+    streamed_axes['y'] = clamp(y, -32767, 32767)
+    streamed_axes['z'] = clamp(z, -32767, 32767)
+    streamed_axes['r_z'] = clamp(r_z, -32767, 32767)
+    return True
+
+def process_delta_frame(seq: int, press: int, release: int, dx: int, dy: int, dz: int, dr_z: int) -> bool:
+    """
+    Apply a binary OP_STREAM_DELTA frame, which presses & releases gamepad buttons & moves the axes.
+    Returns False if it was dropped.
+    """
+    if not accept(seq):
+        return False
+    streamed_buttons.gamepad = (streamed_buttons.gamepad | press) & ~release
+    move_axis('x', dx)
+    move_axis('y', dy)
+    move_axis('z', dz)
+    move_axis('r_z', dr_z)
+    return True
+
+def end():
+    """
+    Release & centre the streamed inputs and accept any sequence number next
+    """
+    global active, changed
+    active = False
+    streamed_buttons.clear()
+    streamed_axes.clear()
+    changed = True
+
+def service():
+    """
+    Apply the streamed state changed by this iteration's frames to the injected inputs,
+    or end the stream if it has stopped. Call once per main loop iteration before report().
+    """
+    global changed
+    if active and monotonic_ns() - last_ns > STREAM_TIMEOUT_MS * 1_000_000:
+        print('Stream timed out')
+        stats.stream_timeouts += 1
+        end()
+    if changed:
+        changed = False
+        scheduler.apply_active_commands()
@@ -0,0 +1,262 @@
+"""
+Host-side end-to-end latency probe for the gamepad.
+
+Sends paced 'ping={seq}' probes (see latency.py) that also press a button, matches each with
+the board's reply and (optionally) with the HID report the host receives, then reports the
+p50/p99/max of:
+
+    rtt         host write -> reply read on the host           (host clock)
+    rx_parse    bytes read -> command decoded                  (board clock)
+    parse_report command decoded -> gamepad report sent        (board clock)
+    rx_report   bytes read -> gamepad report sent              (board clock)
+    e2e         host write -> HID report received by the host  (host clock, needs --hid or --sim)
+
+Against a board, over the data CDC serial port (needs pyserial, and hidapi for --hid):
+
+    python tools/latency_probe.py --port /dev/ttyACM1 --hid 239a:80f4 -n 1000
+
+Against the host-side simulator (see sim/), where the host & board share the virtual clock:
+
+    python tools/latency_probe.py --sim -n 1000
+
+The simulator only returns to the host between main loop iterations, so there rtt includes the
+rest of the iteration, including its wait for the loop rate.
+
+Run it as a script (not with -m from the repository root), so that 'import serial' finds pyserial
+rather than the firmware's serial.py.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+# Gamepad report ID of player 1, see boot.py
+GAMEPAD_REPORT_ID = 4
+
+def percentile(values: list, pct: float) -> float:
+    """
+    Nearest-rank percentile of a sorted list
+    """
+    if 0 == len(values):
+        return float('nan')
+    rank = max(1, int(len(values) * pct / 100 + 0.999999))
+    return values[min(rank, len(values)) - 1]
+
+def parse_reply(line: str) -> dict:
+    """
+    Parse 'ping={seq} rx_ns={rx} parse_ns={parse} report_ns={report}' into a dict of ints
+    """
+    fields = {}
+    for item in line.split():
+        name, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f'Malformed reply: {line}')
+        fields[name] = int(value)
+    return fields
+
+def is_pressed(report: bytes, button: int) -> bool:
+    """
+    Whether a button is pressed in a gamepad report (without its report ID byte)
+    """
+    return 0 != report[button // 8] & (1 << (button % 8))
+
+class SerialTransport:
+    """
+    A board on a serial port, with its HID reports optionally read through hidapi
+    """
+
+    def __init__(self, port: str, hid_id: str, button: int):
+        import serial
+        self._serial = serial.Serial(port, timeout=0)
+        self._serial.reset_input_buffer()
+        self._rx = bytearray()
+        self._button = button
+        # Host times the probe button was seen pressed in a HID report
+        self._presses = []
+        self._lock = threading.Lock()
+        if None != hid_id:
+            import hid
+            vid, pid = (int(part, 16) for part in hid_id.split(':'))
+            self._hid = hid.device()
+            self._hid.open(vid, pid)
+            threading.Thread(target=self._read_hid, daemon=True).start()
+
+    def now_ns(self) -> int:
+        return time.perf_counter_ns()
+
+    def write(self, line: str):
+        self._serial.write(line.encode('utf-8') + b'\r\n')
+        self._serial.flush()
+
+    def _read_hid(self):
+        pressed = False
+        while True:
+            report = self._hid.read(64, 100)
+            now = time.perf_counter_ns()
+            if len(report) < 2 or GAMEPAD_REPORT_ID != report[0]:
+                continue
+            pressed_now = is_pressed(bytes(report[1:]), self._button)
+            if pressed_now and not pressed:
+                with self._lock:
+                    self._presses.append(now)
+            pressed = pressed_now
+
+    def read_line(self, timeout_ns: int) -> (str, int):
+        """
+        The next line from the board & the host time it was read, or (None, 0) on timeout
+        """
+        deadline = time.perf_counter_ns() + timeout_ns
+        while True:
+            eol = self._rx.find(b'\n')
+            if eol >= 0:
+                line = str(self._rx[:eol], 'utf-8').strip()
+                del self._rx[:eol + 1]
+                return line, time.perf_counter_ns()
+            if time.perf_counter_ns() >= deadline:
+                return None, 0
+            self._rx.extend(self._serial.read(256))
+
+    def hid_press_after(self, t_ns: int) -> int:
+        """
+        Host time of the first press of the probe button seen at or after t_ns, or 0
+        """
+        with self._lock:
+            for press in self._presses:
+                if press >= t_ns:
+                    return press
+        return 0
+
+    def has_hid(self) -> bool:
+        return hasattr(self, '_hid')
+
+    def wait_until(self, t_ns: int):
+        remaining = t_ns - time.perf_counter_ns()
+        if remaining > 0:
+            time.sleep(remaining / 1_000_000_000)
+
+class SimTransport:
+    """
+    The firmware running in the host-side simulator. Time is the simulator's virtual clock.
+    """
+
+    def __init__(self, button: int):
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from sim.runner import Simulator
+        # Keep the firmware's console output out of the report
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            self._sim = Simulator()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        self._button = button
+        self._lines = []
+
+    def now_ns(self) -> int:
+        return self._sim.clock.peek_ns()
+
+    def write(self, line: str):
+        self._sim.send(line)
+
+    def _step(self):
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            self._sim.step()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    def read_line(self, timeout_ns: int) -> (str, int):
+        deadline = self.now_ns() + timeout_ns
+        while 0 == len(self._lines):
+            if self.now_ns() >= deadline:
+                return None, 0
+            self._step()
+            self._lines.extend(self._sim.read_lines())
+        return self._lines.pop(0), self.now_ns()
+
+    def hid_press_after(self, t_ns: int) -> int:
+        for report_ns, report_id, report in self._sim.reports(0):
+            if report_ns >= t_ns and GAMEPAD_REPORT_ID == report_id and is_pressed(report, self._button):
+                return report_ns
+        return 0
+
+    def has_hid(self) -> bool:
+        return True
+
+    def wait_until(self, t_ns: int):
+        while self.now_ns() < t_ns:
+            self._step()
+
+def run(transport, count: int, interval_ns: int, command: str) -> (dict, int):
+    """
+    Send count probes, one every interval_ns. Returns the latencies in ns by name, & the number of probes lost.
+    """
+    latencies = { 'rtt': [], 'rx_parse': [], 'parse_report': [], 'rx_report': [], 'e2e': [] }
+    lost = 0
+    next_ns = transport.now_ns()
+    for seq in range(count):
+        transport.wait_until(next_ns)
+        sent_ns = transport.now_ns()
+        transport.write(f'ping={seq};{command}')
+        next_ns = sent_ns + interval_ns
+        reply = None
+        while None == reply:
+            line, read_ns = transport.read_line(max(0, next_ns - transport.now_ns()))
+            if None == line:
+                break
+            if line.startswith(f'ping={seq} '):
+                reply = parse_reply(line)
+        if None == reply:
+            lost += 1
+            continue
+        latencies['rtt'].append(read_ns - sent_ns)
+        latencies['rx_parse'].append(reply['parse_ns'] - reply['rx_ns'])
+        if 0 != reply['report_ns']:
+            latencies['parse_report'].append(reply['report_ns'] - reply['parse_ns'])
+            latencies['rx_report'].append(reply['report_ns'] - reply['rx_ns'])
+        if transport.has_hid():
+            # The HID report may arrive after the reply, so give it until the next probe is due
+            transport.wait_until(next_ns - interval_ns // 10)
+            press_ns = transport.hid_press_after(sent_ns)
+            if 0 != press_ns:
+                latencies['e2e'].append(press_ns - sent_ns)
+    return latencies, lost
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--port', help='data CDC serial port of the board, e.g. /dev/ttyACM1 or COM4')
+    target.add_argument('--sim', action='store_true', help='probe the host-side simulator instead of a board')
+    parser.add_argument('--hid', metavar='VID:PID', help='also read the HID reports of the board (hex USB IDs)')
+    parser.add_argument('-n', '--count', type=int, default=500, help='number of probes (default %(default)s)')
+    parser.add_argument('--interval', type=float, default=0.1, help='seconds between probes (default %(default)s)')
+    parser.add_argument('--button', type=int, default=11,
+                        help='button ID each probe presses (default %(default)s, BUTTON_THUMB_R)')
+    args = parser.parse_args(argv)
+
+    # Press the button straight away (not after earlier commands), for less than the interval
+    hold = min(0.02, args.interval / 4)
+    command = f'btn{args.button}=1;hold={hold};post=0;overlap=1'
+    if args.sim:
+        transport = SimTransport(args.button)
+    else:
+        transport = SerialTransport(args.port, args.hid, args.button)
+    latencies, lost = run(transport, args.count, int(args.interval * 1_000_000_000), command)
+
+    print(f'{args.count} probes, {lost} lost')
+    print(f'{"":14}{"count":>8}{"p50 us":>12}{"p99 us":>12}{"max us":>12}')
+    for name in latencies:
+        values = sorted(latencies[name])
+        if 0 == len(values):
+            continue
+        print(f'{name:14}{len(values):>8}{percentile(values, 50) / 1000:>12.1f}'
+              f'{percentile(values, 99) / 1000:>12.1f}{values[-1] / 1000:>12.1f}')
+    return 0 if 0 == lost else 1
+
+if __name__ == '__main__':
+    sys.exit(main())